@@ -1,12 +1,22 @@
 from .config import resolve_config_dir, session_exists
+from .metrics import PROMETHEUS_CONTENT_TYPE, render_metrics
+from .tracing import JsonFileSpanExporter, SpanExporter, set_span_exporter
 from .runner import AgentResult, DEFAULT_MODEL, DEFAULT_TIMEOUT, run_copilot_agent, run_copilot_agent_stream
+from .usage import QuotaExceededError, resolve_caller
 
 __all__ = [
     "AgentResult",
     "DEFAULT_MODEL",
     "DEFAULT_TIMEOUT",
+    "JsonFileSpanExporter",
+    "PROMETHEUS_CONTENT_TYPE",
+    "QuotaExceededError",
+    "SpanExporter",
+    "render_metrics",
+    "resolve_caller",
     "resolve_config_dir",
     "run_copilot_agent",
     "run_copilot_agent_stream",
     "session_exists",
+    "set_span_exporter",
 ]
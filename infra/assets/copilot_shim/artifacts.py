@@ -0,0 +1,234 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from .config import resolve_config_dir
+from .metrics import REGISTRY
+from .serialization import dumps_bytes
+
+# Tool payloads larger than this (serialized bytes) are stored and replaced by a reference; 0 disables
+_ARTIFACT_THRESHOLD_BYTES = int(os.environ.get("COPILOT_ARTIFACT_THRESHOLD_BYTES", "65536"))
+_ARTIFACT_TTL_SECONDS = float(os.environ.get("COPILOT_ARTIFACT_TTL_SECONDS", "3600"))
+_ARTIFACT_PREVIEW_CHARS = int(os.environ.get("COPILOT_ARTIFACT_PREVIEW_CHARS", "256"))
+# Expired artifacts are swept this often by a background thread
+_CLEANUP_INTERVAL_SECONDS = 60.0
+
+ARTIFACT_ROUTE = "/agent/artifacts"
+_MEDIA_TYPES = {".json": "application/json", ".txt": "text/plain; charset=utf-8"}
+_HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+_ARTIFACTS_SPILLED = REGISTRY.counter(
+    "copilot_shim_artifacts_spilled_total", "Tool payloads moved to the artifact store, by kind.", ("kind",)
+)
+_ARTIFACT_BYTES = REGISTRY.counter(
+    "copilot_shim_artifact_bytes_total", "Bytes of tool payloads kept out of responses by the artifact store.", ("kind",)
+)
+
+
+def _default_root() -> str:
+    # Next to session state when it is on a shared share, so any instance can serve the artifact
+    explicit = os.environ.get("COPILOT_ARTIFACT_DIR")
+    if explicit:
+        return explicit
+    config_dir = resolve_config_dir()
+    if config_dir:
+        return os.path.join(config_dir, "artifacts")
+    return os.path.join(tempfile.gettempdir(), "copilot-artifacts")
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range "Range: bytes=..." header into an inclusive (start, end).
+
+    Returns None when there is no usable Range header (serve the whole body)
+    and raises ValueError when the range cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = _RANGE_PATTERN.match(header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    first, last = match.group(1), match.group(2)
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size or end < start:
+            raise ValueError(f"Range {header} not satisfiable for {size} bytes")
+    else:
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            raise ValueError(f"Range {header} not satisfiable for {size} bytes")
+        start, end = max(0, size - suffix), size - 1
+    return start, end
+
+
+class ArtifactStore:
+    """
+    Local content-addressed store for large tool payloads.
+
+    spill() leaves payloads up to `threshold` serialized bytes untouched and
+    writes larger ones to {root}/{sha256[:2]}/{sha256}.json|.txt, returning a
+    reference with the size, a short preview and the URL of
+    GET /agent/artifacts/{hash}. Identical payloads share one file. Files not
+    spilled again within `ttl` seconds are deleted.
+
+    spill() runs in session event callbacks on the event loop, so it only
+    hashes the payload there; the file is written by a background thread and
+    expired files are swept by another. find() waits for a pending write of
+    the requested artifact.
+    """
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        threshold: int = _ARTIFACT_THRESHOLD_BYTES,
+        ttl: float = _ARTIFACT_TTL_SECONDS,
+        preview_chars: int = _ARTIFACT_PREVIEW_CHARS,
+    ):
+        self.root = root or _default_root()
+        self.threshold = threshold
+        self.ttl = ttl
+        self.preview_chars = preview_chars
+        self._pending: Dict[str, "Future[None]"] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def spill(self, payload: Any, kind: str) -> Any:
+        """Return `payload`, or a reference to it in the store when it is over the threshold."""
+        if self.threshold <= 0 or payload is None:
+            return payload
+        if isinstance(payload, str):
+            # Cheap bound before encoding: UTF-8 is at most 4 bytes per char
+            if len(payload) * 4 <= self.threshold:
+                return payload
+            data, suffix, text = payload.encode("utf-8"), ".txt", payload
+        else:
+            data, suffix, text = dumps_bytes(payload), ".json", None
+        if len(data) <= self.threshold:
+            return payload
+
+        digest = hashlib.sha256(data).hexdigest()
+        self._submit(digest, suffix, data, kind)
+        _ARTIFACTS_SPILLED.inc(kind=kind)
+        _ARTIFACT_BYTES.inc(len(data), kind=kind)
+
+        if text is None:
+            text = data[: self.preview_chars * 4].decode("utf-8", errors="ignore")
+        return {
+            "artifact": digest,
+            "size": len(data),
+            "media_type": _MEDIA_TYPES[suffix],
+            "preview": text[: self.preview_chars],
+            "url": f"{ARTIFACT_ROUTE}/{digest}",
+        }
+
+    def _submit(self, digest: str, suffix: str, data: bytes, kind: str) -> None:
+        with self._lock:
+            if digest in self._pending:
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifact-writer")
+                threading.Thread(target=self._cleanup_loop, name="artifact-cleanup", daemon=True).start()
+            future = self._executor.submit(self._write, digest, suffix, data)
+            self._pending[digest] = future
+
+        def done(finished: "Future[None]") -> None:
+            with self._lock:
+                self._pending.pop(digest, None)
+            error = finished.exception()
+            if error is not None:
+                logging.warning(f"Failed to store {kind} artifact {digest} ({len(data)} bytes): {error}")
+
+        future.add_done_callback(done)
+
+    def _path(self, digest: str, suffix: str) -> str:
+        return os.path.join(self.root, digest[:2], digest + suffix)
+
+    def _write(self, digest: str, suffix: str, data: bytes) -> None:
+        path = self._path(digest, suffix)
+        if os.path.exists(path):
+            # Refresh the TTL of a payload seen again
+            os.utime(path)
+            return
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, staging = tempfile.mkstemp(dir=directory, prefix=f".{digest[:8]}-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(staging, path)
+        except OSError:
+            try:
+                os.remove(staging)
+            except OSError:
+                pass
+            raise
+
+    def find(self, digest: str) -> Optional[Tuple[str, str]]:
+        """(path, media type) of a stored artifact, or None for unknown or malformed hashes."""
+        if not _HASH_PATTERN.match(digest or ""):
+            return None
+        with self._lock:
+            pending = self._pending.get(digest)
+        if pending is not None:
+            try:
+                pending.result()
+            except OSError:
+                return None
+        for suffix, media_type in _MEDIA_TYPES.items():
+            path = self._path(digest, suffix)
+            if os.path.isfile(path):
+                return path, media_type
+        return None
+
+    def read(self, path: str, byte_range: Optional[Tuple[int, int]] = None) -> bytes:
+        with open(path, "rb") as f:
+            if byte_range is None:
+                return f.read()
+            start, end = byte_range
+            f.seek(start)
+            return f.read(end - start + 1)
+
+    def _cleanup_loop(self) -> None:
+        while True:
+            time.sleep(_CLEANUP_INTERVAL_SECONDS)
+            try:
+                self.cleanup()
+            except Exception as e:
+                logging.warning(f"Artifact cleanup failed: {e}")
+
+    def cleanup(self) -> int:
+        """Delete artifacts older than the TTL; returns how many were removed."""
+        cutoff = time.time() - self.ttl
+        removed = 0
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    continue
+        if removed:
+            logging.info(f"Removed {removed} expired artifact(s) from {self.root}")
+        return removed
+
+
+def artifact_headers(digest: str) -> Dict[str, str]:
+    return {
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{digest}"',
+        # Content-addressed: the bytes behind a hash never change
+        "Cache-Control": "private, max-age=31536000, immutable",
+    }
+
+
+ARTIFACT_STORE = ArtifactStore()
@@ -1,72 +1,172 @@
 import asyncio
 import logging
 import os
-from typing import Optional
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
 
 from copilot import CopilotClient
 
 from .cli_path import get_copilot_cli_path
+from .metrics import REGISTRY
+from .providers import PROVIDER_POOL
+from .supervisor import CliSupervisor
+
+_DRAIN_TIMEOUT_SECONDS = float(os.environ.get("COPILOT_CLI_DRAIN_TIMEOUT_SECONDS", "300"))
+
+_CLI_INFLIGHT_TURNS = REGISTRY.gauge(
+    "copilot_shim_cli_inflight_turns", "Turns holding a lease on a Copilot CLI client, by client generation.", ("generation",)
+)
+_CLI_GENERATION = REGISTRY.gauge("copilot_shim_cli_generation", "Generation of the current Copilot CLI client (bumped on recycle).")
 
 
 def _is_byok_mode() -> bool:
-    """Check if BYO key (Microsoft Foundry) environment variables are configured."""
-    return bool(
-        os.environ.get("AZURE_AI_FOUNDRY_ENDPOINT")
-        and os.environ.get("AZURE_AI_FOUNDRY_API_KEY")
-    )
+    """Check if BYO key (Microsoft Foundry) endpoints are configured (see providers.py)."""
+    return bool(PROVIDER_POOL)
+
+
+class _ClientLeases:
+    """In-flight turn count for one client generation, so a retired client can drain."""
+
+    def __init__(self, generation: int):
+        self.generation = generation
+        self.count = 0
+        self.drained = asyncio.Event()
+        self.drained.set()
+
+    def acquire(self) -> None:
+        self.count += 1
+        self.drained.clear()
+        _CLI_INFLIGHT_TURNS.set(self.count, generation=str(self.generation))
+
+    def release(self) -> None:
+        self.count -= 1
+        _CLI_INFLIGHT_TURNS.set(self.count, generation=str(self.generation))
+        if self.count <= 0:
+            self.drained.set()
 
 
 class CopilotClientManager:
     """
     Singleton manager for the CopilotClient.
+
+    Turns hold a lease on the client for their whole duration. recycle() swaps
+    in a new client for new turns, waits for leases on the old one to drain,
+    then stops it; CliSupervisor calls it when the CLI process grows unhealthy.
     """
 
     _instance: Optional["CopilotClientManager"] = None
     _client: Optional[CopilotClient] = None
     _lock: asyncio.Lock = None
     _started: bool = False
+    _generation: int = 0
+    _leases: Dict[int, _ClientLeases] = {}
+    _supervisor: Optional[CliSupervisor] = None
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             cls._lock = asyncio.Lock()
+            cls._leases = {}
+            cls._supervisor = CliSupervisor(cls._current_pid, cls.recycle)
         return cls._instance
 
+    @staticmethod
+    def _new_client() -> CopilotClient:
+        cli_path = get_copilot_cli_path()
+
+        if _is_byok_mode():
+            logging.info("BYOK mode: using Microsoft Foundry (no GitHub token)")
+            return CopilotClient(
+                {
+                    "cli_path": cli_path,
+                }  # type: ignore
+            )
+
+        github_token = os.environ.get("GITHUB_TOKEN")
+        print("got github token:", github_token is not None)
+        return CopilotClient(
+            {
+                "cli_path": cli_path,
+                "github_token": github_token,
+            }  # type: ignore
+        )
+
     @classmethod
     async def get_client(cls) -> CopilotClient:
         manager = cls()
         async with manager._lock:
             if manager._client is None or not manager._started:
-                cli_path = get_copilot_cli_path()
-
-                if _is_byok_mode():
-                    logging.info("BYOK mode: using Microsoft Foundry (no GitHub token)")
-                    manager._client = CopilotClient(
-                        {
-                            "cli_path": cli_path,
-                        }  # type: ignore
-                    )
-                else:
-                    github_token = os.environ.get("GITHUB_TOKEN")
-                    print("got github token:", github_token is not None)
-                    manager._client = CopilotClient(
-                        {
-                            "cli_path": cli_path,
-                            "github_token": github_token,
-                        }  # type: ignore
-                    )
-
+                manager._client = cls._new_client()
                 await manager._client.start()
                 manager._started = True
-                logging.info(f"CopilotClient singleton started (CLI: {cli_path}, BYOK: {_is_byok_mode()})")
+                manager._generation += 1
+                manager._leases[id(manager._client)] = _ClientLeases(manager._generation)
+                _CLI_GENERATION.set(manager._generation)
+                logging.info(
+                    f"CopilotClient singleton started (CLI: {get_copilot_cli_path()}, BYOK: {_is_byok_mode()}, "
+                    f"generation {manager._generation})"
+                )
+            manager._supervisor.ensure_started()
         return manager._client
 
+    @classmethod
+    @asynccontextmanager
+    async def lease(cls) -> AsyncIterator[CopilotClient]:
+        """Use the current client for one turn; a recycle waits for this lease before stopping it."""
+        client = await cls.get_client()
+        leases = cls()._leases.get(id(client))
+        if leases is not None:
+            leases.acquire()
+        try:
+            yield client
+        finally:
+            if leases is not None:
+                leases.release()
+
+    @classmethod
+    def _current_pid(cls) -> Optional[int]:
+        process = getattr(cls()._client, "_process", None)
+        return getattr(process, "pid", None)
+
+    @classmethod
+    async def recycle(cls, reason: str = "manual") -> None:
+        """Start a replacement client for new turns, drain the old one, then stop it."""
+        manager = cls()
+        async with manager._lock:
+            old_client = manager._client
+            if old_client is None or not manager._started:
+                return
+            new_client = cls._new_client()
+            await new_client.start()
+            manager._client = new_client
+            manager._generation += 1
+            manager._leases[id(new_client)] = _ClientLeases(manager._generation)
+            _CLI_GENERATION.set(manager._generation)
+            old_leases = manager._leases.get(id(old_client))
+            logging.warning(
+                f"Recycling Copilot CLI client ({reason}): generation {manager._generation} started, "
+                f"draining {old_leases.count if old_leases else 0} in-flight turn(s) on the old client"
+            )
+
+        try:
+            if old_leases is not None:
+                await asyncio.wait_for(old_leases.drained.wait(), timeout=_DRAIN_TIMEOUT_SECONDS)
+            await old_client.stop()
+        except asyncio.TimeoutError:
+            logging.warning(f"Old Copilot CLI client did not drain within {_DRAIN_TIMEOUT_SECONDS}s; force stopping")
+            await old_client.force_stop()
+        finally:
+            manager._leases.pop(id(old_client), None)
+        logging.info("Old Copilot CLI client stopped")
+
     @classmethod
     async def shutdown(cls):
         manager = cls()
         async with manager._lock:
+            manager._supervisor.stop()
             if manager._client and manager._started:
                 await manager._client.stop()
+                manager._leases.pop(id(manager._client), None)
                 manager._started = False
                 manager._client = None
                 logging.info("CopilotClient singleton stopped")
@@ -0,0 +1,194 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from .metrics import REGISTRY
+
+# Compact once context passes this fraction of the model's token limit...
+_COMPACTION_RATIO = float(os.environ.get("COPILOT_CONTEXT_COMPACTION_RATIO", "0.7"))
+# ...or this many tokens, whichever comes first (0 disables the absolute limit)
+_COMPACTION_TOKENS = int(os.environ.get("COPILOT_CONTEXT_COMPACTION_TOKENS", "0"))
+KEEP_RECENT_TURNS = int(os.environ.get("COPILOT_CONTEXT_KEEP_TURNS", "4"))
+SUMMARY_TIMEOUT = float(os.environ.get("COPILOT_CONTEXT_SUMMARY_TIMEOUT", "60"))
+_TRACKED_SESSIONS = int(os.environ.get("COPILOT_CONTEXT_TRACKED_SESSIONS", "1000"))
+# Rough chars-per-token used until the CLI reports real usage
+_CHARS_PER_TOKEN = 4
+
+_CONTEXT_TOKENS = REGISTRY.histogram(
+    "copilot_shim_session_context_tokens",
+    "Approximate session context size after each turn.",
+    ("route",),
+    buckets=(1000, 4000, 8000, 16000, 32000, 64000, 96000, 128000, 200000, 400000),
+)
+_COMPACTIONS = REGISTRY.counter(
+    "copilot_shim_context_compactions_total",
+    "Session history compactions (kind=shim for summarize-and-replace, sdk for CLI background compaction).",
+    ("route", "kind"),
+)
+_COMPACTION_SECONDS = REGISTRY.histogram(
+    "copilot_shim_context_compaction_seconds",
+    "Time spent compacting a session before its next turn.",
+    ("route",),
+)
+_TOKENS_REMOVED = REGISTRY.counter(
+    "copilot_shim_context_tokens_removed_total",
+    "Approximate context tokens removed by compaction.",
+    ("route", "kind"),
+)
+
+SUMMARIZER_SYSTEM_MESSAGE = (
+    "You compress conversation history. Summarize the conversation you are given so that an assistant "
+    "can continue it: keep the user's goals, decisions, facts, names, numbers, file paths and open questions. "
+    "Drop pleasantries and repetition. Reply with the summary only."
+)
+# The SDK drops an empty available_tools list, so allow a single name no tool has
+SUMMARIZER_AVAILABLE_TOOLS = ["no-tools"]
+
+
+@dataclass
+class SessionContext:
+    tokens: int = 0
+    token_limit: Optional[int] = None
+    estimated: bool = True
+    turns: int = 0
+    compactions: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class ContextTracker:
+    """
+    Approximate context size per session on this worker.
+
+    Sizes come from the CLI's session.usage_info events when present, then the
+    input token count of the last model call, then a chars/4 estimate. State is
+    per worker and bounded (least recently used sessions are forgotten), so a
+    session resumed on another instance is measured again from its next turn.
+    """
+
+    def __init__(self, max_sessions: int = _TRACKED_SESSIONS):
+        self._sessions: "OrderedDict[str, SessionContext]" = OrderedDict()
+        self._max_sessions = max_sessions
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> SessionContext:
+        with self._lock:
+            context = self._sessions.get(session_id)
+            if context is None:
+                context = SessionContext()
+                self._sessions[session_id] = context
+                while len(self._sessions) > self._max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            return context
+
+    def observe(self, session_id: str, route: Optional[str], event_type: str, data) -> None:
+        if event_type == "session.usage_info":
+            context = self.get(session_id)
+            current = getattr(data, "current_tokens", None)
+            if current is not None:
+                context.tokens = int(current)
+                context.estimated = False
+            limit = getattr(data, "token_limit", None)
+            if limit:
+                context.token_limit = int(limit)
+        elif event_type == "assistant.usage":
+            context = self.get(session_id)
+            input_tokens = getattr(data, "input_tokens", None)
+            if input_tokens and context.estimated:
+                context.tokens = max(context.tokens, int(input_tokens))
+        elif event_type == "session.compaction_complete":
+            context = self.get(session_id)
+            context.compactions += 1
+            pre = getattr(data, "pre_compaction_tokens", None)
+            post = getattr(data, "post_compaction_tokens", None)
+            if post is not None:
+                context.tokens = int(post)
+            if pre is not None and post is not None:
+                _TOKENS_REMOVED.inc(max(0, int(pre) - int(post)), route=route or "direct", kind="sdk")
+            _COMPACTIONS.inc(route=route or "direct", kind="sdk")
+
+    def turn_finished(self, session_id: str, route: Optional[str], chars: int) -> SessionContext:
+        context = self.get(session_id)
+        context.turns += 1
+        if context.estimated:
+            context.tokens += chars // _CHARS_PER_TOKEN
+        _CONTEXT_TOKENS.observe(context.tokens, route=route or "direct")
+        limit = f"/{context.token_limit}" if context.token_limit else ""
+        logging.info(
+            f"Session {session_id} context: ~{context.tokens}{limit} tokens after {context.turns} turn(s), "
+            f"{context.compactions} compaction(s)"
+        )
+        return context
+
+    def needs_compaction(self, session_id: str) -> bool:
+        with self._lock:
+            context = self._sessions.get(session_id)
+        if context is None or context.tokens == 0:
+            return False
+        if _COMPACTION_TOKENS and context.tokens >= _COMPACTION_TOKENS:
+            return True
+        return bool(context.token_limit) and context.tokens >= _COMPACTION_RATIO * context.token_limit
+
+    def compacted(self, session_id: str, route: Optional[str], new_tokens: int, seconds: float) -> None:
+        context = self.get(session_id)
+        _TOKENS_REMOVED.inc(max(0, context.tokens - new_tokens), route=route or "direct", kind="shim")
+        _COMPACTIONS.inc(route=route or "direct", kind="shim")
+        _COMPACTION_SECONDS.observe(seconds, route=route or "direct")
+        logging.info(
+            f"Compacted session {session_id}: ~{context.tokens} -> ~{new_tokens} tokens in {seconds:.2f}s"
+        )
+        context.tokens = new_tokens
+        context.estimated = True
+        context.compactions += 1
+
+
+def transcript_turns(events) -> List[Tuple[str, str]]:
+    """Extract (role, text) pairs for user and assistant messages from session history."""
+    turns: List[Tuple[str, str]] = []
+    for event in events:
+        event_type = event.type.value if hasattr(event.type, "value") else str(event.type)
+        if event_type not in ("user.message", "assistant.message"):
+            continue
+        content = getattr(event.data, "content", None)
+        if content:
+            turns.append(("user" if event_type == "user.message" else "assistant", content))
+    return turns
+
+
+def split_recent(turns: List[Tuple[str, str]], keep_user_turns: int) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+    """Split history into (older, recent) where recent starts at the Nth-last user message."""
+    user_indexes = [index for index, (role, _) in enumerate(turns) if role == "user"]
+    if len(user_indexes) <= keep_user_turns:
+        return [], turns
+    cut = user_indexes[-keep_user_turns] if keep_user_turns > 0 else len(turns)
+    return turns[:cut], turns[cut:]
+
+
+def _format_turns(turns: List[Tuple[str, str]]) -> str:
+    return "\n\n".join(f"{role.upper()}: {text}" for role, text in turns)
+
+
+def summary_prompt(older: List[Tuple[str, str]]) -> str:
+    return f"Summarize this conversation:\n\n{_format_turns(older)}"
+
+
+def compacted_prompt(summary: str, recent: List[Tuple[str, str]], prompt: str) -> str:
+    """First prompt of the replacement session: summary, recent turns verbatim, then the new prompt."""
+    parts = [f"[Summary of the earlier conversation]\n{summary.strip()}"]
+    if recent:
+        parts.append(f"[Most recent turns, verbatim]\n{_format_turns(recent)}")
+    parts.append(f"[Continue the conversation. New message from the user]\n{prompt}")
+    return "\n\n".join(parts)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // _CHARS_PER_TOKEN
+
+
+CONTEXT_TRACKER = ContextTracker()
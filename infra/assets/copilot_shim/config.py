@@ -29,6 +29,11 @@ def resolve_config_dir() -> Optional[str]:
     return None
 
 
+def session_state_path(config_dir: Optional[str], session_id: str) -> str:
+    """Directory holding a session's on-disk state."""
+    return os.path.join(config_dir if config_dir else _DEFAULT_CONFIG_DIR, "session-state", session_id)
+
+
 def session_exists(config_dir: Optional[str], session_id: str) -> bool:
     """
     Check if a session exists on disk by looking for its directory.
@@ -36,8 +41,7 @@ def session_exists(config_dir: Optional[str], session_id: str) -> bool:
     Session state is stored under {config_dir}/session-state/{sessionId}/.
     Falls back to ~/.copilot/session-state/{sessionId}/ if config_dir is None.
     """
-    base = config_dir if config_dir else _DEFAULT_CONFIG_DIR
-    session_path = os.path.join(base, "session-state", session_id)
+    session_path = session_state_path(config_dir, session_id)
     exists = os.path.isdir(session_path)
     logging.info(f"Session '{session_id}' exists at {session_path}: {exists}")
     return exists
@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from .metrics import REGISTRY
+from .runner import DEFAULT_TIMEOUT, run_copilot_agent
+from .serialization import SSE_DONE_FRAME, sse_frame
+from .tracing import TurnTrace
+from .usage import QuotaExceededError
+
+_FANOUT_MAX_ITEMS = int(os.environ.get("COPILOT_FANOUT_MAX_ITEMS", "50"))
+_FANOUT_MAX_CONCURRENCY = int(os.environ.get("COPILOT_FANOUT_MAX_CONCURRENCY", "8"))
+_FANOUT_DEFAULT_CONCURRENCY = min(4, _FANOUT_MAX_CONCURRENCY)
+
+# Sub-turns only need the final answer; skip event, tool call and intermediate collection
+_ITEM_FIELDS = frozenset(("session_id", "response"))
+
+_FANOUT_ITEMS = REGISTRY.counter(
+    "copilot_shim_fanout_items_total", "Fan-out sub-prompts by status (ok, error, timeout).", ("status",)
+)
+_FANOUT_SECONDS = REGISTRY.histogram(
+    "copilot_shim_fanout_seconds", "End-to-end duration of a fan-out request, including the reduce step."
+)
+
+
+@dataclass
+class FanoutRequest:
+    prompts: List[str]
+    reduce: Optional[str] = None
+    concurrency: int = _FANOUT_DEFAULT_CONCURRENCY
+    item_timeout: float = DEFAULT_TIMEOUT
+
+    @classmethod
+    def from_dict(cls, body: Any) -> "FanoutRequest":
+        """
+        Validate a fan-out request body.
+
+        Either "prompts": ["...", ...] or "template": "... {input} ..." with
+        "inputs": [...]. Object inputs fill "{name}" placeholders from their
+        keys. Optional: "reduce" (prompt run over the collected results),
+        "concurrency" and "item_timeout" (seconds). Raises ValueError.
+        """
+        if not isinstance(body, dict):
+            raise ValueError("Request body must be a JSON object")
+
+        prompts = body.get("prompts")
+        template = body.get("template")
+        if prompts is not None:
+            if not isinstance(prompts, list) or not all(isinstance(p, str) and p.strip() for p in prompts):
+                raise ValueError("'prompts' must be a list of non-empty strings")
+        elif template is not None:
+            inputs = body.get("inputs")
+            if not isinstance(template, str) or not template.strip():
+                raise ValueError("'template' must be a non-empty string")
+            if not isinstance(inputs, list):
+                raise ValueError("'inputs' must be a list when 'template' is set")
+            prompts = [render_template(template, item) for item in inputs]
+        else:
+            raise ValueError("Provide 'prompts' or 'template' with 'inputs'")
+
+        if not prompts:
+            raise ValueError("No prompts to run")
+        if len(prompts) > _FANOUT_MAX_ITEMS:
+            raise ValueError(f"Too many prompts ({len(prompts)}); the limit is {_FANOUT_MAX_ITEMS}")
+
+        reduce = body.get("reduce")
+        if reduce is not None and (not isinstance(reduce, str) or not reduce.strip()):
+            raise ValueError("'reduce' must be a non-empty string")
+
+        try:
+            concurrency = int(body.get("concurrency", _FANOUT_DEFAULT_CONCURRENCY))
+            item_timeout = float(body.get("item_timeout", DEFAULT_TIMEOUT))
+        except (TypeError, ValueError):
+            raise ValueError("'concurrency' and 'item_timeout' must be numbers")
+        if concurrency < 1 or item_timeout <= 0:
+            raise ValueError("'concurrency' and 'item_timeout' must be positive")
+
+        return cls(
+            prompts=[p.strip() for p in prompts],
+            reduce=reduce.strip() if reduce else None,
+            concurrency=min(concurrency, _FANOUT_MAX_CONCURRENCY),
+            item_timeout=min(item_timeout, DEFAULT_TIMEOUT),
+        )
+
+
+def render_template(template: str, item: Any) -> str:
+    """Fill "{input}" with a scalar input, or "{key}" placeholders with an object input's values."""
+    if isinstance(item, dict):
+        prompt = template
+        for key, value in item.items():
+            prompt = prompt.replace("{" + str(key) + "}", str(value))
+        return prompt
+    return template.replace("{input}", str(item))
+
+
+def reduce_prompt(reduce: str, prompts: List[str], results: List[Optional[str]]) -> str:
+    """The reduce prompt followed by every successful sub-result, labelled with its sub-prompt."""
+    parts = [reduce, "", "[Results]"]
+    for index, (prompt, content) in enumerate(zip(prompts, results)):
+        if content is not None:
+            parts.append(f"\n## Result {index + 1}\nPrompt: {prompt}\n\n{content}")
+    return "\n".join(parts)
+
+
+async def run_fanout(
+    request: FanoutRequest,
+    route: Optional[str] = None,
+    traceparent: Optional[str] = None,
+    caller: Optional[str] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Run each sub-prompt as its own sessionless turn and stream SSE frames.
+
+    Frames: one "fanout" frame with the item count, an "item" frame per
+    sub-prompt as it finishes (in completion order, with its index), a
+    "reduce" frame when a reduce prompt was given, then "done". A failed or
+    timed-out sub-prompt is reported and left out of the reduce step; it
+    does not stop the others. Pending sub-turns are cancelled if the client
+    disconnects.
+
+    The request gets one root span (a child of `traceparent` when given); each
+    sub-turn and the reduce step run under their own child span of it, so the
+    whole fan-out is a single trace.
+    """
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(request.concurrency)
+    trace = TurnTrace(
+        route or "fanout",
+        traceparent,
+        {
+            "route": route,
+            "items": len(request.prompts),
+            "concurrency": request.concurrency,
+            "reduce": request.reduce is not None,
+        },
+    )
+    trace_status = "cancelled"
+
+    async def run_item(index: int, prompt: str) -> Dict[str, Any]:
+        async with semaphore:
+            item_started = time.perf_counter()
+            frame: Dict[str, Any] = {"type": "item", "index": index}
+            span = trace.start_span("fanout.item", attributes={"index": index})
+            try:
+                # The deadline covers session setup too, and cancelling aborts and deletes the sub-session
+                result = await asyncio.wait_for(
+                    run_copilot_agent(
+                        prompt,
+                        timeout=request.item_timeout,
+                        route=route,
+                        traceparent=span.traceparent,
+                        fields=_ITEM_FIELDS,
+                        caller=caller,
+                    ),
+                    request.item_timeout,
+                )
+                frame.update(status="ok", session_id=result.session_id, content=result.content)
+            except asyncio.TimeoutError:
+                frame.update(status="timeout", error=f"No response within {request.item_timeout}s")
+            except QuotaExceededError as e:
+                frame.update(status="error", error=str(e))
+            except Exception as e:
+                logging.warning(f"Fan-out item {index} failed: {e}")
+                frame.update(status="error", error=str(e) or type(e).__name__)
+            frame["seconds"] = round(time.perf_counter() - item_started, 3)
+            span.end(None if frame["status"] == "ok" else frame["status"])
+            _FANOUT_ITEMS.inc(status=frame["status"])
+            return frame
+
+    logging.info(
+        f"Fan-out: {len(request.prompts)} prompt(s), concurrency={request.concurrency}, "
+        f"item_timeout={request.item_timeout}s, reduce={request.reduce is not None}"
+    )
+    yield sse_frame({"type": "fanout", "items": len(request.prompts), "concurrency": request.concurrency})
+
+    tasks = [asyncio.ensure_future(run_item(index, prompt)) for index, prompt in enumerate(request.prompts)]
+    results: List[Optional[str]] = [None] * len(tasks)
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            frame = await next_done
+            if frame["status"] == "ok":
+                results[frame["index"]] = frame["content"]
+            yield sse_frame(frame)
+
+        if request.reduce is not None:
+            succeeded = sum(content is not None for content in results)
+            frame = {"type": "reduce", "items": succeeded}
+            if succeeded:
+                span = trace.start_span("fanout.reduce", attributes={"items": succeeded})
+                try:
+                    result = await asyncio.wait_for(
+                        run_copilot_agent(
+                            reduce_prompt(request.reduce, request.prompts, results),
+                            timeout=request.item_timeout,
+                            route=route,
+                            traceparent=span.traceparent,
+                            fields=_ITEM_FIELDS,
+                            caller=caller,
+                        ),
+                        request.item_timeout,
+                    )
+                    frame.update(status="ok", session_id=result.session_id, content=result.content)
+                except asyncio.TimeoutError:
+                    frame.update(status="timeout", error=f"No response within {request.item_timeout}s")
+                except Exception as e:
+                    logging.warning(f"Fan-out reduce failed: {e}")
+                    frame.update(status="error", error=str(e) or type(e).__name__)
+                span.end(None if frame["status"] == "ok" else frame["status"])
+            else:
+                frame.update(status="error", error="No sub-prompt succeeded")
+            yield sse_frame(frame)
+
+        trace_status = "ok"
+        yield SSE_DONE_FRAME
+    except Exception:
+        trace_status = "error"
+        raise
+    finally:
+        for task in tasks:
+            task.cancel()
+        _FANOUT_SECONDS.observe(time.perf_counter() - started)
+        trace.finish(trace_status)
@@ -0,0 +1,96 @@
+import bisect
+import os
+import threading
+from typing import Dict, List, Optional
+
+from .metrics import REGISTRY
+from .routing import ModelStats
+
+_HEDGE_PERCENTILE = float(os.environ.get("COPILOT_HEDGE_PERCENTILE", "95"))
+_HEDGE_MAX_RATE = float(os.environ.get("COPILOT_HEDGE_MAX_RATE", "0.1"))
+_HEDGE_MIN_SAMPLES = int(os.environ.get("COPILOT_HEDGE_MIN_SAMPLES", "20"))
+_HEDGE_MIN_DELAY_SECONDS = float(os.environ.get("COPILOT_HEDGE_MIN_DELAY_SECONDS", "1.0"))
+_HEDGE_WINDOW = int(os.environ.get("COPILOT_HEDGE_WINDOW", "200"))
+
+_HEDGE_REQUESTS = REGISTRY.counter(
+    "copilot_shim_hedge_requests_total",
+    "Hedge-eligible turns by what happened (issued, won, lost, not_needed, no_budget, no_history).",
+    ("route", "action"),
+)
+
+
+class HedgePolicy:
+    """
+    When and how often to hedge a sessionless turn.
+
+    A hedge is started when the first attempt shows no progress, so the delay
+    is the configured percentile of the model's recent time to first progress
+    (turn start to the first message, delta or tool call of eligible turns),
+    and only the slow tail gets a second session. Over the last `window`
+    eligible turns at most `max_rate` of them may issue a hedge, which bounds
+    the extra cost.
+    """
+
+    def __init__(
+        self,
+        percentile: float = _HEDGE_PERCENTILE,
+        max_rate: float = _HEDGE_MAX_RATE,
+        min_samples: int = _HEDGE_MIN_SAMPLES,
+        min_delay: float = _HEDGE_MIN_DELAY_SECONDS,
+        window: int = _HEDGE_WINDOW,
+    ):
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.window = window
+        self._eligible = 0
+        # Sorted tickets of the eligible turns that issued a hedge
+        self._issued: List[int] = []
+        self._first_progress: Dict[str, ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, model: str) -> ModelStats:
+        with self._lock:
+            stats = self._first_progress.get(model)
+            if stats is None:
+                stats = self._first_progress[model] = ModelStats(self.window)
+            return stats
+
+    def record_first_progress(self, model: str, seconds: float) -> None:
+        """Record how long an eligible turn took to show its first progress."""
+        self._stats(model).record(seconds, True)
+
+    def delay(self, model: str) -> Optional[float]:
+        """Seconds to wait for progress before hedging, or None without enough history."""
+        stats = self._stats(model)
+        if len(stats) < self.min_samples:
+            return None
+        value = stats.percentile(self.percentile)
+        if value is None:
+            return None
+        return max(self.min_delay, value)
+
+    def note_eligible(self) -> int:
+        """Count a hedge-eligible turn and return its ticket for try_acquire()."""
+        with self._lock:
+            self._eligible += 1
+            return self._eligible
+
+    def try_acquire(self, ticket: int) -> bool:
+        """Claim a hedge for the eligible turn holding `ticket` if the rate cap allows it."""
+        with self._lock:
+            oldest = self._eligible - self.window
+            del self._issued[: bisect.bisect_right(self._issued, oldest)]
+            if ticket <= oldest:
+                return False
+            if len(self._issued) + 1 > self.max_rate * min(self._eligible, self.window):
+                return False
+            bisect.insort(self._issued, ticket)
+            return True
+
+    def count(self, route: Optional[str], action: str) -> None:
+        _HEDGE_REQUESTS.inc(route=route or "direct", action=action)
+
+
+HEDGE_POLICY = HedgePolicy()
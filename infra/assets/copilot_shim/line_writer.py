@@ -0,0 +1,76 @@
+import atexit
+import logging
+import queue
+import threading
+from typing import Callable, List, Optional, Union
+
+# A ready line, or a callable that builds it on the writer thread (keeps serialization off the loop)
+Line = Union[str, Callable[[], Optional[str]]]
+
+
+class LineWriter:
+    """
+    Append lines to a file from a daemon thread so the event loop never waits on disk.
+
+    The thread starts on the first write and batches whatever is queued into
+    one append. Queued lines are flushed at interpreter exit.
+    """
+
+    def __init__(self, path: str, name: str = "line-writer"):
+        self.path = path
+        self.name = name
+        self._queue: "queue.SimpleQueue[Optional[Line]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def write(self, line: Line) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+                    atexit.register(self.close)
+        self._queue.put(line)
+
+    def close(self, timeout: float = 2.0) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            line = self._queue.get()
+            if line is None:
+                return
+            lines = [line]
+            # Batch whatever else is queued into the same append
+            while True:
+                try:
+                    queued = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if queued is None:
+                    self._append(lines)
+                    return
+                lines.append(queued)
+            self._append(lines)
+
+    def _append(self, lines: List[Line]) -> None:
+        rendered = []
+        for line in lines:
+            if callable(line):
+                try:
+                    line = line()
+                except Exception as e:
+                    logging.warning(f"Failed to serialize a record for {self.path}: {e}")
+                    continue
+                if line is None:
+                    continue
+            rendered.append(line + "\n")
+        if not rendered:
+            return
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(rendered))
+        except OSError as e:
+            logging.warning(f"Failed to append {len(rendered)} record(s) to {self.path}: {e}")
@@ -0,0 +1,306 @@
+import math
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Latency buckets (seconds) tuned for agent turns: sub-second tool calls up to DEFAULT_TIMEOUT
+_DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+_LabelKey = Tuple[str, ...]
+
+_INF_BUCKET = 'le="+Inf"'
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    metric_type = "untyped"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> _LabelKey:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self._render_samples())
+        return lines
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, label_names)
+        self._values: Dict[_LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, label_names)
+        self._values: Dict[_LabelKey, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        label_names: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = _DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., sum, count]
+        self._series: Dict[_LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [0.0] * (len(self.buckets) + 2)
+                self._series[key] = series
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+
+        lines: List[str] = []
+        for key, series in items:
+            cumulative = 0.0
+            for index, bound in enumerate(self.buckets):
+                cumulative += series[index]
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, _INF_BUCKET)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {_format_value(series[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """In-process registry rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_text, label_names))  # type: ignore
+
+    def gauge(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, label_names))  # type: ignore
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        label_names: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = _DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, help_text, label_names, buckets))  # type: ignore
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_SESSION_SETUP_SECONDS = REGISTRY.histogram(
+    "copilot_shim_session_setup_seconds",
+    "Time spent creating, resuming or claiming (mode=pool) a Copilot session.",
+    ("route", "model", "mode"),
+)
+_FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "copilot_shim_time_to_first_token_seconds",
+    "Time from sending the prompt to the first assistant output.",
+    ("route", "model"),
+)
+_MODEL_SECONDS = REGISTRY.histogram(
+    "copilot_shim_model_seconds",
+    "Time from sending the prompt to session idle, excluding time spent in tools.",
+    ("route", "model"),
+)
+_TOOL_SECONDS = REGISTRY.histogram(
+    "copilot_shim_tool_seconds",
+    "Duration of individual tool executions.",
+    ("route", "model", "tool"),
+)
+_TURN_SECONDS = REGISTRY.histogram(
+    "copilot_shim_turn_seconds",
+    "End-to-end duration of an agent turn, including session setup.",
+    ("route", "model", "outcome"),
+)
+_OVERHEAD_SECONDS = REGISTRY.counter(
+    "copilot_shim_metrics_overhead_seconds_total",
+    "CPU-bound time spent inside turn instrumentation hooks.",
+)
+
+
+class TurnTimer:
+    """
+    Derive per-turn latency breakdown from session events.
+
+    Call order: session_ready() -> prompt_sent() -> on_event(...)* -> finish().
+    All hooks are O(1) and measure their own cost into the overhead counter.
+    """
+
+    __slots__ = (
+        "route",
+        "model",
+        "_start",
+        "_prompt_sent",
+        "_first_token",
+        "_tool_starts",
+        "_active_tools",
+        "_tools_busy_since",
+        "_tool_busy_total",
+        "_overhead",
+        "_finished",
+    )
+
+    def __init__(self, route: Optional[str], model: str):
+        self.route = route or "direct"
+        self.model = model
+        self._start = time.perf_counter()
+        self._prompt_sent: Optional[float] = None
+        self._first_token: Optional[float] = None
+        self._tool_starts: Dict[str, Tuple[float, str]] = {}
+        self._active_tools = 0
+        self._tools_busy_since = 0.0
+        self._tool_busy_total = 0.0
+        self._overhead = 0.0
+        self._finished = False
+
+    def session_ready(self, mode: str) -> None:
+        now = time.perf_counter()
+        _SESSION_SETUP_SECONDS.observe(now - self._start, route=self.route, model=self.model, mode=mode)
+        self._overhead += time.perf_counter() - now
+
+    def prompt_sent(self) -> None:
+        self._prompt_sent = time.perf_counter()
+
+    def elapsed(self) -> float:
+        """Seconds since the turn started, session setup included."""
+        return time.perf_counter() - self._start
+
+    def on_event(self, event_type: str, data) -> None:
+        now = time.perf_counter()
+        if event_type in ("assistant.message_delta", "assistant.message", "assistant.reasoning_delta"):
+            if self._first_token is None and self._prompt_sent is not None:
+                self._first_token = now
+                _FIRST_TOKEN_SECONDS.observe(now - self._prompt_sent, route=self.route, model=self.model)
+        elif event_type == "tool.execution_start":
+            tool_call_id = getattr(data, "tool_call_id", None)
+            if tool_call_id:
+                self._tool_starts[tool_call_id] = (now, getattr(data, "tool_name", None) or "unknown")
+            if self._active_tools == 0:
+                self._tools_busy_since = now
+            self._active_tools += 1
+        elif event_type == "tool.execution_end":
+            started = self._tool_starts.pop(getattr(data, "tool_call_id", None) or "", None)
+            if started is not None:
+                tool_name = getattr(data, "tool_name", None) or started[1]
+                _TOOL_SECONDS.observe(now - started[0], route=self.route, model=self.model, tool=tool_name)
+            if self._active_tools > 0:
+                self._active_tools -= 1
+                if self._active_tools == 0:
+                    self._tool_busy_total += now - self._tools_busy_since
+        else:
+            return
+        self._overhead += time.perf_counter() - now
+
+    def finish(self, outcome: str = "ok") -> Optional[float]:
+        """
+        Record the turn and return its model time (prompt to idle, excluding tools).
+
+        Returns None if already finished or the prompt was never sent.
+        """
+        if self._finished:
+            return None
+        self._finished = True
+        now = time.perf_counter()
+        if self._active_tools > 0:
+            self._tool_busy_total += now - self._tools_busy_since
+        model_seconds = None
+        if self._prompt_sent is not None:
+            model_seconds = max(0.0, (now - self._prompt_sent) - self._tool_busy_total)
+            _MODEL_SECONDS.observe(model_seconds, route=self.route, model=self.model)
+        _TURN_SECONDS.observe(now - self._start, route=self.route, model=self.model, outcome=outcome)
+        self._overhead += time.perf_counter() - now
+        _OVERHEAD_SECONDS.inc(self._overhead)
+        return model_seconds
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
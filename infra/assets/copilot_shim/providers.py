@@ -0,0 +1,241 @@
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from .metrics import REGISTRY
+
+# Breaker states, exported as the value of copilot_shim_provider_state
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+_STATE_NAMES = {CLOSED: "closed", HALF_OPEN: "half_open", OPEN: "open"}
+
+_BREAKER_FAILURES = int(os.environ.get("COPILOT_BREAKER_FAILURES", "3"))
+_BREAKER_LATENCY_SECONDS = float(os.environ.get("COPILOT_BREAKER_LATENCY_SECONDS", "0") or 0)
+_BREAKER_COOLDOWN_SECONDS = float(os.environ.get("COPILOT_BREAKER_COOLDOWN_SECONDS", "30"))
+# Weight of the newest sample in the per-endpoint latency average
+_LATENCY_EWMA_ALPHA = 0.2
+
+_PROVIDER_STATE = REGISTRY.gauge(
+    "copilot_shim_provider_state",
+    "BYOK endpoint circuit breaker state (0=closed, 1=half_open, 2=open).",
+    ("endpoint",),
+)
+_PROVIDER_LATENCY = REGISTRY.gauge(
+    "copilot_shim_provider_latency_seconds",
+    "Moving average of turn latency per BYOK endpoint.",
+    ("endpoint",),
+)
+_PROVIDER_REQUESTS = REGISTRY.counter(
+    "copilot_shim_provider_requests_total",
+    "Turns per BYOK endpoint by outcome (ok, error, throttled, timeout).",
+    ("endpoint", "outcome"),
+)
+
+
+def _wire_api_for(model: str) -> str:
+    # GPT-5 series models use the responses API format
+    return "responses" if model.startswith("gpt-5") else "completions"
+
+
+@dataclass
+class FoundryEndpoint:
+    """One Foundry deployment a session can be sent to, with its circuit breaker."""
+
+    name: str
+    base_url: str
+    api_key: str
+    model: Optional[str] = None
+    weight: float = 1.0
+    wire_api: Optional[str] = None
+
+    state: int = CLOSED
+    failures: int = 0
+    opened_at: float = 0.0
+    probing: bool = False
+    latency: Optional[float] = None
+    throttled_until: float = 0.0
+
+    def provider_config(self, model: str) -> Dict[str, Any]:
+        return {
+            "type": "openai",
+            "base_url": self.base_url,
+            "api_key": self.api_key,
+            "wire_api": self.wire_api or _wire_api_for(model),
+        }
+
+    def score(self) -> float:
+        # Unmeasured endpoints score 0 so each one gets tried early
+        return (self.latency or 0.0) / max(self.weight, 1e-6)
+
+
+class ProviderPool:
+    """
+    Weighted pool of Foundry endpoints for BYOK sessions.
+
+    New sessions go to the available endpoint with the lowest latency/weight.
+    Each endpoint has a circuit breaker: `failures` consecutive errors, a
+    throttle (HTTP 429), or a moving-average latency above `latency_threshold`
+    opens it for `cooldown` seconds; after that one probe turn is let through
+    (half-open) and its outcome closes or re-opens the breaker. When every
+    breaker is open the endpoint that will recover soonest is used anyway.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[FoundryEndpoint],
+        failures: int = _BREAKER_FAILURES,
+        latency_threshold: float = _BREAKER_LATENCY_SECONDS,
+        cooldown: float = _BREAKER_COOLDOWN_SECONDS,
+    ):
+        self.endpoints = endpoints
+        self.failures = failures
+        self.latency_threshold = latency_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        for endpoint in endpoints:
+            _PROVIDER_STATE.set(CLOSED, endpoint=endpoint.name)
+
+    def __bool__(self) -> bool:
+        return bool(self.endpoints)
+
+    def _set_state(self, endpoint: FoundryEndpoint, state: int, now: float) -> None:
+        if endpoint.state != state:
+            logging.info(
+                f"BYOK endpoint '{endpoint.name}' breaker {_STATE_NAMES[endpoint.state]} -> {_STATE_NAMES[state]}"
+            )
+        endpoint.state = state
+        if state == OPEN:
+            endpoint.opened_at = now
+        _PROVIDER_STATE.set(state, endpoint=endpoint.name)
+
+    def select(self) -> Tuple[Optional[FoundryEndpoint], bool]:
+        """
+        Pick the endpoint for a new turn.
+
+        Returns (endpoint, probe); `probe` is True when the turn holds the
+        endpoint's half-open probe and must end with record() or release().
+        """
+        if not self.endpoints:
+            return None, False
+        now = time.monotonic()
+        with self._lock:
+            available = []
+            for endpoint in self.endpoints:
+                if endpoint.state == OPEN and now - endpoint.opened_at >= self.cooldown and now >= endpoint.throttled_until:
+                    self._set_state(endpoint, HALF_OPEN, now)
+                if endpoint.state == CLOSED or (endpoint.state == HALF_OPEN and not endpoint.probing):
+                    available.append(endpoint)
+
+            if available:
+                chosen = min(available, key=FoundryEndpoint.score)
+                probe = chosen.state == HALF_OPEN
+                if probe:
+                    chosen.probing = True
+                return chosen, probe
+
+            chosen = min(self.endpoints, key=lambda e: max(e.opened_at + self.cooldown, e.throttled_until))
+            logging.warning(f"All BYOK endpoint breakers are open; using '{chosen.name}'")
+            return chosen, False
+
+    def release(self, endpoint: FoundryEndpoint) -> None:
+        """
+        Free a half-open probe that ended without an outcome (cancelled, or
+        failed before the prompt was sent) so the next turn can probe. A no-op
+        once record() has moved the breaker out of half-open.
+        """
+        with self._lock:
+            if endpoint.state == HALF_OPEN:
+                endpoint.probing = False
+
+    def record(
+        self,
+        endpoint: FoundryEndpoint,
+        seconds: Optional[float],
+        outcome: str,
+        status_code: Optional[int] = None,
+    ) -> None:
+        """Feed one turn's outcome ("ok", "error", "timeout") into the endpoint's breaker."""
+        throttled = status_code == 429
+        _PROVIDER_REQUESTS.inc(endpoint=endpoint.name, outcome="throttled" if throttled else outcome)
+        now = time.monotonic()
+        with self._lock:
+            endpoint.probing = False
+            if outcome == "ok" and seconds is not None:
+                endpoint.latency = (
+                    seconds
+                    if endpoint.latency is None
+                    else _LATENCY_EWMA_ALPHA * seconds + (1 - _LATENCY_EWMA_ALPHA) * endpoint.latency
+                )
+                _PROVIDER_LATENCY.set(endpoint.latency, endpoint=endpoint.name)
+
+            if throttled:
+                endpoint.throttled_until = now + self.cooldown
+                self._set_state(endpoint, OPEN, now)
+                return
+
+            if outcome == "ok":
+                endpoint.failures = 0
+                if endpoint.state == OPEN:
+                    # A turn that started before the breaker opened; wait for the half-open probe
+                    return
+                slow = self.latency_threshold > 0 and endpoint.latency is not None and endpoint.latency > self.latency_threshold
+                self._set_state(endpoint, OPEN if slow else CLOSED, now)
+                return
+
+            endpoint.failures += 1
+            if endpoint.state == HALF_OPEN or endpoint.failures >= self.failures:
+                self._set_state(endpoint, OPEN, now)
+
+
+def _load_endpoints() -> List[FoundryEndpoint]:
+    """
+    Load BYOK endpoints.
+
+    Priority:
+    1. AZURE_AI_FOUNDRY_ENDPOINTS: JSON list of
+       {"name", "endpoint", "api_key" | "api_key_env", "model", "weight", "wire_api"}
+       (api_key defaults to AZURE_AI_FOUNDRY_API_KEY)
+    2. AZURE_AI_FOUNDRY_ENDPOINT + AZURE_AI_FOUNDRY_API_KEY (single endpoint)
+    """
+    default_key = os.environ.get("AZURE_AI_FOUNDRY_API_KEY", "")
+    default_model = os.environ.get("AZURE_AI_FOUNDRY_MODEL")
+    raw = os.environ.get("AZURE_AI_FOUNDRY_ENDPOINTS")
+    if raw:
+        try:
+            entries = json.loads(raw)
+        except ValueError as e:
+            logging.warning(f"Invalid AZURE_AI_FOUNDRY_ENDPOINTS: {e}")
+            entries = []
+        endpoints = []
+        for index, entry in enumerate(entries if isinstance(entries, list) else []):
+            if not isinstance(entry, dict) or not entry.get("endpoint"):
+                logging.warning(f"Ignoring invalid BYOK endpoint entry: {entry!r}")
+                continue
+            api_key = entry.get("api_key") or os.environ.get(entry.get("api_key_env", ""), "") or default_key
+            if not api_key:
+                logging.warning(f"Ignoring BYOK endpoint {entry['endpoint']}: no API key")
+                continue
+            endpoints.append(
+                FoundryEndpoint(
+                    name=str(entry.get("name") or f"endpoint-{index}"),
+                    base_url=str(entry["endpoint"]),
+                    api_key=api_key,
+                    model=entry.get("model") or default_model,
+                    weight=float(entry.get("weight", 1.0)),
+                    wire_api=entry.get("wire_api"),
+                )
+            )
+        if endpoints:
+            logging.info(f"BYOK provider pool: {', '.join(e.name for e in endpoints)}")
+            return endpoints
+
+    endpoint = os.environ.get("AZURE_AI_FOUNDRY_ENDPOINT")
+    if endpoint and default_key:
+        return [FoundryEndpoint(name="default", base_url=endpoint, api_key=default_key, model=default_model)]
+    return []
+
+
+PROVIDER_POOL = ProviderPool(_load_endpoints())
@@ -0,0 +1,160 @@
+import hashlib
+import hmac
+import json
+import os
+import random
+import secrets
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .line_writer import LineWriter
+
+# Event payload fields whose size is recorded (content itself is never written)
+_SIZE_FIELDS = {
+    "assistant.message_delta": "delta_content",
+    "assistant.reasoning_delta": "delta_content",
+    "assistant.message": "content",
+    "tool.execution_start": "arguments",
+    "tool.execution_end": "result",
+}
+
+# One background writer per recording file, shared by every recorder that targets it
+_WRITERS: Dict[str, LineWriter] = {}
+_WRITERS_LOCK = threading.Lock()
+
+
+def _writer_for(path: str) -> LineWriter:
+    with _WRITERS_LOCK:
+        writer = _WRITERS.get(path)
+        if writer is None:
+            writer = _WRITERS[path] = LineWriter(path, "event-record-writer")
+        return writer
+
+
+def _payload_size(value: Any) -> int:
+    if hasattr(value, "to_dict"):
+        value = value.to_dict()
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return len(str(value))
+
+
+# Optional stable HMAC key, so redacted tool names can be compared across recordings
+_RECORD_SALT = os.environ.get("COPILOT_EVENT_RECORD_SALT")
+
+
+def _redact(key: bytes, value: Optional[str]) -> Optional[str]:
+    # Keyed, so the well-known tool names can't be recovered by hashing a list of candidates
+    if value is None:
+        return None
+    return hmac.new(key, value.encode("utf-8"), hashlib.sha256).hexdigest()[:12]
+
+
+class EventRecorder:
+    """
+    Record the shape of one agent turn as a compact JSON line.
+
+    Each event becomes [relative_seconds, type, payload_chars, tool_call_id,
+    parent_tool_call_id, tool_name]. Message text, arguments and results are
+    never written. With redaction enabled, tool names and ids are replaced by
+    an HMAC keyed with a random per-recording secret (or
+    COPILOT_EVENT_RECORD_SALT), so they stay consistent within a turn but
+    cannot be mapped back to names without the key.
+
+    Records are appended by a background writer, which also sizes structured
+    payloads (tool arguments and results), so the event loop never serializes
+    them or waits on the file.
+    """
+
+    def __init__(self, path: str, route: Optional[str], streaming: bool, redact: bool):
+        self.path = path
+        self.redact = redact
+        self._redact_key = _RECORD_SALT.encode("utf-8") if _RECORD_SALT else secrets.token_bytes(32)
+        self._start = time.perf_counter()
+        self._setup_seconds: Optional[float] = None
+        self._send_offset: Optional[float] = None
+        self._events: List[list] = []
+        # (event index, structured payload) pairs sized by the writer thread
+        self._deferred_sizes: List[Tuple[int, Any]] = []
+        self._header = {"route": route, "streaming": streaming, "recorded_at": time.time()}
+
+    def session_ready(self, mode: str) -> None:
+        self._setup_seconds = time.perf_counter() - self._start
+        self._header["session_mode"] = mode
+
+    def prompt_sent(self) -> None:
+        self._send_offset = time.perf_counter()
+
+    def on_event(self, event_type: str, data: Any) -> None:
+        base = self._send_offset if self._send_offset is not None else self._start
+        tool_call_id = getattr(data, "tool_call_id", None)
+        parent_tool_call_id = getattr(data, "parent_tool_call_id", None)
+        tool_name = getattr(data, "tool_name", None)
+        if self.redact:
+            tool_call_id, parent_tool_call_id, tool_name = (
+                _redact(self._redact_key, tool_call_id),
+                _redact(self._redact_key, parent_tool_call_id),
+                _redact(self._redact_key, tool_name),
+            )
+        size = 0
+        field_name = _SIZE_FIELDS.get(event_type)
+        value = getattr(data, field_name, None) if field_name is not None and data is not None else None
+        if isinstance(value, str):
+            size = len(value)
+        elif value is not None:
+            self._deferred_sizes.append((len(self._events), value))
+        self._events.append(
+            [
+                round(time.perf_counter() - base, 6),
+                event_type,
+                size,
+                tool_call_id,
+                parent_tool_call_id,
+                tool_name,
+            ]
+        )
+
+    def finish(self, outcome: str = "ok") -> None:
+        record = dict(self._header)
+        record.update(
+            {
+                "outcome": outcome,
+                "session_setup": round(self._setup_seconds, 6) if self._setup_seconds is not None else None,
+                "events": self._events,
+            }
+        )
+        deferred_sizes = self._deferred_sizes
+        _writer_for(self.path).write(lambda: _serialize(record, deferred_sizes))
+
+
+def _serialize(record: Dict[str, Any], deferred_sizes: List[Tuple[int, Any]]) -> str:
+    # Runs on the writer thread: structured payloads (tool arguments and results) are only sized here
+    events = record["events"]
+    for index, value in deferred_sizes:
+        events[index][2] = _payload_size(value)
+    return json.dumps(record, separators=(",", ":"))
+
+
+def start_recording(route: Optional[str], streaming: bool) -> Optional[EventRecorder]:
+    """
+    Return a recorder for this turn if recording is enabled, else None.
+
+    COPILOT_EVENT_RECORD_PATH enables recording to that JSONL file.
+    COPILOT_EVENT_RECORD_SAMPLE_RATE (0.0-1.0, default 1.0) samples turns.
+    COPILOT_EVENT_RECORD_REDACT (default true) replaces tool names and ids with keyed hashes.
+    """
+    path = os.environ.get("COPILOT_EVENT_RECORD_PATH")
+    if not path:
+        return None
+
+    try:
+        sample_rate = float(os.environ.get("COPILOT_EVENT_RECORD_SAMPLE_RATE", "1.0"))
+    except ValueError:
+        sample_rate = 1.0
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        return None
+
+    redact = os.environ.get("COPILOT_EVENT_RECORD_REDACT", "true").strip().lower() not in {"false", "0", "no", "n"}
+    return EventRecorder(path, route, streaming, redact)
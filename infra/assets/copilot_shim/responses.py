@@ -0,0 +1,89 @@
+import gzip
+import os
+from typing import Any, Collection, Dict, FrozenSet, Optional, Tuple, Union
+
+from .serialization import dumps_bytes
+from .static_assets import parse_accept_encoding
+
+RESPONSE_FIELDS = ("session_id", "response", "response_intermediate", "tool_calls", "routing")
+DEFAULT_RESPONSE_FIELDS: FrozenSet[str] = frozenset(RESPONSE_FIELDS)
+
+TOOL_ARGUMENT_MODES = ("full", "truncate", "summary", "omit")
+
+_TOOL_ARGUMENT_PREVIEW_CHARS = int(os.environ.get("COPILOT_TOOL_ARGUMENT_PREVIEW_CHARS", "256"))
+# Bodies smaller than this are not worth a gzip round trip
+_GZIP_MIN_BYTES = int(os.environ.get("COPILOT_GZIP_MIN_BYTES", "1024"))
+
+
+def parse_fields(value: Union[str, Collection[str], None]) -> FrozenSet[str]:
+    """
+    Parse a field projection such as "response,session_id" (or a list).
+
+    Empty or missing values select every field. Unknown names raise ValueError.
+    """
+    if value is None:
+        return DEFAULT_RESPONSE_FIELDS
+    names = value.split(",") if isinstance(value, str) else list(value)
+    fields = frozenset(str(name).strip() for name in names if str(name).strip())
+    if not fields:
+        return DEFAULT_RESPONSE_FIELDS
+    unknown = fields - DEFAULT_RESPONSE_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(sorted(unknown))}. Allowed: {', '.join(RESPONSE_FIELDS)}")
+    return fields
+
+
+def parse_tool_arguments_mode(value: Optional[str]) -> str:
+    if not value:
+        return "full"
+    mode = value.strip().lower()
+    if mode not in TOOL_ARGUMENT_MODES:
+        raise ValueError(f"Invalid tool_arguments '{value}'. Allowed: {', '.join(TOOL_ARGUMENT_MODES)}")
+    return mode
+
+
+def shrink_arguments(arguments: Any, mode: str) -> Any:
+    """Reduce one tool call's arguments per `mode` (see TOOL_ARGUMENT_MODES); applied by the runner."""
+    if mode == "full" or arguments is None:
+        return arguments
+    if mode == "omit":
+        return None
+
+    if mode == "summary":
+        if isinstance(arguments, dict):
+            return {"keys": sorted(arguments.keys()), "size": len(dumps_bytes(arguments))}
+        return {"size": len(dumps_bytes(arguments))}
+
+    # truncate: keep small arguments as-is, replace large ones with a preview
+    text = arguments if isinstance(arguments, str) else dumps_bytes(arguments).decode("utf-8")
+    if len(text) <= _TOOL_ARGUMENT_PREVIEW_CHARS:
+        return arguments
+    return {"truncated": True, "size": len(text), "preview": text[:_TOOL_ARGUMENT_PREVIEW_CHARS]}
+
+
+def build_agent_payload(result, fields: Collection[str] = DEFAULT_RESPONSE_FIELDS) -> Dict[str, Any]:
+    """Project an AgentResult onto the requested response fields (tool arguments are shrunk by the runner)."""
+    payload: Dict[str, Any] = {}
+    if "session_id" in fields:
+        payload["session_id"] = result.session_id
+    if "response" in fields:
+        payload["response"] = result.content
+    if "response_intermediate" in fields:
+        payload["response_intermediate"] = result.content_intermediate
+    if "tool_calls" in fields:
+        payload["tool_calls"] = result.tool_calls
+    if "routing" in fields and result.routing is not None:
+        payload["routing"] = result.routing
+    return payload
+
+
+def maybe_gzip(body: bytes, accept_encoding: Optional[str]) -> Tuple[bytes, Dict[str, str]]:
+    """Gzip a response body when the client accepts it and it is large enough to benefit."""
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) < _GZIP_MIN_BYTES:
+        return body, headers
+    accepted = parse_accept_encoding(accept_encoding)
+    if accepted.get("gzip", accepted.get("*", 0.0)) <= 0.0:
+        return body, headers
+    headers["Content-Encoding"] = "gzip"
+    return gzip.compress(body, compresslevel=5, mtime=0), headers
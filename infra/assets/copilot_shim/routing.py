@@ -0,0 +1,271 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .metrics import REGISTRY
+
+_ROUTING_DECISIONS = REGISTRY.counter(
+    "copilot_shim_routing_decisions_total",
+    "Model routing decisions by chosen model and reason.",
+    ("model", "reason"),
+)
+_MODEL_P95_SECONDS = REGISTRY.gauge(
+    "copilot_shim_model_p95_seconds",
+    "Rolling p95 model latency (excluding tool time) per model as seen by the router.",
+    ("model",),
+)
+
+
+class ModelStats:
+    """
+    Rolling window of (latency_seconds, ok) samples for one model.
+
+    Samples expire after `max_age` seconds as well as after `window` newer
+    samples, so a model that stopped getting traffic because it was degraded
+    is tried again once its bad samples have aged out.
+    """
+
+    def __init__(self, window: int, max_age: float = 300.0):
+        self.max_age = max_age
+        self._samples: Deque[Tuple[float, float, bool]] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - self.max_age
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+
+    def record(self, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self._prune()
+            self._samples.append((time.monotonic(), seconds, ok))
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._prune()
+            return len(self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            self._prune()
+            latencies = sorted(seconds for _, seconds, ok in self._samples if ok)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, max(0, int(round(pct / 100.0 * len(latencies))) - 1))
+        return latencies[index]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            self._prune()
+            total = len(self._samples)
+            errors = sum(1 for _, _, ok in self._samples if not ok)
+        return errors / total if total else 0.0
+
+
+@dataclass
+class RoutingRule:
+    model: str
+    max_prompt_chars: Optional[int] = None
+    min_prompt_chars: Optional[int] = None
+    keywords: List[str] = field(default_factory=list)
+    exclude_keywords: List[str] = field(default_factory=list)
+
+    def matches(self, prompt: str) -> bool:
+        length = len(prompt)
+        if self.max_prompt_chars is not None and length > self.max_prompt_chars:
+            return False
+        if self.min_prompt_chars is not None and length < self.min_prompt_chars:
+            return False
+        lowered = prompt.lower()
+        if self.keywords and not any(keyword in lowered for keyword in self.keywords):
+            return False
+        if any(keyword in lowered for keyword in self.exclude_keywords):
+            return False
+        return True
+
+
+def _optional_int(raw: Dict[str, Any], key: str) -> Optional[int]:
+    """Read a non-negative integer setting that may be given as a number or numeric string."""
+    value = raw.get(key)
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"{key} must be an integer, got {value!r}")
+    number = int(value)
+    if number < 0:
+        raise ValueError(f"{key} must not be negative, got {value!r}")
+    return number
+
+
+@dataclass
+class RoutingDecision:
+    model: str
+    reason: str
+    rule_index: Optional[int] = None
+    candidates: List[str] = field(default_factory=list)
+    p95_seconds: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class RoutingConfig:
+    rules: List[RoutingRule] = field(default_factory=list)
+    fallback: List[str] = field(default_factory=list)
+    p95_threshold_seconds: Optional[float] = None
+    error_rate_threshold: float = 0.5
+    window: int = 100
+    min_samples: int = 10
+    sample_max_age_seconds: float = 300.0
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RoutingConfig":
+        rules = []
+        for raw in data.get("rules", []):
+            if not isinstance(raw, dict) or not raw.get("model"):
+                logging.warning(f"Ignoring invalid model routing rule: {raw!r}")
+                continue
+            try:
+                rule = RoutingRule(
+                    model=str(raw["model"]),
+                    max_prompt_chars=_optional_int(raw, "max_prompt_chars"),
+                    min_prompt_chars=_optional_int(raw, "min_prompt_chars"),
+                    keywords=[str(k).lower() for k in raw.get("keywords", [])],
+                    exclude_keywords=[str(k).lower() for k in raw.get("exclude_keywords", [])],
+                )
+            except (TypeError, ValueError) as e:
+                logging.warning(f"Ignoring invalid model routing rule {raw!r}: {e}")
+                continue
+            rules.append(rule)
+        p95_threshold = data.get("p95_threshold_seconds")
+        return cls(
+            rules=rules,
+            fallback=[str(m) for m in data.get("fallback", [])],
+            p95_threshold_seconds=float(p95_threshold) if p95_threshold is not None else None,
+            error_rate_threshold=float(data.get("error_rate_threshold", 0.5)),
+            window=int(data.get("window", 100)),
+            min_samples=int(data.get("min_samples", 10)),
+            sample_max_age_seconds=float(data.get("sample_max_age_seconds", 300.0)),
+        )
+
+
+def _load_routing_config() -> Optional[RoutingConfig]:
+    """
+    Load the routing policy.
+
+    Priority:
+    1. COPILOT_MODEL_ROUTING env var (inline JSON)
+    2. model-routing.json in the working directory
+    3. Neither → routing disabled (DEFAULT_MODEL is always used)
+    """
+    raw = os.environ.get("COPILOT_MODEL_ROUTING")
+    source = "COPILOT_MODEL_ROUTING"
+    if not raw:
+        path = os.path.join(os.getcwd(), "model-routing.json")
+        if not os.path.exists(path):
+            return None
+        source = path
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                raw = f.read()
+        except OSError as e:
+            logging.warning(f"Failed to read model routing config from {path}: {e}")
+            return None
+
+    try:
+        data = json.loads(raw)
+    except ValueError as e:
+        logging.warning(f"Invalid model routing config in {source}: {e}")
+        return None
+    if not isinstance(data, dict):
+        logging.warning(f"Invalid model routing config in {source}: expected an object")
+        return None
+
+    try:
+        config = RoutingConfig.from_dict(data)
+    except (TypeError, ValueError) as e:
+        logging.warning(f"Invalid model routing config in {source}: {e}")
+        return None
+    logging.info(f"Loaded model routing from {source}: {len(config.rules)} rule(s), fallback={config.fallback}")
+    return config
+
+
+class ModelRouter:
+    def __init__(self, config: Optional[RoutingConfig]):
+        self.config = config
+        self._window = config.window if config else 100
+        self._max_age = config.sample_max_age_seconds if config else 300.0
+        self._stats: Dict[str, ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def stats(self, model: str) -> ModelStats:
+        with self._lock:
+            stats = self._stats.get(model)
+            if stats is None:
+                stats = ModelStats(self._window, self._max_age)
+                self._stats[model] = stats
+            return stats
+
+    def record(self, model: str, seconds: float, ok: bool) -> None:
+        stats = self.stats(model)
+        stats.record(seconds, ok)
+        p95 = stats.percentile(95)
+        if p95 is not None:
+            _MODEL_P95_SECONDS.set(p95, model=model)
+
+    def _is_degraded(self, model: str) -> bool:
+        config = self.config
+        stats = self.stats(model)
+        if config is None or len(stats) < config.min_samples:
+            return False
+        if stats.error_rate() > config.error_rate_threshold:
+            return True
+        if config.p95_threshold_seconds is not None:
+            p95 = stats.percentile(95)
+            return p95 is not None and p95 > config.p95_threshold_seconds
+        return False
+
+    def route(self, prompt: str, default_model: str) -> RoutingDecision:
+        config = self.config
+        if config is None:
+            return RoutingDecision(model=default_model, reason="default")
+
+        preferred, rule_index = default_model, None
+        for index, rule in enumerate(config.rules):
+            if rule.matches(prompt):
+                preferred, rule_index = rule.model, index
+                break
+
+        candidates: List[str] = []
+        for model in [preferred, *config.fallback, default_model]:
+            if model not in candidates:
+                candidates.append(model)
+
+        decision: Optional[RoutingDecision] = None
+        for position, model in enumerate(candidates):
+            if not self._is_degraded(model):
+                reason = ("rule" if rule_index is not None else "default") if position == 0 else "fallback"
+                decision = RoutingDecision(model=model, reason=reason, rule_index=rule_index, candidates=candidates)
+                break
+
+        if decision is None:
+            # Everything is degraded: pick the least-bad p95
+            def _p95(model: str) -> float:
+                value = self.stats(model).percentile(95)
+                return value if value is not None else float("inf")
+
+            model = min(candidates, key=_p95)
+            decision = RoutingDecision(model=model, reason="least_latency", rule_index=rule_index, candidates=candidates)
+
+        decision.p95_seconds = self.stats(decision.model).percentile(95)
+        _ROUTING_DECISIONS.inc(model=decision.model, reason=decision.reason)
+        return decision
+
+
+MODEL_ROUTER = ModelRouter(_load_routing_config())
@@ -1,18 +1,43 @@
 import asyncio
-import json
 import logging
 import os
+import shutil
+import time
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional
+from typing import Any, Collection, Dict, List, Optional
 
 from copilot import ResumeSessionConfig, SessionConfig
+from copilot.types import InfiniteSessionConfig
 import frontmatter
 
+from .artifacts import ARTIFACT_STORE
 from .client_manager import CopilotClientManager, _is_byok_mode
-from .config import resolve_config_dir, session_exists
+from .compaction import (
+    CONTEXT_TRACKER,
+    KEEP_RECENT_TURNS,
+    SUMMARIZER_AVAILABLE_TOOLS,
+    SUMMARIZER_SYSTEM_MESSAGE,
+    SUMMARY_TIMEOUT,
+    compacted_prompt,
+    estimate_tokens,
+    split_recent,
+    summary_prompt,
+    transcript_turns,
+)
+from .config import resolve_config_dir, session_exists, session_state_path
+from .hedging import HEDGE_POLICY
 from .mcp import get_cached_mcp_servers
-from .skills import resolve_session_directory_for_skills
+from .metrics import TurnTimer
+from .providers import PROVIDER_POOL, FoundryEndpoint
+from .recording import start_recording
+from .responses import shrink_arguments
+from .routing import MODEL_ROUTER, RoutingDecision
+from .serialization import SSE_DONE_FRAME, SSE_TIMEOUT_FRAME, sse_frame
+from .session_pool import SESSION_POOL
+from .skills import SKILL_INDEX
 from .tools import _REGISTERED_TOOLS_CACHE
+from .tracing import TurnTrace
+from .usage import ANONYMOUS_CALLER, USAGE_LEDGER, TurnUsage
 
 DEFAULT_TIMEOUT = 120.0
 
@@ -25,6 +50,8 @@ class AgentResult:
     tool_calls: List[Dict[str, Any]]
     reasoning: Optional[str] = None
     events: List[Dict[str, Any]] = field(default_factory=list)
+    routing: Optional[Dict[str, Any]] = None
+    context: Optional[Dict[str, Any]] = None
 
 
 def _load_agents_md_content() -> str:
@@ -59,12 +86,60 @@ _AGENTS_MD_CONTENT_CACHE = _load_agents_md_content()
 DEFAULT_MODEL = os.environ.get("COPILOT_MODEL", "claude-sonnet-4")
 
 
+# Pre-created sessions saw the old skill files; an edited SKILL.md does not change the config fingerprint
+SKILL_INDEX.on_change(lambda: SESSION_POOL.invalidate("skills"))
+
+
+def _route_model(prompt: str, model: Optional[str], endpoint: Optional[FoundryEndpoint] = None) -> RoutingDecision:
+    """
+    Pick the model for a turn: an explicit model wins, otherwise ask the router.
+
+    In BYOK mode the selected endpoint's deployment is the default, so the
+    decision names the model the session will actually use.
+    """
+    if model:
+        return RoutingDecision(model=model, reason="explicit")
+    if _is_byok_mode():
+        default_model = (endpoint.model if endpoint else None) or os.environ.get("AZURE_AI_FOUNDRY_MODEL", DEFAULT_MODEL)
+    else:
+        default_model = DEFAULT_MODEL
+    decision = MODEL_ROUTER.route(prompt, default_model)
+    if decision.reason != "default":
+        logging.info(f"Routed prompt ({len(prompt)} chars) to model={decision.model} (reason={decision.reason})")
+    return decision
+
+
+def _apply_byok_provider(config: Dict[str, Any], routing: Optional[RoutingDecision], endpoint: Optional[FoundryEndpoint]) -> None:
+    """Point a session/resume config at a Foundry endpoint from the provider pool."""
+    if endpoint is None:
+        endpoint, _ = PROVIDER_POOL.select()
+    if endpoint is None:
+        return
+    # The routing decision already names the deployment (see _route_model)
+    foundry_model = routing.model if routing is not None else endpoint.model or config["model"]
+    provider = endpoint.provider_config(foundry_model)
+    config["model"] = foundry_model
+    config["provider"] = provider
+    logging.info(
+        f"BYOK mode: using Microsoft Foundry endpoint={endpoint.name} ({endpoint.base_url}), "
+        f"model={foundry_model}, wire_api={provider['wire_api']}"
+    )
+
+
 def _build_session_config(
     model: str = DEFAULT_MODEL,
     config_dir: Optional[str] = None,
     session_id: Optional[str] = None,
     streaming: bool = False,
+    infinite_sessions: Optional[InfiniteSessionConfig] = None,
+    routing: Optional[RoutingDecision] = None,
+    endpoint: Optional[FoundryEndpoint] = None,
+    prompt: Optional[str] = None,
 ) -> SessionConfig:
+    """Config for a new session; with `prompt`, skills not relevant to it are disabled (see skills.py)."""
+    if routing is not None:
+        model = routing.model
+
     session_config: SessionConfig = {
         "model": model,
         "streaming": streaming,
@@ -74,19 +149,7 @@ def _build_session_config(
 
     # If Microsoft Foundry BYOK is configured, add provider config
     if _is_byok_mode():
-        foundry_endpoint = os.environ["AZURE_AI_FOUNDRY_ENDPOINT"]
-        foundry_key = os.environ["AZURE_AI_FOUNDRY_API_KEY"]
-        foundry_model = os.environ.get("AZURE_AI_FOUNDRY_MODEL", model)
-        # GPT-5 series models use the responses API format
-        wire_api = "responses" if foundry_model.startswith("gpt-5") else "completions"
-        session_config["model"] = foundry_model  # type: ignore
-        session_config["provider"] = {  # type: ignore
-            "type": "openai",
-            "base_url": foundry_endpoint,
-            "api_key": foundry_key,
-            "wire_api": wire_api,
-        }
-        logging.info(f"BYOK mode: using Microsoft Foundry endpoint={foundry_endpoint}, model={foundry_model}, wire_api={wire_api}")
+        _apply_byok_provider(session_config, routing, endpoint)  # type: ignore
 
     if session_id:
         session_config["session_id"] = session_id
@@ -94,15 +157,21 @@ def _build_session_config(
     if config_dir:
         session_config["config_dir"] = config_dir
 
-    session_directory = resolve_session_directory_for_skills()
-    if session_directory:
-        session_config["config"] = {"sessionDirectory": session_directory}  # type: ignore
-        logging.info(f"Using sessionDirectory for skills discovery: {session_directory}")
+    skill_options = SKILL_INDEX.session_options(prompt)
+    if skill_options:
+        session_config.update(skill_options)  # type: ignore
+        logging.info(
+            f"Using skill directories {skill_options.get('skill_directories')}, "
+            f"{len(skill_options.get('disabled_skills', []))} skill(s) disabled"
+        )
 
     mcp_servers = get_cached_mcp_servers()
     if mcp_servers:
         session_config["mcp_servers"] = mcp_servers
 
+    if infinite_sessions:
+        session_config["infinite_sessions"] = infinite_sessions
+
     return session_config
 
 
@@ -110,7 +179,13 @@ def _build_resume_config(
     model: str = DEFAULT_MODEL,
     config_dir: Optional[str] = None,
     streaming: bool = False,
+    infinite_sessions: Optional[InfiniteSessionConfig] = None,
+    routing: Optional[RoutingDecision] = None,
+    endpoint: Optional[FoundryEndpoint] = None,
 ) -> ResumeSessionConfig:
+    if routing is not None:
+        model = routing.model
+
     resume_config: ResumeSessionConfig = {
         "model": model,
         "streaming": streaming,
@@ -118,6 +193,9 @@ def _build_resume_config(
         "system_message": {"mode": "replace", "content": _AGENTS_MD_CONTENT_CACHE},
     }
 
+    if _is_byok_mode():
+        _apply_byok_provider(resume_config, routing, endpoint)  # type: ignore
+
     if config_dir:
         resume_config["config_dir"] = config_dir
 
@@ -125,89 +203,482 @@ def _build_resume_config(
     if mcp_servers:
         resume_config["mcp_servers"] = mcp_servers
 
+    if infinite_sessions:
+        resume_config["infinite_sessions"] = infinite_sessions
+
     return resume_config
 
 
+def _record_backend_outcome(
+    model: str,
+    endpoint: Optional[FoundryEndpoint],
+    seconds: Optional[float],
+    outcome: str,
+    status_code: Optional[int] = None,
+) -> None:
+    """Feed a finished turn into the model router and, in BYOK mode, the endpoint's breaker."""
+    MODEL_ROUTER.record(model, seconds or 0.0, ok=outcome == "ok")
+    if endpoint is not None:
+        PROVIDER_POOL.record(endpoint, seconds, outcome, status_code)
+
+
+# Events that show the model has started answering (used by hedging)
+_PROGRESS_EVENTS = frozenset(
+    ("assistant.message_delta", "assistant.message", "assistant.reasoning_delta", "tool.execution_start")
+)
+
+
+def _infinite_sessions_config(compaction_threshold: Optional[float]) -> Optional[InfiniteSessionConfig]:
+    """Enable SDK background history compaction at the given context utilization (0.0-1.0)."""
+    if compaction_threshold is None:
+        return None
+    return {"enabled": True, "background_compaction_threshold": compaction_threshold}
+
+
 async def run_copilot_agent(
     prompt: str,
     timeout: float = DEFAULT_TIMEOUT,
-    model: str = DEFAULT_MODEL,
+    model: Optional[str] = None,
     session_id: Optional[str] = None,
     streaming: bool = False,
+    route: Optional[str] = None,
+    traceparent: Optional[str] = None,
+    fields: Optional[Collection[str]] = None,
+    compaction_threshold: Optional[float] = None,
+    hedge: bool = False,
+    caller: Optional[str] = None,
+    tool_arguments: str = "full",
 ) -> AgentResult:
-    config_dir = resolve_config_dir()
-    client = await CopilotClientManager.get_client()
-
-    # Resume existing session or create a new one
-    if session_id and session_exists(config_dir, session_id):
-        logging.info(f"Resuming existing session: {session_id}")
-        resume_config = _build_resume_config(model=model, config_dir=config_dir)
-        session = await client.resume_session(session_id, resume_config)
-    else:
-        if session_id:
-            logging.info(f"Creating new session with provided ID: {session_id}")
-        session_config = _build_session_config(
-            model=model, config_dir=config_dir, session_id=session_id, streaming=streaming
+    """
+    Run one agent turn and collect the result.
+
+    `fields` limits what is collected to the response fields the caller will
+    serialize (see responses.RESPONSE_FIELDS); None collects everything,
+    including the raw event log. `compaction_threshold` turns on SDK history
+    compaction for long-lived sessions once context utilization passes it.
+    Leaving `model` unset lets the model router choose (see routing.py).
+    `hedge` allows a second session for slow sessionless turns (see hedging.py);
+    only set it for idempotent prompts. Token usage is accounted to `caller`
+    (see usage.py); QuotaExceededError is raised before any session is created
+    when the caller is over quota. `tool_arguments` shrinks collected tool call
+    arguments (see responses.TOOL_ARGUMENT_MODES) before large ones are spilled
+    to the artifact store.
+    """
+    USAGE_LEDGER.check_quota(caller or ANONYMOUS_CALLER)
+    # The endpoint decides the default model in BYOK mode, so it is picked before routing and hedging
+    endpoint, probe = PROVIDER_POOL.select() if _is_byok_mode() else (None, False)
+    try:
+        routing = _route_model(prompt, model, endpoint)
+        if hedge and not session_id and not streaming:
+            return await _run_hedged(prompt, timeout, routing, route, traceparent, fields, caller, tool_arguments, endpoint)
+        return await _run_turn(
+            prompt,
+            timeout,
+            routing,
+            session_id=session_id,
+            streaming=streaming,
+            route=route,
+            traceparent=traceparent,
+            fields=fields,
+            compaction_threshold=compaction_threshold,
+            caller=caller,
+            tool_arguments=tool_arguments,
+            endpoint=endpoint,
         )
-        session = await client.create_session(session_config)
-
-    response_content: List[str] = []
-    tool_calls: List[Dict[str, Any]] = []
-    reasoning_content: List[str] = []
-    events_log: List[Dict[str, Any]] = []
-
-    done = asyncio.Event()
-
-    def on_event(event):
-        event_type = event.type.value if hasattr(event.type, "value") else str(event.type)
-        events_log.append({"type": event_type, "data": str(event.data) if event.data else None})
-
-        if event_type == "assistant.message":
-            response_content.append(event.data.content)
-        elif event_type == "assistant.message_delta" and streaming:
-            if event.data.delta_content:
-                response_content.append(event.data.delta_content)
-        elif event_type == "assistant.reasoning_delta" and streaming:
-            if hasattr(event.data, "delta_content") and event.data.delta_content:
-                reasoning_content.append(event.data.delta_content)
-        elif event_type == "tool.execution_start":
-            tool_calls.append(
-                {
-                    "event_id": str(event.id) if hasattr(event, "id") and event.id else None,
-                    "timestamp": event.timestamp.isoformat() if hasattr(event, "timestamp") and event.timestamp else None,
-                    "tool_call_id": getattr(event.data, "tool_call_id", None),
-                    "tool_name": getattr(event.data, "tool_name", None),
-                    "arguments": getattr(event.data, "arguments", None),
-                    "parent_tool_call_id": getattr(event.data, "parent_tool_call_id", None),
-                }
-            )
-        elif event_type == "session.idle":
-            done.set()
-
-    session.on(on_event)
-
-    if streaming:
-        logging.info(f"Starting streaming session with ID: {session.session_id}")
-        return AgentResult(
-            session_id=session.session_id,
-            content=response_content[-1] if response_content else "",
-            content_intermediate=response_content[-6:-1] if len(response_content) > 1 else [],
-            tool_calls=tool_calls,
-            reasoning="".join(reasoning_content) if reasoning_content else None,
-            events=events_log,
+    finally:
+        if probe and endpoint is not None:
+            PROVIDER_POOL.release(endpoint)
+
+
+async def _new_session(client, session_config: SessionConfig, poolable: bool):
+    """
+    Claim a pre-created session for this config (see session_pool.py) or create one; returns (session, mode).
+
+    Pre-created sessions load every skill, so a config whose skill selection disables some always
+    creates its own session rather than claiming one that would ignore the selection.
+    """
+    if session_config.get("disabled_skills"):
+        poolable = False
+    session = SESSION_POOL.claim(client, session_config) if poolable else None  # type: ignore
+    if session is not None:
+        return session, "pool"
+    return await client.create_session(session_config), "create"
+
+
+async def _discard_session(client, session) -> None:
+    """Stop and delete a session whose result is no longer wanted (e.g. a losing hedge)."""
+    try:
+        await session.abort()
+        await session.destroy()
+        await client.delete_session(session.session_id)
+    except Exception as e:
+        logging.warning(f"Failed to discard session {session.session_id}: {e}")
+
+
+def _restore_session_state(state_path: str, backup_path: str) -> None:
+    """Put a session's state back from its compaction backup, dropping anything a failed replacement left."""
+    if not os.path.isdir(backup_path):
+        return
+    shutil.rmtree(state_path, True)
+    os.replace(backup_path, state_path)
+
+
+async def _compact_session(
+    client,
+    session,
+    prompt: str,
+    config_dir: Optional[str],
+    streaming: bool,
+    infinite_sessions: Optional[InfiniteSessionConfig],
+    routing: RoutingDecision,
+    endpoint: Optional[FoundryEndpoint],
+    route: Optional[str],
+):
+    """
+    Replace a long session with a compact one under the same ID.
+
+    Older turns are summarized by a throwaway tool-less session; the newest
+    KEEP_RECENT_TURNS user turns are kept verbatim. Both go into the prompt of
+    the replacement session, so later resumes see them as ordinary history.
+    The old session's state is set aside and only deleted once the replacement
+    exists; it is put back if creating the replacement fails or is cancelled.
+    Returns (session, prompt) - unchanged if there is nothing to compact or
+    summarization or replacement fails.
+    """
+    started = time.perf_counter()
+    session_id = session.session_id
+    older, recent = split_recent(transcript_turns(await session.get_messages()), KEEP_RECENT_TURNS)
+    if not older:
+        return session, prompt
+
+    summary_config = _build_session_config(config_dir=config_dir, routing=routing, endpoint=endpoint)
+    summary_config["system_message"] = {"mode": "replace", "content": SUMMARIZER_SYSTEM_MESSAGE}
+    summary_config["available_tools"] = SUMMARIZER_AVAILABLE_TOOLS
+    summary_config.pop("tools", None)
+    summary_config.pop("mcp_servers", None)
+    summary_session = await client.create_session(summary_config)
+    try:
+        reply = await summary_session.send_and_wait({"prompt": summary_prompt(older)}, timeout=SUMMARY_TIMEOUT)
+        summary = getattr(reply.data, "content", "") if reply is not None else ""
+    except Exception as e:
+        logging.warning(f"Skipping compaction of session {session_id}: summarization failed: {e}")
+        summary = ""
+    finally:
+        await _discard_session(client, summary_session)
+    if not summary:
+        return session, prompt
+
+    # The replacement needs the same ID, so set the old state aside and only delete it once the
+    # replacement exists; if creating it fails or is cancelled, put the old state back
+    await session.destroy()
+    state_path = session_state_path(config_dir, session_id)
+    backup_path = f"{state_path}.compacting"
+    session_config = _build_session_config(
+        config_dir=config_dir,
+        session_id=session_id,
+        streaming=streaming,
+        infinite_sessions=infinite_sessions,
+        routing=routing,
+        endpoint=endpoint,
+    )
+    new_session = None
+    try:
+        await asyncio.to_thread(os.replace, state_path, backup_path)
+        new_session = await client.create_session(session_config)
+    except Exception as e:
+        logging.warning(f"Skipping compaction of session {session_id}: creating the replacement failed: {e}")
+    finally:
+        if new_session is None:
+            # Runs on cancellation too (client disconnect, wait_for); the thread finishes even if the await is cancelled
+            await asyncio.to_thread(_restore_session_state, state_path, backup_path)
+    if new_session is None:
+        resume_config = _build_resume_config(
+            config_dir=config_dir, streaming=streaming, infinite_sessions=infinite_sessions, routing=routing, endpoint=endpoint
         )
+        return await client.resume_session(session_id, resume_config), prompt
+    await asyncio.to_thread(shutil.rmtree, backup_path, True)
+    new_prompt = compacted_prompt(summary, recent, prompt)
+    CONTEXT_TRACKER.compacted(session_id, route, estimate_tokens(new_prompt), time.perf_counter() - started)
+    return new_session, new_prompt
 
-    else:
-        await session.send_and_wait({"prompt": prompt}, timeout=timeout)
-
-        return AgentResult(
-            session_id=session.session_id,
-            content=response_content[-1] if response_content else "",
-            content_intermediate=response_content[-6:-1] if len(response_content) > 1 else [],
-            tool_calls=tool_calls,
-            reasoning="".join(reasoning_content) if reasoning_content else None,
-            events=events_log,
+
+async def _run_hedged(
+    prompt: str,
+    timeout: float,
+    routing: RoutingDecision,
+    route: Optional[str],
+    traceparent: Optional[str],
+    fields: Optional[Collection[str]],
+    caller: Optional[str],
+    tool_arguments: str = "full",
+    endpoint: Optional[FoundryEndpoint] = None,
+) -> AgentResult:
+    """
+    Run a sessionless turn, starting a second session if the first shows no
+    progress by the hedge delay. The first attempt to succeed wins and the
+    other is cancelled. The primary attempt's time to first progress feeds
+    the hedge delay; the turn counts once against the caller's quota. The
+    primary uses `endpoint`; the hedge picks its own endpoint but keeps the
+    routed model.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    hedge_ticket = HEDGE_POLICY.note_eligible()
+    primary_progress = asyncio.Event()
+    primary = asyncio.create_task(
+        _run_turn(
+            prompt, timeout, routing, route=route, traceparent=traceparent, fields=fields, caller=caller,
+            tool_arguments=tool_arguments, progress=primary_progress, endpoint=endpoint,
         )
+    )
+
+    delay = HEDGE_POLICY.delay(routing.model)
+    if delay is None:
+        HEDGE_POLICY.count(route, "no_history")
+        return await primary
+
+    progress_wait = asyncio.create_task(primary_progress.wait())
+    done, _ = await asyncio.wait({primary, progress_wait}, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+    progress_wait.cancel()
+    if done:
+        HEDGE_POLICY.count(route, "not_needed")
+        return await primary
+    if not HEDGE_POLICY.try_acquire(hedge_ticket):
+        HEDGE_POLICY.count(route, "no_budget")
+        return await primary
+
+    HEDGE_POLICY.count(route, "issued")
+    logging.info(f"Hedging turn on model={routing.model}: no progress after {delay:.2f}s")
+    remaining = max(0.0, timeout - (loop.time() - started))
+    # The hedge's tokens are real spend, but it is the same request, so it is not counted as another turn
+    hedge = asyncio.create_task(
+        _run_turn(
+            prompt, remaining, routing, route=route, traceparent=traceparent, fields=fields, caller=caller,
+            tool_arguments=tool_arguments, count_turn=False,
+        )
+    )
+
+    pending = {primary, hedge}
+    winner: Optional[asyncio.Task] = None
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is None:
+                    winner = task
+                    break
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    if winner is None:
+        # Both attempts failed: surface the primary's error
+        return primary.result()
+    HEDGE_POLICY.count(route, "won" if winner is hedge else "lost")
+    result = winner.result()
+    if result.routing is not None:
+        result.routing["hedged"] = True
+        result.routing["hedge_won"] = winner is hedge
+    return result
+
+
+async def _run_turn(
+    prompt: str,
+    timeout: float,
+    routing: RoutingDecision,
+    session_id: Optional[str] = None,
+    streaming: bool = False,
+    route: Optional[str] = None,
+    traceparent: Optional[str] = None,
+    fields: Optional[Collection[str]] = None,
+    compaction_threshold: Optional[float] = None,
+    caller: Optional[str] = None,
+    tool_arguments: str = "full",
+    progress: Optional[asyncio.Event] = None,
+    count_turn: bool = True,
+    endpoint: Optional[FoundryEndpoint] = None,
+) -> AgentResult:
+    infinite_sessions = _infinite_sessions_config(compaction_threshold)
+    # A caller that passes `endpoint` owns its half-open probe; otherwise (a hedge) pick one here
+    probe = False
+    if endpoint is None and _is_byok_mode():
+        endpoint, probe = PROVIDER_POOL.select()
+    try:
+        config_dir = resolve_config_dir()
+        async with CopilotClientManager.lease() as client:
+            timer = TurnTimer(route, routing.model)
+            trace = TurnTrace(route or "agent", traceparent, {"route": route, "streaming": streaming})
+            recorder = start_recording(route, streaming)
+            usage = TurnUsage(caller, route, routing.model, count_turn=count_turn)
+
+            # Resume existing session or create a new one
+            if session_id and session_exists(config_dir, session_id):
+                setup_span = trace.start_span("session.resume", attributes={"session_id": session_id})
+                logging.info(f"Resuming existing session: {session_id}")
+                resume_config = _build_resume_config(
+                    config_dir=config_dir, infinite_sessions=infinite_sessions, routing=routing, endpoint=endpoint
+                )
+                timer.model = resume_config["model"]
+                session = await client.resume_session(session_id, resume_config)
+                timer.session_ready("resume")
+                if recorder:
+                    recorder.session_ready("resume")
+                resumed = True
+            else:
+                resumed = False
+                setup_span = trace.start_span("session.create", attributes={"session_id": session_id})
+                if session_id:
+                    logging.info(f"Creating new session with provided ID: {session_id}")
+                session_config = _build_session_config(
+                    config_dir=config_dir,
+                    session_id=session_id,
+                    streaming=streaming,
+                    infinite_sessions=infinite_sessions,
+                    routing=routing,
+                    endpoint=endpoint,
+                    prompt=prompt,
+                )
+                timer.model = session_config["model"]
+                poolable = not session_id and not infinite_sessions and routing.reason == "default"
+                session, mode = await _new_session(client, session_config, poolable)
+                setup_span.attributes["pooled"] = mode == "pool"
+                timer.session_ready(mode)
+                if recorder:
+                    recorder.session_ready(mode)
+            setup_span.end()
+            if resumed and not streaming and CONTEXT_TRACKER.needs_compaction(session.session_id):
+                compact_span = trace.start_span("context.compact", attributes={"session_id": session.session_id})
+                session, prompt = await _compact_session(
+                    client, session, prompt, config_dir, streaming, infinite_sessions, routing, endpoint, route
+                )
+                compact_span.end()
+            trace.root.attributes.update({"session_id": session.session_id, "model": timer.model, "routing.reason": routing.reason})
+            usage.model = timer.model
+
+            response_content: List[str] = []
+            tool_calls: List[Dict[str, Any]] = []
+            reasoning_content: List[str] = []
+            events_log: List[Dict[str, Any]] = []
+
+            done = asyncio.Event()
+            error_status_code: Optional[int] = None
+
+            collect_events = fields is None
+            collect_intermediate = fields is None or "response_intermediate" in fields
+            collect_tool_calls = fields is None or "tool_calls" in fields
+
+            def on_event(event):
+                nonlocal error_status_code
+                event_type = event.type.value if hasattr(event.type, "value") else str(event.type)
+                if collect_events:
+                    events_log.append({"type": event_type, "data": str(event.data) if event.data else None})
+                timer.on_event(event_type, event.data)
+                trace.on_event(event_type, event.data)
+                if recorder:
+                    recorder.on_event(event_type, event.data)
+                usage.on_event(event_type, event.data)
+                CONTEXT_TRACKER.observe(session.session_id, route, event_type, event.data)
+
+                if progress is not None and event_type in _PROGRESS_EVENTS and not progress.is_set():
+                    HEDGE_POLICY.record_first_progress(timer.model, timer.elapsed())
+                    progress.set()
+
+                if event_type == "assistant.message":
+                    if not collect_intermediate:
+                        response_content.clear()
+                    response_content.append(event.data.content)
+                elif event_type == "assistant.message_delta" and streaming:
+                    if event.data.delta_content:
+                        response_content.append(event.data.delta_content)
+                elif event_type == "assistant.reasoning_delta" and streaming:
+                    if hasattr(event.data, "delta_content") and event.data.delta_content:
+                        reasoning_content.append(event.data.delta_content)
+                elif event_type == "tool.execution_start" and collect_tool_calls:
+                    # Shrink first, so only arguments that are still large get written to the store
+                    arguments = shrink_arguments(getattr(event.data, "arguments", None), tool_arguments)
+                    call = {
+                        "event_id": str(event.id) if hasattr(event, "id") and event.id else None,
+                        "timestamp": event.timestamp.isoformat() if hasattr(event, "timestamp") and event.timestamp else None,
+                        "tool_call_id": getattr(event.data, "tool_call_id", None),
+                        "tool_name": getattr(event.data, "tool_name", None),
+                        "arguments": ARTIFACT_STORE.spill(arguments, "tool_arguments"),
+                        "parent_tool_call_id": getattr(event.data, "parent_tool_call_id", None),
+                    }
+                    if tool_arguments == "omit":
+                        del call["arguments"]
+                    tool_calls.append(call)
+                elif event_type == "session.error":
+                    error_status_code = getattr(event.data, "status_code", None)
+                elif event_type == "session.idle":
+                    done.set()
+
+            session.on(on_event)
+
+            if streaming:
+                logging.info(f"Starting streaming session with ID: {session.session_id}")
+                return AgentResult(
+                    session_id=session.session_id,
+                    content=response_content[-1] if response_content else "",
+                    content_intermediate=response_content[-6:-1] if len(response_content) > 1 else [],
+                    tool_calls=tool_calls,
+                    reasoning="".join(reasoning_content) if reasoning_content else None,
+                    events=events_log,
+                    routing=routing.to_dict(),
+                )
+
+            else:
+                timer.prompt_sent()
+                if recorder:
+                    recorder.prompt_sent()
+                try:
+                    await session.send_and_wait({"prompt": prompt}, timeout=timeout)
+                except asyncio.TimeoutError:
+                    _record_backend_outcome(timer.model, endpoint, timer.finish("timeout"), "timeout", error_status_code)
+                    trace.finish("timeout")
+                    if recorder:
+                        recorder.finish("timeout")
+                    usage.finish()
+                    raise
+                except asyncio.CancelledError:
+                    # Cancelled by the caller (e.g. a losing hedge): not a model failure
+                    timer.finish("cancelled")
+                    trace.finish("cancelled")
+                    if recorder:
+                        recorder.finish("cancelled")
+                    usage.finish()
+                    await _discard_session(client, session)
+                    raise
+                except Exception:
+                    _record_backend_outcome(timer.model, endpoint, timer.finish("error"), "error", error_status_code)
+                    trace.finish("error")
+                    if recorder:
+                        recorder.finish("error")
+                    usage.finish()
+                    raise
+                _record_backend_outcome(timer.model, endpoint, timer.finish(), "ok")
+                trace.finish()
+                if recorder:
+                    recorder.finish()
+                usage.finish()
+                context = CONTEXT_TRACKER.turn_finished(
+                    session.session_id, route, len(prompt) + sum(len(text) for text in response_content)
+                )
+
+                return AgentResult(
+                    session_id=session.session_id,
+                    content=response_content[-1] if response_content else "",
+                    content_intermediate=response_content[-6:-1] if len(response_content) > 1 else [],
+                    tool_calls=tool_calls,
+                    reasoning="".join(reasoning_content) if reasoning_content else None,
+                    events=events_log,
+                    routing=routing.to_dict(),
+                    context=context.to_dict(),
+                )
+    finally:
+        if probe and endpoint is not None:
+            PROVIDER_POOL.release(endpoint)
 
 
 _STREAM_SENTINEL = object()
@@ -216,102 +687,180 @@ _STREAM_SENTINEL = object()
 async def run_copilot_agent_stream(
     prompt: str,
     timeout: float = DEFAULT_TIMEOUT,
-    model: str = DEFAULT_MODEL,
+    model: Optional[str] = None,
     session_id: Optional[str] = None,
+    route: Optional[str] = None,
+    traceparent: Optional[str] = None,
+    caller: Optional[str] = None,
 ):
     """Async generator that yields SSE-formatted events as the agent streams a response.
 
-    Yields strings like 'data: {"type": "delta", ...}\\n\\n' suitable for StreamingResponse.
+    Yields pre-encoded bytes like b'data: {"type":"delta",...}\\n\\n' suitable for StreamingResponse.
+    Frames are serialized once in the event callback so the drain loop only forwards bytes.
     """
-    config_dir = resolve_config_dir()
-    client = await CopilotClientManager.get_client()
-
-    if session_id and session_exists(config_dir, session_id):
-        logging.info(f"[stream] Resuming existing session: {session_id}")
-        resume_config = _build_resume_config(model=model, config_dir=config_dir, streaming=True)
-        session = await client.resume_session(session_id, resume_config)
-    else:
-        if session_id:
-            logging.info(f"[stream] Creating new session with provided ID: {session_id}")
-        session_config = _build_session_config(
-            model=model, config_dir=config_dir, session_id=session_id, streaming=True
-        )
-        session = await client.create_session(session_config)
-
-    queue: asyncio.Queue = asyncio.Queue()
-    accept_events = False
-    seen_event_ids: set[str] = set()
-
-    def on_event(event):
-        nonlocal accept_events
-        event_type = event.type.value if hasattr(event.type, "value") else str(event.type)
-        event_id = str(event.id) if hasattr(event, "id") and event.id else None
-
-        if not accept_events:
-            return
-
-        if event_id:
-            if event_id in seen_event_ids:
-                return
-            seen_event_ids.add(event_id)
-
-        if event_type == "assistant.message_delta":
-            delta = getattr(event.data, "delta_content", None)
-            if delta:
-                queue.put_nowait({"type": "delta", "content": delta})
-        elif event_type == "assistant.reasoning_delta":
-            reasoning_delta = getattr(event.data, "delta_content", None)
-            if reasoning_delta:
-                queue.put_nowait({"type": "intermediate", "content": reasoning_delta})
-        elif event_type == "assistant.message":
-            message_content = getattr(event.data, "content", "")
-            queue.put_nowait({"type": "message", "content": message_content})
-        elif event_type == "tool.execution_start":
-            queue.put_nowait({
-                "type": "tool_start",
-                "event_id": str(event.id) if hasattr(event, "id") and event.id else None,
-                "timestamp": event.timestamp.isoformat() if hasattr(event, "timestamp") and event.timestamp else None,
-                "tool_name": getattr(event.data, "tool_name", None),
-                "tool_call_id": getattr(event.data, "tool_call_id", None),
-                "parent_tool_call_id": getattr(event.data, "parent_tool_call_id", None),
-                "arguments": getattr(event.data, "arguments", None),
-            })
-        elif event_type == "tool.execution_end":
-            queue.put_nowait({
-                "type": "tool_end",
-                "event_id": str(event.id) if hasattr(event, "id") and event.id else None,
-                "timestamp": event.timestamp.isoformat() if hasattr(event, "timestamp") and event.timestamp else None,
-                "tool_name": getattr(event.data, "tool_name", None),
-                "tool_call_id": getattr(event.data, "tool_call_id", None),
-                "parent_tool_call_id": getattr(event.data, "parent_tool_call_id", None),
-                "result": getattr(event.data, "result", None),
-            })
-        elif event_type == "session.idle":
-            queue.put_nowait(_STREAM_SENTINEL)
-
-    session.on(on_event)
-
-    # Yield the session ID first so the client knows it immediately
-    yield f"data: {json.dumps({'type': 'session', 'session_id': session.session_id})}\n\n"
-
-    # Fire-and-forget: send the prompt, events arrive via on_event callback
-    accept_events = True
-    await session.send({"prompt": prompt})
-
-    # Drain the queue until session.idle sentinel arrives or timeout
+    USAGE_LEDGER.check_quota(caller or ANONYMOUS_CALLER)
+    endpoint, probe = PROVIDER_POOL.select() if _is_byok_mode() else (None, False)
     try:
-        deadline = asyncio.get_event_loop().time() + timeout
-        while True:
-            remaining = deadline - asyncio.get_event_loop().time()
-            if remaining <= 0:
-                yield f"data: {json.dumps({'type': 'error', 'content': 'Timeout waiting for response'})}\n\n"
-                break
-
-            item = await asyncio.wait_for(queue.get(), timeout=remaining)
-            if item is _STREAM_SENTINEL:
-                yield f"data: {json.dumps({'type': 'done'})}\n\n"
-                break
-
-            yield f"data: {json.dumps(item)}\n\n"
-    except asyncio.TimeoutError:
-        yield f"data: {json.dumps({'type': 'error', 'content': 'Timeout waiting for response'})}\n\n"
+        routing = _route_model(prompt, model, endpoint)
+        config_dir = resolve_config_dir()
+        async with CopilotClientManager.lease() as client:
+            timer = TurnTimer(route, routing.model)
+            trace = TurnTrace(route or "agent", traceparent, {"route": route, "streaming": True})
+            recorder = start_recording(route, True)
+            usage = TurnUsage(caller, route, routing.model)
+
+            if session_id and session_exists(config_dir, session_id):
+                setup_span = trace.start_span("session.resume", attributes={"session_id": session_id})
+                logging.info(f"[stream] Resuming existing session: {session_id}")
+                resume_config = _build_resume_config(config_dir=config_dir, streaming=True, routing=routing, endpoint=endpoint)
+                timer.model = resume_config["model"]
+                session = await client.resume_session(session_id, resume_config)
+                timer.session_ready("resume")
+                if recorder:
+                    recorder.session_ready("resume")
+                resumed = True
+            else:
+                resumed = False
+                setup_span = trace.start_span("session.create", attributes={"session_id": session_id})
+                if session_id:
+                    logging.info(f"[stream] Creating new session with provided ID: {session_id}")
+                session_config = _build_session_config(
+                    config_dir=config_dir,
+                    session_id=session_id,
+                    streaming=True,
+                    routing=routing,
+                    endpoint=endpoint,
+                    prompt=prompt,
+                )
+                timer.model = session_config["model"]
+                session, mode = await _new_session(client, session_config, not session_id and routing.reason == "default")
+                setup_span.attributes["pooled"] = mode == "pool"
+                timer.session_ready(mode)
+                if recorder:
+                    recorder.session_ready(mode)
+            setup_span.end()
+            if resumed and CONTEXT_TRACKER.needs_compaction(session.session_id):
+                compact_span = trace.start_span("context.compact", attributes={"session_id": session.session_id})
+                session, prompt = await _compact_session(
+                    client, session, prompt, config_dir, True, None, routing, endpoint, route
+                )
+                compact_span.end()
+            trace.root.attributes.update({"session_id": session.session_id, "model": timer.model, "routing.reason": routing.reason})
+            usage.model = timer.model
+
+            queue: asyncio.Queue = asyncio.Queue()
+            accept_events = False
+            seen_event_ids: set[str] = set()
+            session_failed = False
+            error_status_code: Optional[int] = None
+            response_chars = 0
+
+            def on_event(event):
+                nonlocal accept_events, session_failed, error_status_code, response_chars
+                event_type = event.type.value if hasattr(event.type, "value") else str(event.type)
+                event_id = str(event.id) if hasattr(event, "id") and event.id else None
+
+                if not accept_events:
+                    return
+
+                if event_id:
+                    if event_id in seen_event_ids:
+                        return
+                    seen_event_ids.add(event_id)
+
+                timer.on_event(event_type, event.data)
+                trace.on_event(event_type, event.data)
+                if recorder:
+                    recorder.on_event(event_type, event.data)
+                usage.on_event(event_type, event.data)
+                CONTEXT_TRACKER.observe(session.session_id, route, event_type, event.data)
+
+                if event_type == "assistant.message_delta":
+                    delta = getattr(event.data, "delta_content", None)
+                    if delta:
+                        queue.put_nowait(sse_frame({"type": "delta", "content": delta}))
+                elif event_type == "assistant.reasoning_delta":
+                    reasoning_delta = getattr(event.data, "delta_content", None)
+                    if reasoning_delta:
+                        queue.put_nowait(sse_frame({"type": "intermediate", "content": reasoning_delta}))
+                elif event_type == "assistant.message":
+                    message_content = getattr(event.data, "content", "")
+                    response_chars += len(message_content or "")
+                    queue.put_nowait(sse_frame({"type": "message", "content": message_content}))
+                elif event_type == "tool.execution_start":
+                    queue.put_nowait(sse_frame({
+                        "type": "tool_start",
+                        "event_id": str(event.id) if hasattr(event, "id") and event.id else None,
+                        "timestamp": event.timestamp.isoformat() if hasattr(event, "timestamp") and event.timestamp else None,
+                        "tool_name": getattr(event.data, "tool_name", None),
+                        "tool_call_id": getattr(event.data, "tool_call_id", None),
+                        "parent_tool_call_id": getattr(event.data, "parent_tool_call_id", None),
+                        "arguments": ARTIFACT_STORE.spill(getattr(event.data, "arguments", None), "tool_arguments"),
+                    }))
+                elif event_type == "tool.execution_end":
+                    queue.put_nowait(sse_frame({
+                        "type": "tool_end",
+                        "event_id": str(event.id) if hasattr(event, "id") and event.id else None,
+                        "timestamp": event.timestamp.isoformat() if hasattr(event, "timestamp") and event.timestamp else None,
+                        "tool_name": getattr(event.data, "tool_name", None),
+                        "tool_call_id": getattr(event.data, "tool_call_id", None),
+                        "parent_tool_call_id": getattr(event.data, "parent_tool_call_id", None),
+                        "result": ARTIFACT_STORE.spill(getattr(event.data, "result", None), "tool_result"),
+                    }))
+                elif event_type == "session.error":
+                    session_failed = True
+                    error_status_code = getattr(event.data, "status_code", None)
+                elif event_type == "session.idle":
+                    queue.put_nowait(_STREAM_SENTINEL)
+
+            session.on(on_event)
+
+            # Closing the generator early (client disconnect) leaves "cancelled": not a model failure
+            outcome = "cancelled"
+            try:
+                # Yield the session ID first so the client knows it immediately
+                yield sse_frame({"type": "session", "session_id": session.session_id, "routing": routing.to_dict()})
+
+                # Fire-and-forget: send the prompt, events arrive via on_event callback
+                accept_events = True
+                timer.prompt_sent()
+                if recorder:
+                    recorder.prompt_sent()
+                await session.send({"prompt": prompt})
+
+                # Drain the queue until session.idle sentinel arrives or timeout
+                deadline = asyncio.get_event_loop().time() + timeout
+                while True:
+                    remaining = deadline - asyncio.get_event_loop().time()
+                    if remaining <= 0:
+                        outcome = "timeout"
+                        yield SSE_TIMEOUT_FRAME
+                        break
+
+                    item = await asyncio.wait_for(queue.get(), timeout=remaining)
+                    if item is _STREAM_SENTINEL:
+                        outcome = "ok"
+                        yield SSE_DONE_FRAME
+                        break
+
+                    yield item
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                yield SSE_TIMEOUT_FRAME
+            except Exception:
+                outcome = "error"
+                raise
+            finally:
+                if outcome == "ok" and session_failed:
+                    outcome = "error"
+                seconds = timer.finish(outcome)
+                if outcome != "cancelled":
+                    _record_backend_outcome(timer.model, endpoint, seconds, outcome, error_status_code)
+                trace.finish(outcome)
+                if recorder:
+                    recorder.finish(outcome)
+                usage.finish()
+                CONTEXT_TRACKER.turn_finished(session.session_id, route, len(prompt) + response_chars)
+    finally:
+        if probe and endpoint is not None:
+            PROVIDER_POOL.release(endpoint)
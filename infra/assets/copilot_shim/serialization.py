@@ -0,0 +1,61 @@
+import dataclasses
+import enum
+import json
+from typing import Any
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover - optional fast path
+    orjson = None
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+def _default(obj: Any) -> Any:
+    """Fallback for SDK objects (generated event dataclasses, enums) inside payloads."""
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if isinstance(obj, enum.Enum):
+        return obj.value
+    return str(obj)
+
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_default)
+
+
+def _stdlib_dumps_bytes(obj: Any) -> bytes:
+    return _ENCODER.encode(obj).encode("utf-8")
+
+
+if orjson is not None:
+    # Dataclasses go through _default (the SDK's camelCase to_dict), so output matches the stdlib encoder
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialize to compact UTF-8 JSON bytes, ready to send."""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+else:
+
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialize to compact UTF-8 JSON bytes, ready to send."""
+        return _stdlib_dumps_bytes(obj)
+
+
+def dumps_str(obj: Any) -> str:
+    """Compact JSON as str, for callers whose binding requires text (e.g. MCP tool triggers)."""
+    return dumps_bytes(obj).decode("utf-8")
+
+
+def sse_frame(obj: Any) -> bytes:
+    """Encode one Server-Sent Events data frame."""
+    return b"data: " + dumps_bytes(obj) + b"\n\n"
+
+
+# Constant frames are encoded once at import time
+SSE_DONE_FRAME = sse_frame({"type": "done"})
+SSE_TIMEOUT_FRAME = sse_frame({"type": "error", "content": "Timeout waiting for response"})
+SSE_MISSING_PROMPT_FRAME = sse_frame({"type": "error", "content": "Missing prompt"})
+JSON_MISSING_PROMPT = dumps_bytes({"error": "Missing 'prompt'"})
@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional, Set
+
+from .client_manager import CopilotClientManager
+from .metrics import REGISTRY
+
+_POOL_SIZE = int(os.environ.get("COPILOT_SESSION_POOL_SIZE", "2"))
+_POOL_MAX_IDLE_SECONDS = float(os.environ.get("COPILOT_SESSION_POOL_MAX_IDLE_SECONDS", "600"))
+# Distinct configs kept warm (e.g. streaming and non-streaming, one per BYOK endpoint)
+_POOL_MAX_CONFIGS = int(os.environ.get("COPILOT_SESSION_POOL_MAX_CONFIGS", "8"))
+# Weight of the newest create_session() time in the setup time saved per hit
+_SETUP_EWMA_ALPHA = 0.2
+
+_POOL_SIZE_GAUGE = REGISTRY.gauge("copilot_shim_session_pool_size", "Pre-created sessions waiting to be claimed.")
+_POOL_CLAIMS = REGISTRY.counter(
+    "copilot_shim_session_pool_claims_total", "New-session turns that found a pre-created session (hit) or not (miss).", ("result",)
+)
+_POOL_SECONDS_SAVED = REGISTRY.counter(
+    "copilot_shim_session_pool_seconds_saved_total", "Estimated session setup time taken off the request path by pool hits."
+)
+_POOL_DISCARDS = REGISTRY.counter(
+    "copilot_shim_session_pool_discards_total", "Pre-created sessions dropped without being used.", ("reason",)
+)
+
+
+def config_fingerprint(config: Dict[str, Any]) -> str:
+    """Hash of everything in a session config that a pre-created session is bound to."""
+    tools = sorted(getattr(tool, "name", str(tool)) for tool in config.get("tools") or [])
+    rest = {key: value for key, value in config.items() if key != "tools"}
+    raw = json.dumps({"tools": tools, **rest}, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _config_slot(config: Dict[str, Any]) -> str:
+    # Configs in the same slot replace each other: a new fingerprint there means the config changed
+    provider = config.get("provider") or {}
+    return f"{config.get('streaming')}|{provider.get('base_url')}|{config.get('config_dir')}"
+
+
+@dataclass
+class _PooledSession:
+    session: Any
+    client: Any
+    created_at: float
+
+
+class SessionPool:
+    """
+    Pre-created sessions for new conversations with the default model and config.
+
+    A sessionless turn whose config matches a warm fingerprint claims an idle
+    session instead of waiting for create_session(); every claim (hit or miss)
+    schedules a background refill up to `size`. A new fingerprint for the same
+    slot (streaming flag, BYOK endpoint, config dir) means AGENTS.md, tools,
+    MCP servers, skills or the model changed, so the old sessions are
+    discarded. Pooled sessions load every skill; turns whose skill selection
+    disables some do not claim from the pool. Only the `max_configs` most recently
+    claimed configs are kept warm. Sessions from a recycled client or idle
+    longer than `max_idle` are dropped on claim.
+    """
+
+    def __init__(self, size: int = _POOL_SIZE, max_idle: float = _POOL_MAX_IDLE_SECONDS, max_configs: int = _POOL_MAX_CONFIGS):
+        self.size = size
+        self.max_idle = max_idle
+        self.max_configs = max(1, max_configs)
+        self._idle: "OrderedDict[str, Deque[_PooledSession]]" = OrderedDict()
+        self._configs: Dict[str, Dict[str, Any]] = {}
+        self._slots: Dict[str, str] = {}
+        self._refilling: Set[str] = set()
+        # Background refills and discards; referenced until done so they are not garbage-collected
+        self._tasks: Set[asyncio.Task] = set()
+        self._setup_seconds: Optional[float] = None
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _update_size(self) -> None:
+        _POOL_SIZE_GAUGE.set(sum(len(idle) for idle in self._idle.values()))
+
+    def _drop(self, fingerprint: str, reason: str) -> None:
+        idle = self._idle.pop(fingerprint, None) or deque()
+        self._configs.pop(fingerprint, None)
+        for pooled in idle:
+            _POOL_DISCARDS.inc(reason=reason)
+            self._spawn(_discard(pooled))
+        self._update_size()
+
+    def invalidate(self, reason: str = "config") -> None:
+        """Discard every idle session, e.g. after the skills changed on disk (see SkillIndex.on_change)."""
+        for fingerprint in list(self._idle):
+            self._drop(fingerprint, reason)
+        self._slots.clear()
+
+    def claim(self, client, config: Dict[str, Any]):
+        """Return an idle session created with `config` on `client`, or None; refills in the background."""
+        if not self:
+            return None
+        fingerprint = config_fingerprint(config)
+        slot = _config_slot(config)
+        previous = self._slots.get(slot)
+        if previous != fingerprint:
+            if previous is not None:
+                logging.info(f"Session config changed ({previous} -> {fingerprint}); discarding pre-created sessions")
+                self._drop(previous, "config")
+            self._slots[slot] = fingerprint
+            self._configs[fingerprint] = dict(config)
+
+        session = None
+        idle = self._idle.setdefault(fingerprint, deque())
+        self._idle.move_to_end(fingerprint)
+        while len(self._idle) > self.max_configs:
+            evicted = next(iter(self._idle))
+            self._slots = {key: value for key, value in self._slots.items() if value != evicted}
+            self._drop(evicted, "evicted")
+        now = time.monotonic()
+        while idle:
+            pooled = idle.popleft()
+            if pooled.client is not client:
+                _POOL_DISCARDS.inc(reason="recycled")
+            elif now - pooled.created_at > self.max_idle:
+                _POOL_DISCARDS.inc(reason="expired")
+                self._spawn(_discard(pooled))
+            else:
+                session = pooled.session
+                break
+        self._update_size()
+
+        if session is not None:
+            _POOL_CLAIMS.inc(result="hit")
+            _POOL_SECONDS_SAVED.inc(self._setup_seconds or 0.0)
+        else:
+            _POOL_CLAIMS.inc(result="miss")
+        self._schedule_refill(fingerprint)
+        return session
+
+    def _schedule_refill(self, fingerprint: str) -> None:
+        if fingerprint in self._refilling:
+            return
+        self._refilling.add(fingerprint)
+        self._spawn(self._refill(fingerprint))
+
+    async def _refill(self, fingerprint: str) -> None:
+        try:
+            async with CopilotClientManager.lease() as client:
+                while True:
+                    config = self._configs.get(fingerprint)
+                    idle = self._idle.get(fingerprint)
+                    if config is None or idle is None or len(idle) >= self.size:
+                        return
+                    started = time.perf_counter()
+                    session = await client.create_session(config)  # type: ignore
+                    seconds = time.perf_counter() - started
+                    self._setup_seconds = (
+                        seconds
+                        if self._setup_seconds is None
+                        else _SETUP_EWMA_ALPHA * seconds + (1 - _SETUP_EWMA_ALPHA) * self._setup_seconds
+                    )
+                    pooled = _PooledSession(session=session, client=client, created_at=time.monotonic())
+                    if self._idle.get(fingerprint) is not idle:
+                        # Invalidated while the session was being created
+                        _POOL_DISCARDS.inc(reason="config")
+                        await _discard(pooled)
+                        return
+                    idle.append(pooled)
+                    self._update_size()
+        except Exception as e:
+            logging.warning(f"Failed to pre-create session for pool: {e}")
+        finally:
+            self._refilling.discard(fingerprint)
+
+
+async def _discard(pooled: _PooledSession) -> None:
+    try:
+        await pooled.session.destroy()
+        await pooled.client.delete_session(pooled.session.session_id)
+    except Exception as e:
+        logging.warning(f"Failed to discard pre-created session {pooled.session.session_id}: {e}")
+
+
+SESSION_POOL = SessionPool()
@@ -1,5 +1,38 @@
+import logging
+import math
 import os
-from typing import Optional
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import frontmatter
+
+from .metrics import REGISTRY
+
+# Skills exposed to a session; 0 exposes every skill (the CLI discovers them all)
+_SKILLS_TOP_K = int(os.environ.get("COPILOT_SKILLS_TOP_K", "5"))
+_SKILLS_REFRESH_SECONDS = float(os.environ.get("COPILOT_SKILLS_REFRESH_SECONDS", "10"))
+# BM25 parameters
+_BM25_K1 = 1.5
+_BM25_B = 0.75
+# Name and description are repeated so they outweigh the body
+_HEADER_WEIGHT = 3
+
+_SKILL_DIR_NAMES = ("skills", "Skills")
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do for from how i in is it me my of on or so that the this to use was what when "
+    "which with you your".split()
+)
+
+_SKILLS_INDEXED = REGISTRY.gauge("copilot_shim_skills_indexed", "SKILL.md files in the skill retrieval index.")
+_SKILL_RETRIEVAL_SECONDS = REGISTRY.histogram(
+    "copilot_shim_skill_retrieval_seconds",
+    "Time to pick the skills for a new session.",
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
 
 
 def resolve_session_directory_for_skills() -> Optional[str]:
@@ -20,13 +53,181 @@ def resolve_session_directory_for_skills() -> Optional[str]:
         os.path.join(cwd, ".github"),
         os.path.join(cwd, ".vscode"),
     ]
-    skill_dir_names = ("skills", "Skills")
 
     for root in candidate_roots:
         if not os.path.isdir(root):
             continue
-        for name in skill_dir_names:
+        for name in _SKILL_DIR_NAMES:
             if os.path.isdir(os.path.join(root, name)):
                 return root
 
     return None
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+@dataclass
+class Skill:
+    name: str
+    path: str  # the skill's directory (parent of SKILL.md)
+    length: int
+    term_counts: Counter
+
+
+def _skill_roots(session_directory: str) -> List[str]:
+    roots = [os.path.join(session_directory, name) for name in _SKILL_DIR_NAMES]
+    return [root for root in roots if os.path.isdir(root)]
+
+
+def _find_skill_files(skill_roots: List[str]) -> List[str]:
+    paths = []
+    for skills_root in skill_roots:
+        for root, _, files in os.walk(skills_root, followlinks=True):
+            if "SKILL.md" in files:
+                paths.append(os.path.join(root, "SKILL.md"))
+    return sorted(paths)
+
+
+def _load_skill(path: str) -> Optional[Skill]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            parsed = frontmatter.loads(f.read())
+    except Exception as e:
+        logging.warning(f"Failed to read skill {path}: {e}")
+        return None
+    skill_dir = os.path.dirname(path)
+    name = str(parsed.metadata.get("name") or os.path.basename(skill_dir))
+    header = f"{name.replace('-', ' ')} {parsed.metadata.get('description') or ''}"
+    tokens = tokenize(header) * _HEADER_WEIGHT + tokenize(parsed.content or "")
+    return Skill(name=name, path=skill_dir, length=len(tokens), term_counts=Counter(tokens))
+
+
+class SkillIndex:
+    """
+    BM25 index over SKILL.md files (frontmatter name/description and body).
+
+    Built from the directory found by resolve_session_directory_for_skills()
+    and rebuilt when a SKILL.md is added, removed or modified (checked at most
+    every `refresh_seconds`). select() returns the top-k skills for a prompt;
+    session_options() turns that into the SDK's skill_directories and
+    disabled_skills so a new session only loads those skills. With `top_k` 0,
+    no more skills than `top_k`, or a prompt that matches no skill, every
+    skill is loaded.
+    """
+
+    def __init__(self, top_k: int = _SKILLS_TOP_K, refresh_seconds: float = _SKILLS_REFRESH_SECONDS):
+        self.top_k = top_k
+        self.refresh_seconds = refresh_seconds
+        self.source_directory: Optional[str] = None
+        self.skill_roots: List[str] = []
+        self.skills: List[Skill] = []
+        self._document_frequency: Dict[str, int] = {}
+        self._average_length = 0.0
+        self._signature: Tuple = ()
+        self._checked_at = 0.0
+        self._listeners: List[Callable[[], None]] = []
+
+    def on_change(self, listener: Callable[[], None]) -> None:
+        """Call `listener` whenever the index is rebuilt because skills changed on disk."""
+        self._listeners.append(listener)
+
+    def _current_signature(self, paths: List[str]) -> Tuple:
+        signature = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def refresh(self, force: bool = False) -> None:
+        """Rebuild the index if the skill files changed since the last build."""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.refresh_seconds:
+            return
+        self._checked_at = now
+        source_directory = resolve_session_directory_for_skills()
+        skill_roots = _skill_roots(source_directory) if source_directory else []
+        paths = _find_skill_files(skill_roots)
+        signature = self._current_signature(paths)
+        if signature == self._signature and source_directory == self.source_directory:
+            return
+
+        started = time.perf_counter()
+        skills = [skill for skill in (_load_skill(path) for path in paths) if skill is not None]
+        document_frequency: Dict[str, int] = {}
+        for skill in skills:
+            for term in skill.term_counts:
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+
+        self.source_directory = source_directory
+        self.skill_roots = skill_roots
+        self.skills = skills
+        self._document_frequency = document_frequency
+        self._average_length = sum(skill.length for skill in skills) / len(skills) if skills else 0.0
+        self._signature = signature
+        _SKILLS_INDEXED.set(len(skills))
+        logging.info(
+            f"Indexed {len(skills)} skill(s) from {source_directory} in {(time.perf_counter() - started) * 1000:.1f}ms"
+        )
+        for listener in self._listeners:
+            listener()
+
+    @property
+    def enabled(self) -> bool:
+        return self.top_k > 0 and len(self.skills) > self.top_k
+
+    def _score(self, skill: Skill, query_terms: List[str]) -> float:
+        score = 0.0
+        count = len(self.skills)
+        for term in query_terms:
+            frequency = skill.term_counts.get(term)
+            if not frequency:
+                continue
+            document_frequency = self._document_frequency.get(term, 0)
+            idf = math.log(1 + (count - document_frequency + 0.5) / (document_frequency + 0.5))
+            norm = 1 - _BM25_B + _BM25_B * skill.length / (self._average_length or 1.0)
+            score += idf * frequency * (_BM25_K1 + 1) / (frequency + _BM25_K1 * norm)
+        return score
+
+    def select(self, prompt: str) -> List[Tuple[Skill, float]]:
+        """Top-k skills with a positive BM25 score for the prompt, best first."""
+        query_terms = list(dict.fromkeys(tokenize(prompt)))
+        scored = [(skill, self._score(skill, query_terms)) for skill in self.skills]
+        ranked = sorted((item for item in scored if item[1] > 0), key=lambda item: (-item[1], item[0].name))
+        return ranked[: self.top_k]
+
+    def session_options(self, prompt: Optional[str] = None) -> Dict[str, List[str]]:
+        """
+        skill_directories and disabled_skills for a new session's config.
+
+        With a prompt, every indexed skill that is not among its top-k matches
+        is disabled. Without a prompt, or when nothing matches it (a BM25 miss
+        says nothing about which skills the turn needs), all skills are loaded.
+        """
+        self.refresh()
+        options: Dict[str, List[str]] = {}
+        if self.skill_roots:
+            options["skill_directories"] = list(self.skill_roots)
+        if not prompt or not self.enabled:
+            return options
+
+        started = time.perf_counter()
+        selected = self.select(prompt)
+        seconds = time.perf_counter() - started
+        _SKILL_RETRIEVAL_SECONDS.observe(seconds)
+        if not selected:
+            logging.info(f"No skill matched prompt ({len(prompt)} chars) in {seconds * 1000:.2f}ms; loading all skills")
+            return options
+        selected_names = {skill.name for skill, _ in selected}
+        options["disabled_skills"] = sorted({skill.name for skill in self.skills} - selected_names)
+        names = ", ".join(f"{skill.name} ({score:.2f})" for skill, score in selected)
+        logging.info(f"Selected skills in {seconds * 1000:.2f}ms for prompt ({len(prompt)} chars): {names}")
+        return options
+
+
+SKILL_INDEX = SkillIndex()
+SKILL_INDEX.refresh(force=True)
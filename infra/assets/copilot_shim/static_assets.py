@@ -0,0 +1,134 @@
+import gzip
+import hashlib
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+try:
+    import brotli  # type: ignore
+except ImportError:  # pragma: no cover - optional
+    brotli = None
+
+# Preference order when the client accepts several encodings equally
+_ENCODING_PREFERENCE = ("br", "gzip", "identity")
+_PRECOMPRESSED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """Map each coding in an Accept-Encoding header to its q-value (1.0 when none is given)."""
+    accepted: Dict[str, float] = {}
+    if not header:
+        return accepted
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token] = quality
+    return accepted
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    # Weak comparison is what If-None-Match uses (RFC 9110 13.1.2)
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def _read_precompressed(path: str, encoding: str, source_mtime: float) -> Optional[bytes]:
+    compressed_path = path + _PRECOMPRESSED_SUFFIXES[encoding]
+    try:
+        if os.path.getmtime(compressed_path) < source_mtime:
+            logging.info(f"Ignoring stale precompressed asset {compressed_path}")
+            return None
+        with open(compressed_path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+@dataclass
+class StaticAsset:
+    """
+    A static file held in memory with precompressed variants and a strong ETag.
+
+    Variants are keyed by content coding ("identity", "gzip", "br"). Files named
+    <path>.gz / <path>.br produced at package time are used when present and not
+    older than the source; otherwise variants are compressed once at load.
+    """
+
+    media_type: str
+    cache_control: str
+    digest: str
+    variants: Dict[str, bytes] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: str, media_type: str, cache_control: str = "no-cache") -> Optional["StaticAsset"]:
+        try:
+            with open(path, "rb") as f:
+                body = f.read()
+            source_mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+
+        variants: Dict[str, bytes] = {"identity": body}
+        gzip_body = _read_precompressed(path, "gzip", source_mtime)
+        variants["gzip"] = gzip_body if gzip_body is not None else gzip.compress(body, compresslevel=9, mtime=0)
+        br_body = _read_precompressed(path, "br", source_mtime)
+        if br_body is None and brotli is not None:
+            br_body = brotli.compress(body, quality=11)
+        if br_body is not None:
+            variants["br"] = br_body
+
+        asset = cls(
+            media_type=media_type,
+            cache_control=cache_control,
+            digest=hashlib.sha256(body).hexdigest()[:32],
+            variants=variants,
+        )
+        logging.info(
+            f"Loaded static asset {path}: "
+            + ", ".join(f"{encoding}={len(data)}B" for encoding, data in variants.items())
+        )
+        return asset
+
+    def etag(self, encoding: str) -> str:
+        # Strong ETags must differ per content coding
+        return f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+
+    def select_encoding(self, accept_encoding: Optional[str]) -> str:
+        accepted = parse_accept_encoding(accept_encoding)
+        wildcard = accepted.get("*", 0.0)
+        best, best_quality = "identity", 0.0
+        for encoding in _ENCODING_PREFERENCE:
+            if encoding not in self.variants or encoding == "identity":
+                continue
+            quality = accepted.get(encoding, wildcard)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def respond(self, if_none_match: Optional[str], accept_encoding: Optional[str]) -> Tuple[int, bytes, Dict[str, str]]:
+        """Return (status_code, body, headers) for a GET of this asset."""
+        encoding = self.select_encoding(accept_encoding)
+        etag = self.etag(encoding)
+        headers = {
+            "ETag": etag,
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if _etag_matches(if_none_match, etag):
+            return 304, b"", headers
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return 200, self.variants[encoding], headers
+
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from .metrics import REGISTRY
+
+try:
+    import psutil  # type: ignore
+except ImportError:  # pragma: no cover - optional
+    psutil = None
+
+_HEALTH_INTERVAL_SECONDS = float(os.environ.get("COPILOT_CLI_HEALTH_INTERVAL_SECONDS", "30"))
+_MAX_RSS_MB = float(os.environ.get("COPILOT_CLI_MAX_RSS_MB", "1024"))
+_MAX_CPU_PERCENT = float(os.environ.get("COPILOT_CLI_MAX_CPU_PERCENT", "0"))
+_MAX_OPEN_HANDLES = int(os.environ.get("COPILOT_CLI_MAX_OPEN_HANDLES", "0"))
+# Consecutive bad samples before recycling, so short spikes are ignored
+_RECYCLE_AFTER_SAMPLES = int(os.environ.get("COPILOT_CLI_RECYCLE_AFTER_SAMPLES", "3"))
+
+_CLI_RSS_BYTES = REGISTRY.gauge("copilot_shim_cli_rss_bytes", "Resident memory of the Copilot CLI process.")
+_CLI_CPU_PERCENT = REGISTRY.gauge(
+    "copilot_shim_cli_cpu_percent", "CPU use of the Copilot CLI process since the previous sample (100 = one core)."
+)
+_CLI_OPEN_HANDLES = REGISTRY.gauge("copilot_shim_cli_open_handles", "Open file descriptors/handles of the Copilot CLI process.")
+_CLI_RECYCLES = REGISTRY.counter(
+    "copilot_shim_cli_recycles_total", "Copilot CLI client recycles by the threshold that triggered them.", ("reason",)
+)
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+@dataclass
+class ProcessSample:
+    rss_bytes: int
+    cpu_seconds: float
+    open_handles: Optional[int]
+
+
+def _sample_proc(pid: int) -> Optional[ProcessSample]:
+    """Read RSS, CPU time and fd count from /proc (Linux)."""
+    try:
+        with open(f"/proc/{pid}/stat", "r", encoding="utf-8") as f:
+            # Fields after the ")" of the command name; utime/stime are fields 14/15
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+        rss_bytes = 0
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss_bytes = int(line.split()[1]) * 1024
+                    break
+    except (OSError, IndexError, ValueError):
+        return None
+    try:
+        open_handles: Optional[int] = len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        open_handles = None
+    return ProcessSample(rss_bytes=rss_bytes, cpu_seconds=cpu_seconds, open_handles=open_handles)
+
+
+def sample_process(pid: int) -> Optional[ProcessSample]:
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            with process.oneshot():
+                cpu = process.cpu_times()
+                handles = process.num_handles() if hasattr(process, "num_handles") else process.num_fds()
+                return ProcessSample(
+                    rss_bytes=process.memory_info().rss,
+                    cpu_seconds=cpu.user + cpu.system,
+                    open_handles=handles,
+                )
+        except (psutil.Error, OSError):
+            return None
+    return _sample_proc(pid)
+
+
+class CliSupervisor:
+    """
+    Background health monitor for the Copilot CLI subprocess.
+
+    Every `interval` seconds it samples the process behind the current client
+    and exports RSS, CPU and open handles. When a configured threshold (RSS MB,
+    CPU %, open handles; 0 disables one) is exceeded for `recycle_after`
+    consecutive samples it calls `recycle(reason)`, which is expected to swap in
+    a fresh client and drain the old one.
+    """
+
+    def __init__(
+        self,
+        get_pid: Callable[[], Optional[int]],
+        recycle: Callable[[str], Awaitable[None]],
+        interval: float = _HEALTH_INTERVAL_SECONDS,
+        max_rss_mb: float = _MAX_RSS_MB,
+        max_cpu_percent: float = _MAX_CPU_PERCENT,
+        max_open_handles: int = _MAX_OPEN_HANDLES,
+        recycle_after: int = _RECYCLE_AFTER_SAMPLES,
+    ):
+        self._get_pid = get_pid
+        self._recycle = recycle
+        self.interval = interval
+        self.max_rss_mb = max_rss_mb
+        self.max_cpu_percent = max_cpu_percent
+        self.max_open_handles = max_open_handles
+        self.recycle_after = max(1, recycle_after)
+        self._task: Optional[asyncio.Task] = None
+        self._previous: Optional[tuple] = None  # (pid, wall time, cpu seconds)
+        self._breaches = 0
+
+    def ensure_started(self) -> None:
+        if self.interval <= 0 or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logging.info(
+            f"CLI health monitor started (interval={self.interval}s, max_rss_mb={self.max_rss_mb}, "
+            f"max_cpu_percent={self.max_cpu_percent}, max_open_handles={self.max_open_handles})"
+        )
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logging.warning(f"CLI health check failed: {e}")
+
+    def _breach(self, pid: int, sample: ProcessSample) -> Optional[str]:
+        now = time.monotonic()
+        cpu_percent = None
+        if self._previous is not None and self._previous[0] == pid and now > self._previous[1]:
+            cpu_percent = 100.0 * (sample.cpu_seconds - self._previous[2]) / (now - self._previous[1])
+        self._previous = (pid, now, sample.cpu_seconds)
+
+        _CLI_RSS_BYTES.set(sample.rss_bytes)
+        if cpu_percent is not None:
+            _CLI_CPU_PERCENT.set(cpu_percent)
+        if sample.open_handles is not None:
+            _CLI_OPEN_HANDLES.set(sample.open_handles)
+
+        if self.max_rss_mb > 0 and sample.rss_bytes > self.max_rss_mb * 1024 * 1024:
+            return "rss"
+        if self.max_cpu_percent > 0 and cpu_percent is not None and cpu_percent > self.max_cpu_percent:
+            return "cpu"
+        if self.max_open_handles > 0 and sample.open_handles is not None and sample.open_handles > self.max_open_handles:
+            return "handles"
+        return None
+
+    async def check(self) -> Optional[ProcessSample]:
+        """Take one sample and recycle the client if it has been unhealthy for long enough."""
+        pid = self._get_pid()
+        if pid is None:
+            return None
+        sample = sample_process(pid)
+        if sample is None:
+            return None
+        reason = self._breach(pid, sample)
+        if reason is None:
+            self._breaches = 0
+            return sample
+
+        self._breaches += 1
+        logging.warning(
+            f"Copilot CLI pid={pid} over {reason} threshold ({self._breaches}/{self.recycle_after}): "
+            f"rss={sample.rss_bytes / (1024 * 1024):.0f}MB, handles={sample.open_handles}"
+        )
+        if self._breaches >= self.recycle_after:
+            self._breaches = 0
+            self._previous = None
+            _CLI_RECYCLES.inc(reason=reason)
+            await self._recycle(reason)
+        return sample
@@ -0,0 +1,87 @@
+import logging
+import time
+from typing import Awaitable, Callable
+
+from .metrics import REGISTRY
+
+OVERLAP_MODES = ("skip", "coalesce", "allow")
+
+_TIMER_RUN_SECONDS = REGISTRY.histogram(
+    "copilot_shim_timer_run_seconds",
+    "Duration of AGENTS.md timer function runs.",
+    ("timer", "outcome"),
+)
+_TIMER_TICKS = REGISTRY.counter(
+    "copilot_shim_timer_ticks_total",
+    "Timer ticks by what happened to them (run, skipped, coalesced).",
+    ("timer", "action"),
+)
+
+
+class TimerRunGuard:
+    """
+    Overlap protection for one timer function on this worker.
+
+    overlap="skip" drops a tick while the previous run is still going.
+    overlap="coalesce" remembers that ticks arrived and runs once more when the
+    current run finishes (however many ticks were missed).
+    overlap="allow" keeps the old behaviour of running every tick.
+    Job failures are logged and counted; they never stop later ticks.
+    """
+
+    def __init__(self, name: str, overlap: str = "skip"):
+        self.name = name
+        self.overlap = overlap if overlap in OVERLAP_MODES else "skip"
+        # Runs in progress; only "allow" lets this exceed 1
+        self.in_flight = 0
+        self.pending = False
+        self.runs = 0
+        self.skipped = 0
+        self.coalesced = 0
+        self.last_duration: float = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self.in_flight > 0
+
+    async def tick(self, job: Callable[[], Awaitable[None]]) -> None:
+        if self.running and self.overlap != "allow":
+            if self.overlap == "coalesce":
+                self.pending = True
+                self.coalesced += 1
+                _TIMER_TICKS.inc(timer=self.name, action="coalesced")
+                logging.info(f"Timer '{self.name}' still running; coalescing tick ({self.coalesced} coalesced so far)")
+            else:
+                self.skipped += 1
+                _TIMER_TICKS.inc(timer=self.name, action="skipped")
+                logging.warning(f"Timer '{self.name}' still running; skipping tick ({self.skipped} skipped so far)")
+            return
+
+        self.in_flight += 1
+        try:
+            while True:
+                self.pending = False
+                await self._run_once(job)
+                if not self.pending:
+                    break
+                logging.info(f"Timer '{self.name}' running coalesced tick")
+        finally:
+            self.in_flight -= 1
+
+    async def _run_once(self, job: Callable[[], Awaitable[None]]) -> None:
+        _TIMER_TICKS.inc(timer=self.name, action="run")
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            await job()
+        except Exception as exc:
+            outcome = "error"
+            logging.exception(f"Timer '{self.name}' failed: {exc}")
+        finally:
+            self.runs += 1
+            self.last_duration = time.perf_counter() - started
+            _TIMER_RUN_SECONDS.observe(self.last_duration, timer=self.name, outcome=outcome)
+            logging.info(
+                f"Timer '{self.name}' run #{self.runs} finished in {self.last_duration:.2f}s "
+                f"(outcome={outcome}, skipped={self.skipped}, coalesced={self.coalesced})"
+            )
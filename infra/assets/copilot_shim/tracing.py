@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import re
+import secrets
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from .line_writer import LineWriter
+
+_TRACEPARENT_RE = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_INVALID_TRACE_ID = "0" * 32
+_INVALID_SPAN_ID = "0" * 16
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, str]]:
+    """
+    Parse a W3C traceparent header into (trace_id, parent_span_id, trace_flags).
+
+    Returns None for missing or malformed headers so callers start a new trace.
+    """
+    if not header:
+        return None
+    match = _TRACEPARENT_RE.match(header.strip().lower())
+    if not match:
+        return None
+    version, trace_id, span_id, flags = match.groups()
+    if version == "ff" or trace_id == _INVALID_TRACE_ID or span_id == _INVALID_SPAN_ID:
+        return None
+    return trace_id, span_id, flags
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: Optional[str] = None
+    start_time_ns: int = field(default_factory=time.time_ns)
+    end_time_ns: Optional[int] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: str = "ok"
+
+    def end(self, status: Optional[str] = None) -> None:
+        if self.end_time_ns is not None:
+            return
+        self.end_time_ns = time.time_ns()
+        if status:
+            self.status = status
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_time_ns,
+            "endTimeUnixNano": self.end_time_ns,
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+
+
+class SpanExporter:
+    """Base exporter. Subclasses receive every span of a finished trace at once."""
+
+    def export(self, spans: List[Span]) -> None:
+        raise NotImplementedError
+
+    def shutdown(self) -> None:
+        pass
+
+
+class JsonFileSpanExporter(SpanExporter):
+    """Append spans as JSON lines to a local file (one span per line) from a background writer thread."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._writer = LineWriter(path, "trace-span-writer")
+
+    def export(self, spans: List[Span]) -> None:
+        # Spans of a finished trace no longer change, so they are serialized on the writer thread
+        spans = list(spans)
+        self._writer.write(lambda: "\n".join(json.dumps(span.to_dict(), default=str) for span in spans))
+
+    def shutdown(self) -> None:
+        self._writer.close()
+
+
+def _exporter_from_env() -> Optional[SpanExporter]:
+    """
+    Resolve the span exporter from environment.
+
+    COPILOT_TRACE_EXPORTER=json writes to COPILOT_TRACE_FILE
+    (default: <tempdir>/copilot-shim-traces.jsonl). Unset disables export.
+    """
+    exporter_name = os.environ.get("COPILOT_TRACE_EXPORTER", "").strip().lower()
+    if exporter_name in ("", "none"):
+        return None
+    if exporter_name == "json":
+        path = os.environ.get("COPILOT_TRACE_FILE") or os.path.join(tempfile.gettempdir(), "copilot-shim-traces.jsonl")
+        logging.info(f"Exporting trace spans to {path}")
+        return JsonFileSpanExporter(path)
+    logging.warning(f"Unknown COPILOT_TRACE_EXPORTER '{exporter_name}', tracing export disabled")
+    return None
+
+
+_SPAN_EXPORTER: Optional[SpanExporter] = _exporter_from_env()
+
+
+def set_span_exporter(exporter: Optional[SpanExporter]) -> None:
+    """Install a custom exporter (or None to disable export)."""
+    global _SPAN_EXPORTER
+    _SPAN_EXPORTER = exporter
+
+
+def get_span_exporter() -> Optional[SpanExporter]:
+    return _SPAN_EXPORTER
+
+
+class TurnTrace:
+    """
+    Span tree for one agent request.
+
+    The root span represents the entry point (HTTP route, MCP tool or timer).
+    Session setup, model turns and tool calls become child spans; tools nest
+    under their parent_tool_call_id when one is present.
+    """
+
+    def __init__(self, name: str, traceparent: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None):
+        parent = parse_traceparent(traceparent)
+        trace_id = parent[0] if parent else secrets.token_hex(16)
+        self.spans: List[Span] = []
+        self.root = self._new_span(name, trace_id, parent[1] if parent else None, attributes)
+        self._turn_spans: Dict[str, Span] = {}
+        self._current_turn: Optional[Span] = None
+        self._tool_spans: Dict[str, Span] = {}
+
+    @property
+    def trace_id(self) -> str:
+        return self.root.trace_id
+
+    def _new_span(
+        self,
+        name: str,
+        trace_id: str,
+        parent_span_id: Optional[str],
+        attributes: Optional[Dict[str, Any]] = None,
+    ) -> Span:
+        span = Span(
+            name=name,
+            trace_id=trace_id,
+            span_id=secrets.token_hex(8),
+            parent_span_id=parent_span_id,
+            attributes=dict(attributes or {}),
+        )
+        self.spans.append(span)
+        return span
+
+    def start_span(self, name: str, parent: Optional[Span] = None, attributes: Optional[Dict[str, Any]] = None) -> Span:
+        return self._new_span(name, self.trace_id, (parent or self.root).span_id, attributes)
+
+    def on_event(self, event_type: str, data) -> None:
+        if event_type == "assistant.turn_start":
+            turn_id = str(getattr(data, "turn_id", None) or len(self._turn_spans))
+            span = self.start_span("model.turn", attributes={"turn_id": turn_id})
+            self._turn_spans[turn_id] = span
+            self._current_turn = span
+        elif event_type == "assistant.turn_end":
+            turn_id = getattr(data, "turn_id", None)
+            span = self._turn_spans.get(str(turn_id)) if turn_id is not None else self._current_turn
+            if span is not None:
+                span.end()
+            if span is self._current_turn:
+                self._current_turn = None
+        elif event_type == "tool.execution_start":
+            tool_call_id = getattr(data, "tool_call_id", None)
+            parent_id = getattr(data, "parent_tool_call_id", None)
+            parent = self._tool_spans.get(parent_id) if parent_id else None
+            span = self.start_span(
+                f"tool {getattr(data, 'tool_name', None) or 'unknown'}",
+                parent=parent or self._current_turn,
+                attributes={"tool_call_id": tool_call_id, "parent_tool_call_id": parent_id},
+            )
+            if tool_call_id:
+                self._tool_spans[tool_call_id] = span
+        elif event_type == "tool.execution_end":
+            span = self._tool_spans.get(getattr(data, "tool_call_id", None) or "")
+            if span is not None:
+                success = getattr(data, "success", None)
+                span.end("error" if success is False else None)
+
+    def finish(self, status: str = "ok") -> None:
+        if self.root.end_time_ns is not None:
+            return
+        # Close anything left open (timeouts, aborted tools) at the root's end time
+        for span in self.spans:
+            if span is not self.root:
+                span.end("incomplete" if status == "ok" else status)
+        self.root.end(status)
+
+        exporter = _SPAN_EXPORTER
+        if exporter is None:
+            return
+        try:
+            exporter.export(self.spans)
+        except Exception as e:
+            logging.warning(f"Span export failed: {e}")
@@ -0,0 +1,282 @@
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Any, Deque, Dict, Mapping, Optional, Set, Tuple
+
+from .line_writer import LineWriter
+from .metrics import REGISTRY
+
+_USAGE_WINDOW_SECONDS = int(os.environ.get("COPILOT_USAGE_WINDOW_SECONDS", "3600"))
+_USAGE_LOG_PATH = os.environ.get("COPILOT_USAGE_LOG_PATH")
+_CALLER_HEADER = os.environ.get("COPILOT_CALLER_HEADER", "x-ms-caller").lower()
+# Distinct caller names taken from the header per worker; later ones are accounted as "other"
+_MAX_HEADER_CALLERS = int(os.environ.get("COPILOT_CALLER_HEADER_MAX_NAMES", "100"))
+# Rolling usage is kept in buckets of this many seconds
+_BUCKET_SECONDS = 60
+
+ANONYMOUS_CALLER = "anonymous"
+OTHER_CALLER = "other"
+
+_CALLER_NAME_PATTERN = re.compile(r"[^A-Za-z0-9._:@-]")
+
+_TOKENS = REGISTRY.counter(
+    "copilot_shim_tokens_total",
+    "Model tokens by caller, model, route and kind (input, output, cache_read).",
+    ("caller", "model", "route", "kind"),
+)
+_COST = REGISTRY.counter(
+    "copilot_shim_cost_total",
+    "Model cost units reported by the CLI (premium request multiplier), by caller, model and route.",
+    ("caller", "model", "route"),
+)
+_QUOTA_REJECTIONS = REGISTRY.counter(
+    "copilot_shim_quota_rejections_total",
+    "Turns rejected before session creation because the caller was over quota.",
+    ("caller", "limit"),
+)
+
+
+class QuotaExceededError(Exception):
+    """Raised before a session is created when the caller is over its rolling quota."""
+
+    def __init__(self, caller: str, limit: str, used: float, allowed: float, retry_after: int):
+        super().__init__(
+            f"Quota exceeded for caller '{caller}': {limit} {used:g}/{allowed:g} in the last "
+            f"{_USAGE_WINDOW_SECONDS}s; retry after {retry_after}s"
+        )
+        self.caller = caller
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+def _load_json_setting(name: str) -> Dict[str, Any]:
+    raw = os.environ.get(name)
+    if not raw:
+        return {}
+    try:
+        value = json.loads(raw)
+    except ValueError as e:
+        logging.warning(f"Invalid {name}: {e}")
+        return {}
+    if not isinstance(value, dict):
+        logging.warning(f"Invalid {name}: expected an object")
+        return {}
+    return value
+
+
+# {"<sha256 prefix of function key>": "team-name"}
+_CALLER_KEY_NAMES: Dict[str, str] = _load_json_setting("COPILOT_CALLER_KEY_NAMES")
+# {"team-name" | "*": {"tokens": N, "turns": N, "cost": N}} per usage window
+_CALLER_QUOTAS: Dict[str, Dict[str, float]] = _load_json_setting("COPILOT_CALLER_QUOTAS")
+# Function keys (ids or names from COPILOT_CALLER_KEY_NAMES) whose requests may name the caller in the header
+_HEADER_TRUSTED_KEYS = frozenset(
+    name.strip() for name in os.environ.get("COPILOT_CALLER_HEADER_KEYS", "").split(",") if name.strip()
+)
+
+_header_callers: Set[str] = set()
+_header_callers_lock = threading.Lock()
+
+
+def key_id(function_key: str) -> str:
+    """Stable, non-reversible id for a function key (first 12 hex chars of its SHA-256)."""
+    return hashlib.sha256(function_key.encode("utf-8")).hexdigest()[:12]
+
+
+def resolve_caller(headers: Mapping[str, str], query: Optional[Mapping[str, str]] = None) -> str:
+    """
+    Identify the caller of an HTTP request for usage accounting.
+
+    Priority:
+    1. COPILOT_CALLER_HEADER (default x-ms-caller), only on requests made with a
+       function key listed in COPILOT_CALLER_HEADER_KEYS (e.g. a gateway's key)
+    2. Function key (x-functions-key header or ?code=), named via COPILOT_CALLER_KEY_NAMES
+       or reported as key-<id>
+    3. "anonymous"
+    """
+    function_key = headers.get("x-functions-key") or (query.get("code") if query else None)
+    if not function_key:
+        return ANONYMOUS_CALLER
+    identifier = key_id(function_key)
+    key_name = _CALLER_KEY_NAMES.get(identifier, f"key-{identifier}")
+    header_value = headers.get(_CALLER_HEADER)
+    if header_value and (identifier in _HEADER_TRUSTED_KEYS or key_name in _HEADER_TRUSTED_KEYS):
+        return _header_caller(header_value)
+    return key_name
+
+
+def _header_caller(value: str) -> str:
+    """Sanitize a caller name from the header and cap how many distinct names become metric labels."""
+    name = _CALLER_NAME_PATTERN.sub("", value.strip())[:64]
+    if not name:
+        return OTHER_CALLER
+    with _header_callers_lock:
+        if name in _header_callers or name in _CALLER_QUOTAS:
+            return name
+        if len(_header_callers) >= _MAX_HEADER_CALLERS:
+            return OTHER_CALLER
+        _header_callers.add(name)
+    return name
+
+
+@dataclass
+class UsageTotals:
+    turns: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cost: float = 0.0
+
+    def add(self, other: "UsageTotals") -> None:
+        self.turns += other.turns
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.cache_read_tokens += other.cache_read_tokens
+        self.cost += other.cost
+
+    @property
+    def tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+
+class UsageLedger:
+    """
+    Per-caller token and cost accounting on this worker.
+
+    Lifetime totals are kept per (caller, model, route) for chargeback, and a
+    rolling window per caller (minute buckets) is used for quota checks. With
+    COPILOT_USAGE_LOG_PATH set, every turn is also appended as a JSON line (by a
+    background writer) so usage from all instances can be aggregated offline.
+    """
+
+    def __init__(self, window_seconds: int = _USAGE_WINDOW_SECONDS, quotas: Optional[Dict[str, Dict[str, float]]] = None):
+        self.window_seconds = window_seconds
+        self.quotas = quotas if quotas is not None else _CALLER_QUOTAS
+        self._totals: Dict[Tuple[str, str, str], UsageTotals] = {}
+        self._windows: Dict[str, Deque[Tuple[int, UsageTotals]]] = {}
+        self._lock = threading.Lock()
+        self._log = LineWriter(_USAGE_LOG_PATH, "usage-log-writer") if _USAGE_LOG_PATH else None
+
+    def _window_usage(self, caller: str, now: float) -> UsageTotals:
+        window = self._windows.get(caller)
+        total = UsageTotals()
+        if not window:
+            return total
+        oldest = int(now - self.window_seconds) // _BUCKET_SECONDS
+        while window and window[0][0] < oldest:
+            window.popleft()
+        for _, bucket in window:
+            total.add(bucket)
+        return total
+
+    def check_quota(self, caller: str) -> None:
+        quota = self.quotas.get(caller) or self.quotas.get("*")
+        if not quota:
+            return
+        now = time.time()
+        with self._lock:
+            used = self._window_usage(caller, now)
+            window = self._windows.get(caller)
+            oldest_bucket = window[0][0] if window else int(now) // _BUCKET_SECONDS
+        for limit, value in (("tokens", used.tokens), ("turns", used.turns), ("cost", used.cost)):
+            allowed = quota.get(limit)
+            if allowed is not None and value >= allowed:
+                retry_after = max(1, int((oldest_bucket + 1) * _BUCKET_SECONDS + self.window_seconds - now))
+                _QUOTA_REJECTIONS.inc(caller=caller, limit=limit)
+                raise QuotaExceededError(caller, limit, value, allowed, retry_after)
+
+    def record(self, caller: str, model: str, route: str, usage: UsageTotals) -> None:
+        now = time.time()
+        bucket_id = int(now) // _BUCKET_SECONDS
+        with self._lock:
+            self._totals.setdefault((caller, model, route), UsageTotals()).add(usage)
+            window = self._windows.setdefault(caller, deque())
+            if not window or window[-1][0] != bucket_id:
+                window.append((bucket_id, UsageTotals()))
+            window[-1][1].add(usage)
+
+        _TOKENS.inc(usage.input_tokens, caller=caller, model=model, route=route, kind="input")
+        _TOKENS.inc(usage.output_tokens, caller=caller, model=model, route=route, kind="output")
+        if usage.cache_read_tokens:
+            _TOKENS.inc(usage.cache_read_tokens, caller=caller, model=model, route=route, kind="cache_read")
+        if usage.cost:
+            _COST.inc(usage.cost, caller=caller, model=model, route=route)
+
+        if self._log is not None:
+            self._log.write(json.dumps({"ts": round(now, 3), "caller": caller, "model": model, "route": route, **asdict(usage)}))
+
+    def export(self) -> Dict[str, Any]:
+        """Aggregates for chargeback: lifetime totals per (caller, model, route) and rolling usage per caller."""
+        now = time.time()
+        with self._lock:
+            totals = [
+                {"caller": caller, "model": model, "route": route, **asdict(usage)}
+                for (caller, model, route), usage in sorted(self._totals.items())
+            ]
+            callers = {}
+            for caller in sorted(self._windows):
+                used = self._window_usage(caller, now)
+                callers[caller] = {
+                    "window": {"tokens": used.tokens, "turns": used.turns, "cost": used.cost},
+                    "quota": self.quotas.get(caller) or self.quotas.get("*"),
+                }
+        return {"window_seconds": self.window_seconds, "callers": callers, "totals": totals}
+
+    def export_csv(self) -> str:
+        rows = self.export()["totals"]
+        buffer = io.StringIO()
+        writer = csv.DictWriter(
+            buffer,
+            fieldnames=["caller", "model", "route", "turns", "input_tokens", "output_tokens", "cache_read_tokens", "cost"],
+        )
+        writer.writeheader()
+        writer.writerows(rows)
+        return buffer.getvalue()
+
+
+class TurnUsage:
+    """
+    Collects assistant.usage events for one turn and records them in the ledger on finish.
+
+    With count_turn=False the tokens and cost are recorded but not the turn itself
+    (a hedge of a turn that is already counted).
+    """
+
+    def __init__(
+        self,
+        caller: Optional[str],
+        route: Optional[str],
+        model: str,
+        ledger: Optional[UsageLedger] = None,
+        count_turn: bool = True,
+    ):
+        self.caller = caller or ANONYMOUS_CALLER
+        self.route = route or "direct"
+        self.model = model
+        self.usage = UsageTotals(turns=1 if count_turn else 0)
+        self._ledger = ledger or USAGE_LEDGER
+        self._finished = False
+
+    def on_event(self, event_type: str, data) -> None:
+        if event_type != "assistant.usage":
+            return
+        self.usage.input_tokens += int(getattr(data, "input_tokens", None) or 0)
+        self.usage.output_tokens += int(getattr(data, "output_tokens", None) or 0)
+        self.usage.cache_read_tokens += int(getattr(data, "cache_read_tokens", None) or 0)
+        self.usage.cost += float(getattr(data, "cost", None) or 0.0)
+
+    def finish(self) -> None:
+        if self._finished:
+            return
+        self._finished = True
+        self._ledger.record(self.caller, self.model, self.route, self.usage)
+
+
+USAGE_LEDGER = UsageLedger()
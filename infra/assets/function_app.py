@@ -11,7 +11,34 @@ from typing import Any, Dict, List
 
 import azure.functions as func
 import frontmatter
-from copilot_shim import run_copilot_agent, run_copilot_agent_stream
+from copilot_shim import (
+    PROMETHEUS_CONTENT_TYPE,
+    QuotaExceededError,
+    render_metrics,
+    resolve_caller,
+    run_copilot_agent,
+    run_copilot_agent_stream,
+)
+from copilot_shim.artifacts import ARTIFACT_STORE, artifact_headers, parse_range
+from copilot_shim.fanout import FanoutRequest, run_fanout
+from copilot_shim.responses import (
+    DEFAULT_RESPONSE_FIELDS,
+    build_agent_payload,
+    maybe_gzip,
+    parse_fields,
+    parse_tool_arguments_mode,
+)
+from copilot_shim.serialization import (
+    JSON_MEDIA_TYPE,
+    JSON_MISSING_PROMPT,
+    SSE_MISSING_PROMPT_FRAME,
+    dumps_bytes,
+    dumps_str,
+    sse_frame,
+)
+from copilot_shim.static_assets import StaticAsset
+from copilot_shim.timers import OVERLAP_MODES, TimerRunGuard
+from copilot_shim.usage import USAGE_LEDGER
 
 from azurefunctions.extensions.http.fastapi import Request, Response, StreamingResponse
 
@@ -26,6 +53,20 @@ _MCP_AGENT_TOOL_PROPERTIES = json.dumps(
             "isRequired": True,
             "isArray": False,
         },
+        {
+            "propertyName": "fields",
+            "propertyType": "string",
+            "description": "Optional comma-separated response fields: session_id, response, response_intermediate, tool_calls, routing.",
+            "isRequired": False,
+            "isArray": False,
+        },
+        {
+            "propertyName": "tool_arguments",
+            "propertyType": "string",
+            "description": "Optional tool call argument detail: full (default), truncate, summary or omit.",
+            "isRequired": False,
+            "isArray": False,
+        },
     ]
 )
 
@@ -118,6 +159,17 @@ def _to_bool(value: Any, default: bool = True) -> bool:
     return default
 
 
+def _to_unit_float(value: Any, default: float) -> float:
+    """Parse a 0.0-1.0 ratio, falling back to default for missing/invalid values."""
+    try:
+        parsed = float(value)
+    except (TypeError, ValueError):
+        return default
+    if 0.0 < parsed <= 1.0:
+        return parsed
+    return default
+
+
 def _safe_timer_name(raw_name: str) -> str:
     name = re.sub(r"[^a-zA-Z0-9_]", "_", raw_name).strip("_")
     if not name:
@@ -172,42 +224,74 @@ def _register_dynamic_timer_functions() -> None:
         prompt = prompt_raw.strip()
         should_log_response = _to_bool(spec.get("logger", True), default=True)
 
+        session_mode = str(spec.get("session") or "new").strip().lower()
+        if session_mode not in {"new", "persistent"}:
+            logging.warning(f"AGENTS function '{function_name}': unknown session '{session_mode}', using 'new'")
+            session_mode = "new"
+        timer_session_id = None
+        compaction_threshold = None
+        if session_mode == "persistent":
+            timer_session_id = str(spec.get("session_id") or f"timer-{function_name}")
+            compaction_threshold = _to_unit_float(spec.get("compaction_threshold"), default=0.6)
+
+        overlap = str(spec.get("overlap") or "skip").strip().lower()
+        if overlap not in OVERLAP_MODES:
+            logging.warning(f"AGENTS function '{function_name}': unknown overlap '{overlap}', using 'skip'")
+            overlap = "skip"
+
         def _make_timer_handler(
             timer_function_name: str,
             timer_schedule: str,
             timer_prompt: str,
             log_response: bool,
+            session_id: str | None,
+            history_compaction_threshold: float | None,
+            guard: TimerRunGuard,
         ):
+            async def _run_timer_agent() -> None:
+                result = await run_copilot_agent(
+                    timer_prompt,
+                    session_id=session_id,
+                    route=f"timer/{timer_function_name}",
+                    fields=DEFAULT_RESPONSE_FIELDS if log_response else frozenset({"session_id"}),
+                    compaction_threshold=history_compaction_threshold,
+                    caller=f"timer:{timer_function_name}",
+                )
+                if log_response:
+                    logging.info(
+                        "Timer '%s' agent response: %s",
+                        timer_function_name,
+                        json.dumps(
+                            {
+                                "session_id": result.session_id,
+                                "response": result.content,
+                                "response_intermediate": result.content_intermediate,
+                                "tool_calls": result.tool_calls,
+                            },
+                            ensure_ascii=False,
+                            default=str,
+                        ),
+                    )
+
             async def _timer_handler(timer_request: func.TimerRequest) -> None:
                 if timer_request.past_due:
                     logging.info(f"Timer '{timer_function_name}' is past due.")
 
                 logging.info(f"Timer '{timer_function_name}' running with schedule '{timer_schedule}'")
-
-                try:
-                    result = await run_copilot_agent(timer_prompt)
-                    if log_response:
-                        logging.info(
-                            "Timer '%s' agent response: %s",
-                            timer_function_name,
-                            json.dumps(
-                                {
-                                    "session_id": result.session_id,
-                                    "response": result.content,
-                                    "response_intermediate": result.content_intermediate,
-                                    "tool_calls": result.tool_calls,
-                                },
-                                ensure_ascii=False,
-                                default=str,
-                            ),
-                        )
-                except Exception as exc:
-                    logging.exception(f"Timer '{timer_function_name}' failed: {exc}")
+                await guard.tick(_run_timer_agent)
 
             _timer_handler.__name__ = f"timer_handler_{timer_function_name}"
             return _timer_handler
 
-        handler = _make_timer_handler(function_name, schedule, prompt, should_log_response)
+        handler = _make_timer_handler(
+            function_name,
+            schedule,
+            prompt,
+            should_log_response,
+            timer_session_id,
+            compaction_threshold,
+            TimerRunGuard(function_name, overlap),
+        )
         decorated = app.timer_trigger(
             schedule=schedule,
             arg_name="timer_request",
@@ -216,12 +300,20 @@ def _register_dynamic_timer_functions() -> None:
         app.function_name(name=function_name)(decorated)
 
         logging.info(
-            f"Registered dynamic timer function '{function_name}' from AGENTS.md (schedule='{schedule}', logger={should_log_response})"
+            f"Registered dynamic timer function '{function_name}' from AGENTS.md (schedule='{schedule}', logger={should_log_response}, "
+            f"session={session_mode}, session_id={timer_session_id}, overlap={overlap})"
         )
 
 
 _register_dynamic_timer_functions()
 
+# Chat UI is loaded and compressed once per worker instead of read from disk per request
+_CHAT_PAGE = StaticAsset.load(
+    str(Path(__file__).resolve().parent / "public" / "index.html"),
+    media_type="text/html; charset=utf-8",
+    cache_control=os.environ.get("CHAT_UI_CACHE_CONTROL", "no-cache"),
+)
+
 
 @app.route(
     route="{*ignored}",
@@ -234,24 +326,105 @@ def root_chat_page(req: Request) -> Response:
     if ignored:
         return Response("Not found", status_code=404)
 
-    index_path = Path(__file__).resolve().parent / "public" / "index.html"
-    if not index_path.exists():
+    if _CHAT_PAGE is None:
         return Response("index.html not found", status_code=404)
 
+    status_code, body, headers = _CHAT_PAGE.respond(
+        req.headers.get("if-none-match"),
+        req.headers.get("accept-encoding"),
+    )
+    return Response(body, status_code=status_code, media_type=_CHAT_PAGE.media_type, headers=headers)
+
+
+@app.route(route="metrics", methods=["GET"], auth_level=func.AuthLevel.FUNCTION)
+def metrics(req: Request) -> Response:
+    """Per-turn latency histograms in the Prometheus text exposition format."""
+    return Response(render_metrics(), status_code=200, media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+def _quota_exceeded_response(exc: QuotaExceededError) -> Response:
+    return Response(
+        dumps_bytes({"error": str(exc)}),
+        status_code=429,
+        media_type=JSON_MEDIA_TYPE,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def _artifact_not_found_response() -> Response:
+    return Response(dumps_bytes({"error": "Artifact not found or expired"}), status_code=404, media_type=JSON_MEDIA_TYPE)
+
+
+@app.route(route="agent/artifacts/{digest}", methods=["GET"])
+def agent_artifact(req: Request) -> Response:
+    """
+    Full payload of a large tool argument or result that was replaced by a reference.
+
+    GET /agent/artifacts/{hash}
+    Headers:
+        Range (optional): a single byte range, e.g. bytes=0-65535 or bytes=-1024
+        If-None-Match (optional): the artifact's ETag
+    """
+    digest = (req.path_params or {}).get("digest", "")
+    found = ARTIFACT_STORE.find(digest)
+    if found is None:
+        return _artifact_not_found_response()
+    path, media_type = found
+    headers = artifact_headers(digest)
+    if req.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+
+    # The TTL cleanup may delete the file between find() and here
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return _artifact_not_found_response()
+    try:
+        byte_range = parse_range(req.headers.get("range"), size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    try:
+        body = ARTIFACT_STORE.read(path, byte_range)
+    except FileNotFoundError:
+        return _artifact_not_found_response()
+    if byte_range is None:
+        return Response(body, media_type=media_type, headers=headers)
+    start, end = byte_range
     return Response(
-        index_path.read_text(encoding="utf-8"),
-        status_code=200,
-        media_type="text/html",
+        body,
+        status_code=206,
+        media_type=media_type,
+        headers={**headers, "Content-Range": f"bytes {start}-{end}/{size}"},
     )
 
+
+@app.route(route="agent/usage", methods=["GET"], auth_level=func.AuthLevel.ADMIN)
+def agent_usage(req: Request) -> Response:
+    """
+    Token and cost aggregates per caller, model and route for chargeback.
+
+    GET /agent/usage[?format=csv]
+    Requires the admin (master) key because it covers every caller.
+    """
+    if req.query_params.get("format", "").lower() == "csv":
+        return Response(USAGE_LEDGER.export_csv(), media_type="text/csv; charset=utf-8")
+    return Response(dumps_bytes(USAGE_LEDGER.export()), media_type=JSON_MEDIA_TYPE)
+
+
 @app.route(route="agent/chat", methods=["POST"])
 async def chat(req: Request) -> Response:
     """
     Chat endpoint - send a prompt, get a response.
 
     POST /agent/chat
+    Query:
+        fields (optional): Comma-separated response fields, e.g. response,session_id
+        tool_arguments (optional): full (default), truncate, summary or omit
+        hedge (optional): true to allow a hedged second session for a slow sessionless, idempotent prompt
     Headers:
         x-ms-session-id (optional): Session ID for resuming a previous session
+        Accept-Encoding (optional): gzip responses are returned when accepted
+        x-ms-caller (optional): Caller name for usage accounting when no function key is used
     Body:
     {
         "prompt": "What is 2+2?"
@@ -263,33 +436,53 @@ async def chat(req: Request) -> Response:
 
         if not prompt:
             return Response(
-                json.dumps({"error": "Missing 'prompt'"}),
+                JSON_MISSING_PROMPT,
                 status_code=400,
-                media_type="application/json",
+                media_type=JSON_MEDIA_TYPE,
             )
 
+        try:
+            fields = parse_fields(req.query_params.get("fields"))
+            tool_arguments = parse_tool_arguments_mode(req.query_params.get("tool_arguments"))
+        except ValueError as exc:
+            return Response(dumps_bytes({"error": str(exc)}), status_code=400, media_type=JSON_MEDIA_TYPE)
+
         session_id = req.headers.get("x-ms-session-id")
-        result = await run_copilot_agent(prompt, session_id=session_id)
+        result = await run_copilot_agent(
+            prompt,
+            session_id=session_id,
+            route="/agent/chat",
+            traceparent=req.headers.get("traceparent"),
+            fields=fields,
+            hedge=req.query_params.get("hedge", "").lower() in ("1", "true", "yes"),
+            caller=resolve_caller(req.headers, req.query_params),
+            tool_arguments=tool_arguments,
+        )
 
+        response_body, encoding_headers = maybe_gzip(
+            dumps_bytes(build_agent_payload(result, fields)),
+            req.headers.get("accept-encoding"),
+        )
         response = Response(
-            json.dumps(
-                {
-                    "session_id": result.session_id,
-                    "response": result.content,
-                    "response_intermediate": result.content_intermediate,
-                    "tool_calls": result.tool_calls,
-                }
-            ),
-            media_type="application/json",
-            headers={"x-ms-session-id": result.session_id},
+            response_body,
+            media_type=JSON_MEDIA_TYPE,
+            headers={
+                "x-ms-session-id": result.session_id,
+                "x-ms-model": (result.routing or {}).get("model", ""),
+                "x-ms-context-tokens": str((result.context or {}).get("tokens", 0)),
+                **encoding_headers,
+            },
         )
         return response
 
+    except QuotaExceededError as e:
+        logging.warning(str(e))
+        return _quota_exceeded_response(e)
     except Exception as e:
         error_msg = str(e) if str(e) else f"{type(e).__name__}: {repr(e)}"
         logging.error(f"Chat error: {error_msg}")
         return Response(
-            json.dumps({"error": error_msg}), status_code=500, media_type="application/json"
+            dumps_bytes({"error": error_msg}), status_code=500, media_type=JSON_MEDIA_TYPE
         )
 
 
@@ -307,7 +500,7 @@ async def chat_stream(req: Request) -> StreamingResponse:
     }
 
     Response: text/event-stream with events:
-        data: {"type": "session", "session_id": "..."}
+        data: {"type": "session", "session_id": "...", "routing": {...}}
         data: {"type": "delta", "content": "partial text"}
         data: {"type": "tool_start", "tool_name": "...", "tool_call_id": "..."}
         data: {"type": "message", "content": "full message"}
@@ -319,23 +512,86 @@ async def chat_stream(req: Request) -> StreamingResponse:
 
         if not prompt:
             async def error_gen():
-                yield f"data: {json.dumps({'type': 'error', 'content': 'Missing prompt'})}\n\n"
+                yield SSE_MISSING_PROMPT_FRAME
             return StreamingResponse(error_gen(), media_type="text/event-stream")
 
         session_id = req.headers.get("x-ms-session-id")
+        caller = resolve_caller(req.headers, req.query_params)
+        # Reject over-quota callers with a plain 429 before the stream starts
+        USAGE_LEDGER.check_quota(caller)
         return StreamingResponse(
-            run_copilot_agent_stream(prompt, session_id=session_id),
+            run_copilot_agent_stream(
+                prompt,
+                session_id=session_id,
+                route="/agent/chatstream",
+                traceparent=req.headers.get("traceparent"),
+                caller=caller,
+            ),
             media_type="text/event-stream",
         )
 
+    except QuotaExceededError as e:
+        logging.warning(str(e))
+        return _quota_exceeded_response(e)
     except Exception as e:
         error_msg = str(e) if str(e) else f"{type(e).__name__}: {repr(e)}"
         logging.error(f"Chat stream error: {error_msg}")
         async def error_gen():
-            yield f"data: {json.dumps({'type': 'error', 'content': error_msg})}\n\n"
+            yield sse_frame({"type": "error", "content": error_msg})
         return StreamingResponse(error_gen(), media_type="text/event-stream")
 
 
+@app.route(route="agent/fanout", methods=["POST"])
+async def fanout(req: Request) -> Response:
+    """
+    Fan-out endpoint - run independent sub-prompts as concurrent sessions, receive SSE events.
+
+    POST /agent/fanout
+    Body:
+    {
+        "prompts": ["Price of X in eastus?", "Price of X in westus?"],
+        "reduce": "Compare these prices in a table.",   (optional)
+        "concurrency": 4,                                 (optional, capped by COPILOT_FANOUT_MAX_CONCURRENCY)
+        "item_timeout": 60                                (optional, seconds per sub-prompt)
+    }
+    or "template": "Summarize {input}" with "inputs": [...] instead of "prompts".
+
+    Response: text/event-stream with events:
+        data: {"type": "fanout", "items": 2, "concurrency": 4}
+        data: {"type": "item", "index": 1, "status": "ok", "session_id": "...", "content": "...", "seconds": 3.2}
+        data: {"type": "reduce", "items": 2, "status": "ok", "session_id": "...", "content": "..."}
+        data: {"type": "done"}
+    """
+    try:
+        body = await req.json()
+        try:
+            fanout_request = FanoutRequest.from_dict(body)
+        except ValueError as exc:
+            return Response(dumps_bytes({"error": str(exc)}), status_code=400, media_type=JSON_MEDIA_TYPE)
+
+        caller = resolve_caller(req.headers, req.query_params)
+        USAGE_LEDGER.check_quota(caller)
+        return StreamingResponse(
+            run_fanout(
+                fanout_request,
+                route="/agent/fanout",
+                traceparent=req.headers.get("traceparent"),
+                caller=caller,
+            ),
+            media_type="text/event-stream",
+        )
+
+    except QuotaExceededError as e:
+        logging.warning(str(e))
+        return _quota_exceeded_response(e)
+    except Exception as e:
+        error_msg = str(e) if str(e) else f"{type(e).__name__}: {repr(e)}"
+        logging.error(f"Fan-out error: {error_msg}")
+        return Response(
+            dumps_bytes({"error": error_msg}), status_code=500, media_type=JSON_MEDIA_TYPE
+        )
+
+
 @app.mcp_tool_trigger(
     arg_name="context",
     tool_name=_MCP_AGENT_TOOL_NAME,
@@ -350,21 +606,22 @@ async def mcp_agent_chat(context: str) -> str:
 
         prompt = arguments.get("prompt") if isinstance(arguments, dict) else None
         if not isinstance(prompt, str) or not prompt.strip():
-            return json.dumps({"error": "Missing 'prompt'"})
+            return dumps_str({"error": "Missing 'prompt'"})
 
-        session_id = _extract_mcp_session_id(payload) if isinstance(payload, dict) else None
+        try:
+            fields = parse_fields(arguments.get("fields"))
+            tool_arguments = parse_tool_arguments_mode(arguments.get("tool_arguments"))
+        except ValueError as exc:
+            return dumps_str({"error": str(exc)})
 
-        result = await run_copilot_agent(prompt.strip(), session_id=session_id)
+        session_id = _extract_mcp_session_id(payload) if isinstance(payload, dict) else None
 
-        return json.dumps(
-            {
-                "session_id": result.session_id,
-                "response": result.content,
-                "response_intermediate": result.content_intermediate,
-                "tool_calls": result.tool_calls,
-            }
+        result = await run_copilot_agent(
+            prompt.strip(), session_id=session_id, route="mcp", fields=fields, caller="mcp", tool_arguments=tool_arguments
         )
+
+        return dumps_str(build_agent_payload(result, fields))
     except Exception as exc:
         error_msg = str(exc) if str(exc) else f"{type(exc).__name__}: {repr(exc)}"
         logging.error(f"MCP tool error: {error_msg}")
-        return json.dumps({"error": error_msg})
+        return dumps_str({"error": error_msg})
@@ -34,4 +34,14 @@ if [ -f "$TMP_DIR/extra-requirements.txt" ]; then
     rm "$TMP_DIR/extra-requirements.txt"
 fi
 
+# Precompress the chat UI so workers don't have to at startup (served via Accept-Encoding)
+INDEX_HTML="$TMP_DIR/public/index.html"
+if [ -f "$INDEX_HTML" ]; then
+    echo "Precompressing $INDEX_HTML..."
+    gzip -9 -n -k -f "$INDEX_HTML"
+    if command -v brotli >/dev/null 2>&1; then
+        brotli -q 11 -k -f "$INDEX_HTML"
+    fi
+fi
+
 echo "prerestore.sh completed successfully."
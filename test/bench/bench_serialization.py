@@ -0,0 +1,155 @@
+"""
+Microbenchmark for SSE frame and JSON response serialization.
+
+Compares the previous approach (json.dumps into a str, f-string framing, then a
+UTF-8 encode in the web layer) with copilot_shim.serialization (bytes out,
+orjson when installed, constant frames encoded once).
+
+Usage (from the repo root):
+
+    python test/bench/bench_serialization.py --iterations 200000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "infra", "assets"))
+
+from copilot_shim import serialization  # noqa: E402
+
+_SAMPLE_FRAMES: Dict[str, Any] = {
+    "delta": {"type": "delta", "content": "Standard_D4s_v5 in East US costs "},
+    "tool_start": {
+        "type": "tool_start",
+        "event_id": "4b5e0b8c-8f9b-4c64-9d0e-6f1d7a1f2b3c",
+        "timestamp": "2026-01-01T00:00:00+00:00",
+        "tool_name": "web_fetch",
+        "tool_call_id": "call_0123456789abcdef",
+        "parent_tool_call_id": None,
+        "arguments": {"url": "https://prices.azure.com/api/retail/prices?$filter=armRegionName eq 'eastus'", "max_length": 20000},
+    },
+    "tool_end": {
+        "type": "tool_end",
+        "event_id": "9c2e0b8c-8f9b-4c64-9d0e-6f1d7a1f2b3c",
+        "timestamp": "2026-01-01T00:00:01+00:00",
+        "tool_name": "web_fetch",
+        "tool_call_id": "call_0123456789abcdef",
+        "parent_tool_call_id": None,
+        "result": {"content": "{\"Items\": [" + ",".join(["{\"retailPrice\": 0.192, \"unitOfMeasure\": \"1 Hour\"}"] * 50) + "]}"},
+    },
+    "chat_response": {
+        "session_id": "4b5e0b8c-8f9b-4c64-9d0e-6f1d7a1f2b3c",
+        "response": "A Standard_D4s_v5 VM in East US costs about $0.192/hour (~$140/month). " * 8,
+        "response_intermediate": ["Looking up pricing...", "Calculating monthly cost..."],
+        "tool_calls": [{"tool_name": "web_fetch", "tool_call_id": f"call_{i}", "arguments": {"url": "https://prices.azure.com"}} for i in range(5)],
+    },
+}
+
+
+def _sdk_tool_end_frame() -> Dict[str, Any]:
+    """A tool_end frame whose result is the SDK's generated dataclass, as the stream handler sends it."""
+    from copilot.generated.session_events import Content, ContentType, Result
+
+    frame = dict(_SAMPLE_FRAMES["tool_end"])
+    frame["result"] = Result(
+        content=_SAMPLE_FRAMES["tool_end"]["result"]["content"],
+        contents=[Content(type=ContentType.TEXT, text="Standard_D4s_v5: $0.192/hour")],
+        detailed_content="50 price rows",
+    )
+    return frame
+
+
+def check_encoders_match() -> None:
+    """orjson and the stdlib fallback must produce byte-identical output, including for SDK objects."""
+    if serialization.orjson is None:
+        print(json.dumps({"encoders_match": None, "reason": "orjson not installed"}))
+        return
+    for name, item in list(_SAMPLE_FRAMES.items()) + [("tool_end:sdk_result", _sdk_tool_end_frame())]:
+        fast = serialization.dumps_bytes(item)
+        fallback = serialization._stdlib_dumps_bytes(item)
+        assert fast == fallback, f"{name}: orjson and json output differ:\n{fast!r}\n{fallback!r}"
+    print(json.dumps({"encoders_match": True}))
+
+
+def legacy_sse(item: Any) -> bytes:
+    return f"data: {json.dumps(item)}\n\n".encode("utf-8")
+
+
+def legacy_done() -> bytes:
+    return f"data: {json.dumps({'type': 'done'})}\n\n".encode("utf-8")
+
+
+def new_done() -> bytes:
+    return serialization.SSE_DONE_FRAME
+
+
+def legacy_json(item: Any) -> bytes:
+    return json.dumps(item).encode("utf-8")
+
+
+def _time_per_call(fn: Callable[[], bytes], iterations: int) -> float:
+    start = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - start) / iterations * 1e9
+
+
+def _alloc_per_call(fn: Callable[[], bytes], iterations: int) -> float:
+    """Average peak transient allocation (bytes) per call."""
+    samples = min(iterations, 2000)
+    tracemalloc.start()
+    total = 0
+    for _ in range(samples):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn()
+        total += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return total / samples
+
+
+def run(iterations: int) -> List[Dict[str, Any]]:
+    cases = []
+    for name in ("delta", "tool_start", "tool_end"):
+        item = _SAMPLE_FRAMES[name]
+        cases.append((f"sse:{name}", lambda item=item: legacy_sse(item), lambda item=item: serialization.sse_frame(item)))
+    cases.append(("sse:done", legacy_done, new_done))
+    response = _SAMPLE_FRAMES["chat_response"]
+    cases.append(("json:chat_response", lambda: legacy_json(response), lambda: serialization.dumps_bytes(response)))
+
+    results = []
+    for name, legacy, new in cases:
+        assert json.loads(legacy().decode("utf-8").removeprefix("data: ")) == json.loads(new().decode("utf-8").removeprefix("data: "))
+        legacy_ns = _time_per_call(legacy, iterations)
+        new_ns = _time_per_call(new, iterations)
+        results.append(
+            {
+                "case": name,
+                "legacy_ns": round(legacy_ns, 1),
+                "new_ns": round(new_ns, 1),
+                "speedup": round(legacy_ns / new_ns, 2) if new_ns else None,
+                "legacy_alloc_bytes": round(_alloc_per_call(legacy, iterations)),
+                "new_alloc_bytes": round(_alloc_per_call(new, iterations)),
+            }
+        )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    print(json.dumps({"encoder": "orjson" if serialization.orjson is not None else "json"}))
+    check_encoders_match()
+    for result in run(args.iterations):
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Scripted stand-in for the Copilot SDK client used by the offline benchmarks.
+
+FakeCopilotClient mirrors the parts of CopilotClient that copilot_shim uses
+(start/stop, create_session, resume_session) and replays an EventScript for
+every prompt instead of talking to the Copilot CLI or a model.
+"""
+
+import asyncio
+import enum
+import itertools
+import os
+import random
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+
+class FakeEventType(enum.Enum):
+    ASSISTANT_TURN_START = "assistant.turn_start"
+    ASSISTANT_TURN_END = "assistant.turn_end"
+    ASSISTANT_MESSAGE_DELTA = "assistant.message_delta"
+    ASSISTANT_REASONING_DELTA = "assistant.reasoning_delta"
+    ASSISTANT_MESSAGE = "assistant.message"
+    ASSISTANT_USAGE = "assistant.usage"
+    TOOL_EXECUTION_START = "tool.execution_start"
+    TOOL_EXECUTION_END = "tool.execution_end"
+    SESSION_ERROR = "session.error"
+    SESSION_USAGE_INFO = "session.usage_info"
+    USER_MESSAGE = "user.message"
+    SESSION_IDLE = "session.idle"
+
+
+@dataclass
+class FakeEvent:
+    type: Any
+    data: Any
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    timestamp: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+@dataclass
+class ToolStep:
+    name: str = "bash"
+    duration: float = 0.05
+    argument_bytes: int = 64
+    result_bytes: int = 256
+    children: List["ToolStep"] = field(default_factory=list)
+
+
+@dataclass
+class EndpointProfile:
+    """Behaviour of a stand-in BYOK endpoint, keyed by provider base_url in EventScript.endpoints."""
+
+    think_time: float = 0.1
+    error_rate: float = 0.0
+    status_code: int = 429
+
+
+@dataclass
+class EventScript:
+    """
+    Shape of one simulated agent turn.
+
+    Timings are in seconds. The turn is: session setup, think time, tool calls
+    (with optional nested children), then `deltas` message chunks spaced by
+    `delta_interval`, a final assistant.message and session.idle. A
+    `slow_fraction` of turns use `slow_think_time` instead of `think_time` to
+    simulate tail latency. Sessions created with a BYOK provider whose base_url
+    is in `endpoints` use that endpoint's think time and error rate instead.
+    """
+
+    session_setup: float = 0.02
+    think_time: float = 0.1
+    slow_fraction: float = 0.0
+    slow_think_time: float = 1.0
+    deltas: int = 40
+    delta_chars: int = 12
+    delta_interval: float = 0.005
+    reasoning_deltas: int = 0
+    tools: List[ToolStep] = field(default_factory=list)
+    endpoints: Dict[str, EndpointProfile] = field(default_factory=dict)
+    input_tokens: int = 1200
+    output_tokens: int = 300
+    token_limit: int = 128000
+
+
+def _event(event_type: FakeEventType, **data: Any) -> FakeEvent:
+    return FakeEvent(type=event_type, data=SimpleNamespace(**data))
+
+
+class FakeSession:
+    _turn_counter = itertools.count()
+
+    def __init__(
+        self, session_id: str, script: EventScript, model: str, streaming: bool, base_url: Optional[str] = None
+    ):
+        self.session_id = session_id
+        self.script = script
+        self.model = model
+        self.streaming = streaming
+        self.endpoint = script.endpoints.get(base_url or "")
+        self._error: Optional[str] = None
+        # user/assistant message events, kept across resumes by FakeCopilotClient
+        self.history: List[FakeEvent] = []
+        self._last_message: Optional[FakeEvent] = None
+        self._handlers: List[Callable] = []
+        self._task: Optional[asyncio.Task] = None
+        self._idle = asyncio.Event()
+        # Skill names the CLI would load (see FakeCopilotClient._loaded_skills)
+        self.skills: List[str] = []
+
+    def on(self, handler: Callable) -> Callable[[], None]:
+        self._handlers.append(handler)
+
+        def unsubscribe() -> None:
+            if handler in self._handlers:
+                self._handlers.remove(handler)
+
+        return unsubscribe
+
+    def _emit(self, event: FakeEvent) -> None:
+        for handler in list(self._handlers):
+            handler(event)
+
+    async def _run_tool(self, step: ToolStep, parent_id: Optional[str]) -> None:
+        tool_call_id = f"call_{uuid.uuid4().hex[:12]}"
+        self._emit(
+            _event(
+                FakeEventType.TOOL_EXECUTION_START,
+                tool_call_id=tool_call_id,
+                tool_name=step.name,
+                arguments={"input": "x" * step.argument_bytes},
+                parent_tool_call_id=parent_id,
+            )
+        )
+        await asyncio.sleep(step.duration)
+        for child in step.children:
+            await self._run_tool(child, tool_call_id)
+        self._emit(
+            _event(
+                FakeEventType.TOOL_EXECUTION_END,
+                tool_call_id=tool_call_id,
+                tool_name=step.name,
+                parent_tool_call_id=parent_id,
+                success=True,
+                result={"content": "r" * step.result_bytes},
+            )
+        )
+
+    async def _play(self, prompt: str) -> None:
+        script = self.script
+        turn_id = str(next(self._turn_counter))
+        self.history.append(_event(FakeEventType.USER_MESSAGE, content=prompt))
+        self._emit(_event(FakeEventType.ASSISTANT_TURN_START, turn_id=turn_id))
+        if self.endpoint is not None:
+            await asyncio.sleep(self.endpoint.think_time)
+            if random.random() < self.endpoint.error_rate:
+                self._error = f"{self.endpoint.status_code} from stand-in endpoint"
+                self._emit(_event(FakeEventType.SESSION_ERROR, message=self._error, status_code=self.endpoint.status_code))
+                self._emit(_event(FakeEventType.SESSION_IDLE))
+                self._idle.set()
+                return
+        else:
+            slow = script.slow_fraction > 0 and random.random() < script.slow_fraction
+            await asyncio.sleep(script.slow_think_time if slow else script.think_time)
+
+        for _ in range(script.reasoning_deltas):
+            self._emit(_event(FakeEventType.ASSISTANT_REASONING_DELTA, delta_content="r" * script.delta_chars))
+            await asyncio.sleep(script.delta_interval)
+
+        for step in script.tools:
+            await self._run_tool(step, None)
+
+        chunks = []
+        for index in range(script.deltas):
+            chunk = f"{index:04d}" + "a" * max(0, script.delta_chars - 4)
+            chunks.append(chunk)
+            if self.streaming:
+                self._emit(_event(FakeEventType.ASSISTANT_MESSAGE_DELTA, delta_content=chunk))
+            await asyncio.sleep(script.delta_interval)
+
+        message = _event(FakeEventType.ASSISTANT_MESSAGE, content="".join(chunks))
+        self.history.append(message)
+        self._last_message = message
+        self._emit(message)
+        self._emit(
+            _event(
+                FakeEventType.ASSISTANT_USAGE,
+                model=self.model,
+                input_tokens=script.input_tokens,
+                output_tokens=script.output_tokens,
+            )
+        )
+        self._emit(_event(FakeEventType.ASSISTANT_TURN_END, turn_id=turn_id))
+        history_chars = sum(len(event.data.content) for event in self.history)
+        self._emit(
+            _event(
+                FakeEventType.SESSION_USAGE_INFO,
+                current_tokens=history_chars // 4,
+                token_limit=script.token_limit,
+                messages_length=len(self.history),
+            )
+        )
+        self._emit(_event(FakeEventType.SESSION_IDLE))
+        self._idle.set()
+
+    async def send(self, options: Dict[str, Any]) -> str:
+        self._idle.clear()
+        self._error = None
+        self._task = asyncio.create_task(self._play(options.get("prompt", "")))
+        return str(uuid.uuid4())
+
+    async def send_and_wait(self, options: Dict[str, Any], timeout: Optional[float] = None):
+        await self.send(options)
+        await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+        if self._error:
+            raise Exception(f"Session error: {self._error}")
+        return self._last_message
+
+    async def get_messages(self) -> List[FakeEvent]:
+        return list(self.history)
+
+    async def abort(self) -> None:
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    async def destroy(self) -> None:
+        await self.abort()
+        self._handlers.clear()
+
+
+class FakeCopilotClient:
+    """Drop-in replacement for copilot.CopilotClient driven by an EventScript."""
+
+    script: EventScript = EventScript()
+
+    def __init__(self, options: Optional[Dict[str, Any]] = None):
+        self.options = options or {}
+        self.sessions: Dict[str, FakeSession] = {}
+        self.session_dirs: Dict[str, str] = {}
+        self.started = False
+
+    async def start(self) -> None:
+        self.started = True
+
+    async def stop(self) -> List[Exception]:
+        self.started = False
+        self.sessions.clear()
+        return []
+
+    async def create_session(self, config: Optional[Dict[str, Any]] = None) -> FakeSession:
+        config = config or {}
+        await asyncio.sleep(self.script.session_setup)
+        session_id = config.get("session_id") or str(uuid.uuid4())
+        session = FakeSession(
+            session_id,
+            self.script,
+            config.get("model", "fake"),
+            bool(config.get("streaming")),
+            (config.get("provider") or {}).get("base_url"),
+        )
+        session.skills = self._loaded_skills(config)
+        self.sessions[session_id] = session
+        path = self._make_session_dir(config, session_id)
+        if path:
+            self.session_dirs[session_id] = path
+        return session
+
+    async def resume_session(self, session_id: str, config: Optional[Dict[str, Any]] = None) -> FakeSession:
+        config = config or {}
+        await asyncio.sleep(self.script.session_setup)
+        session = FakeSession(
+            session_id,
+            self.script,
+            config.get("model", "fake"),
+            bool(config.get("streaming")),
+            (config.get("provider") or {}).get("base_url"),
+        )
+        previous = self.sessions.get(session_id)
+        if previous is not None:
+            session.history = previous.history
+        self.sessions[session_id] = session
+        return session
+
+    async def delete_session(self, session_id: str) -> None:
+        self.sessions.pop(session_id, None)
+        path = self.session_dirs.pop(session_id, None)
+        if path and os.path.isdir(path):
+            os.rmdir(path)
+
+    @staticmethod
+    def _loaded_skills(config: Dict[str, Any]) -> List[str]:
+        """Skills under skill_directories (named by their folder) minus disabled_skills, as the CLI applies them."""
+        disabled = set(config.get("disabled_skills") or [])
+        names = set()
+        for skills_root in config.get("skill_directories") or []:
+            for root, _, files in os.walk(skills_root, followlinks=True):
+                if "SKILL.md" in files:
+                    names.add(os.path.basename(root))
+        return sorted(names - disabled)
+
+    @staticmethod
+    def _make_session_dir(config: Dict[str, Any], session_id: str) -> Optional[str]:
+        """Mirror the CLI's {config_dir}/session-state/{id}/ directory so session_exists() sees resumable sessions."""
+        config_dir = config.get("config_dir")
+        if not config_dir:
+            return None
+        path = os.path.join(config_dir, "session-state", session_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+
+def install_fake_client(script: EventScript) -> None:
+    """Point copilot_shim at FakeCopilotClient (copilot_shim must be importable)."""
+    from copilot_shim import client_manager
+
+    FakeCopilotClient.script = script
+    client_manager.CopilotClient = FakeCopilotClient  # type: ignore
+    client_manager.CopilotClientManager._client = None
+    client_manager.CopilotClientManager._started = False
@@ -0,0 +1,297 @@
+"""
+Offline load test for the function app routes.
+
+Drives /agent/chat, /agent/chatstream and the MCP tool handler in-process with
+FakeCopilotClient, so no Copilot CLI, GitHub token or model is needed. Only the
+shim (function_app.py + copilot_shim) is measured.
+
+Usage (from the repo root, with infra/assets requirements installed):
+
+    python test/bench/load_test.py --concurrency 1,8,32 --requests 200
+    python test/bench/load_test.py --routes chatstream --deltas 200 --tools 3
+    python test/bench/load_test.py --routes chat --endpoints eastus=0.1:0,westus=0.3:0.2
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import math
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ASSETS_DIR = os.path.join(REPO_ROOT, "infra", "assets")
+AGENT_DIR = os.path.join(REPO_ROOT, "src")
+
+sys.path.insert(0, ASSETS_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_copilot import EndpointProfile, EventScript, ToolStep, install_fake_client  # noqa: E402
+
+
+class _Headers(dict):
+    """Case-insensitive header mapping with the .get() used by the routes."""
+
+    def __init__(self, values: Optional[Dict[str, str]] = None):
+        super().__init__({k.lower(): v for k, v in (values or {}).items()})
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return super().get(key.lower(), default)
+
+
+class BenchRequest:
+    """Minimal request object exposing what the HTTP routes read."""
+
+    def __init__(self, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None, query: Optional[Dict[str, str]] = None):
+        self._body = body
+        self.headers = _Headers(headers)
+        self.query_params = dict(query or {})
+        self.path_params: Dict[str, str] = {}
+
+    async def json(self) -> Dict[str, Any]:
+        return self._body
+
+
+@dataclass
+class Sample:
+    latency: float
+    first_byte: Optional[float]
+    ok: bool
+
+
+@dataclass
+class RunReport:
+    route: str
+    concurrency: int
+    requests: int
+    wall_seconds: float
+    samples: List[Sample] = field(default_factory=list)
+    rss_mb: float = 0.0
+
+    @staticmethod
+    def _percentile(values: List[float], pct: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, max(0, math.ceil(pct / 100.0 * len(ordered)) - 1))
+        return ordered[index]
+
+    def summary(self) -> Dict[str, Any]:
+        latencies = [s.latency for s in self.samples]
+        first_bytes = [s.first_byte for s in self.samples if s.first_byte is not None]
+        return {
+            "route": self.route,
+            "concurrency": self.concurrency,
+            "requests": self.requests,
+            "errors": sum(1 for s in self.samples if not s.ok),
+            "rps": round(self.requests / self.wall_seconds, 2) if self.wall_seconds else 0.0,
+            "p50_ms": round(self._percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(self._percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(self._percentile(latencies, 99) * 1000, 2),
+            "ttfb_p50_ms": round(self._percentile(first_bytes, 50) * 1000, 2) if first_bytes else None,
+            "ttfb_p99_ms": round(self._percentile(first_bytes, 99) * 1000, 2) if first_bytes else None,
+            "rss_mb": round(self.rss_mb, 1),
+        }
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this worker process in MB."""
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    import resource
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0
+
+
+def load_handlers(script: EventScript) -> Dict[str, Callable[..., Awaitable[Any]]]:
+    """Import function_app with the agent project as cwd and index its user functions."""
+    # AGENTS.md, skills and mcp.json are resolved from cwd at import time
+    os.chdir(AGENT_DIR if os.path.isdir(AGENT_DIR) else ASSETS_DIR)
+    install_fake_client(script)
+    import function_app
+
+    return {fn.get_function_name(): fn.get_user_function() for fn in function_app.app.get_functions()}
+
+
+async def _drive_chat(handler, prompt: str, query: Optional[Dict[str, str]] = None) -> Sample:
+    start = time.perf_counter()
+    response = await handler(BenchRequest({"prompt": prompt}, query=query))
+    latency = time.perf_counter() - start
+    return Sample(latency=latency, first_byte=latency, ok=response.status_code == 200)
+
+
+async def _drive_chatstream(handler, prompt: str) -> Sample:
+    start = time.perf_counter()
+    response = await handler(BenchRequest({"prompt": prompt}))
+    first_byte: Optional[float] = None
+    ok = False
+    async for chunk in response.body_iterator:
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        text = chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk
+        if '"type": "done"' in text or '"type":"done"' in text:
+            ok = True
+    return Sample(latency=time.perf_counter() - start, first_byte=first_byte, ok=ok)
+
+
+async def _drive_fanout(handler, prompt: str) -> Sample:
+    start = time.perf_counter()
+    body = {"template": f"{prompt} ({{input}})", "inputs": ["a", "b", "c", "d"], "reduce": "Combine the results."}
+    response = await handler(BenchRequest(body))
+    first_byte: Optional[float] = None
+    ok = False
+    async for chunk in response.body_iterator:
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        text = chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk
+        if '"type":"reduce"' in text.replace(" ", "") and '"status":"ok"' in text.replace(" ", ""):
+            ok = True
+    return Sample(latency=time.perf_counter() - start, first_byte=first_byte, ok=ok)
+
+
+async def _drive_mcp(handler, prompt: str) -> Sample:
+    start = time.perf_counter()
+    raw = await handler(json.dumps({"arguments": {"prompt": prompt}}))
+    latency = time.perf_counter() - start
+    payload = json.loads(raw)
+    return Sample(latency=latency, first_byte=latency, ok="error" not in payload)
+
+
+_DRIVERS = {
+    "chat": ("chat", _drive_chat),
+    "chatstream": ("chat_stream", _drive_chatstream),
+    "mcp": ("mcp_agent_chat", _drive_mcp),
+    "fanout": ("fanout", _drive_fanout),
+}
+
+
+async def run_level(route: str, handler, driver, concurrency: int, total: int, prompt: str) -> RunReport:
+    semaphore = asyncio.Semaphore(concurrency)
+    samples: List[Sample] = []
+
+    async def one() -> None:
+        async with semaphore:
+            try:
+                samples.append(await driver(handler, prompt))
+            except Exception:
+                samples.append(Sample(latency=0.0, first_byte=None, ok=False))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    wall = time.perf_counter() - start
+    return RunReport(route=route, concurrency=concurrency, requests=total, wall_seconds=wall, samples=samples, rss_mb=current_rss_mb())
+
+
+def parse_endpoints(spec: Optional[str]) -> Dict[str, EndpointProfile]:
+    """Parse "name=think_time:error_rate,..." into stand-in BYOK endpoints keyed by base_url."""
+    endpoints: Dict[str, EndpointProfile] = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        name, _, profile = item.strip().partition("=")
+        think_time, _, error_rate = profile.partition(":")
+        endpoints[f"http://127.0.0.1:9/{name}"] = EndpointProfile(
+            think_time=float(think_time or 0.1), error_rate=float(error_rate or 0.0)
+        )
+    return endpoints
+
+
+def use_stand_in_endpoints(endpoints: Dict[str, EndpointProfile]) -> None:
+    """Configure the BYOK provider pool with the stand-in endpoints (before copilot_shim is imported)."""
+    os.environ["AZURE_AI_FOUNDRY_ENDPOINTS"] = json.dumps(
+        [{"name": url.rsplit("/", 1)[-1], "endpoint": url, "api_key": "bench", "model": "bench-model"} for url in endpoints]
+    )
+
+
+def build_script(args: argparse.Namespace) -> EventScript:
+    tools = [
+        ToolStep(name=f"tool_{i}", duration=args.tool_time, result_bytes=args.tool_result_bytes) for i in range(args.tools)
+    ]
+    if tools and args.nested_tools:
+        tools[0].children = [ToolStep(name=f"nested_{i}", duration=args.tool_time) for i in range(args.nested_tools)]
+    return EventScript(
+        session_setup=args.session_setup,
+        think_time=args.think_time,
+        slow_fraction=args.slow_fraction,
+        slow_think_time=args.slow_think_time,
+        deltas=args.deltas,
+        delta_interval=args.delta_interval,
+        tools=tools,
+        endpoints=parse_endpoints(args.endpoints),
+    )
+
+
+async def main_async(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    script = build_script(args)
+    if script.endpoints:
+        use_stand_in_endpoints(script.endpoints)
+    handlers = load_handlers(script)
+    results: List[Dict[str, Any]] = []
+    for route in args.routes.split(","):
+        function_name, driver = _DRIVERS[route]
+        if route == "chat" and args.hedge:
+            driver = functools.partial(_drive_chat, query={"hedge": "true"})
+        handler = handlers[function_name]
+        # Warm up the client singleton and module caches outside the measurement
+        await driver(handler, args.prompt)
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            report = await run_level(route, handler, driver, concurrency, args.requests, args.prompt)
+            summary = report.summary()
+            results.append(summary)
+            print(json.dumps(summary))
+    if script.endpoints:
+        from copilot_shim import render_metrics
+
+        for line in render_metrics().splitlines():
+            if line.startswith("copilot_shim_provider_"):
+                print(line)
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--routes", default="chat,chatstream,mcp", help="Comma-separated: chat, chatstream, mcp, fanout")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per concurrency level")
+    parser.add_argument("--prompt", default="What is the price of a Standard_D4s_v5 VM in East US?")
+    parser.add_argument("--session-setup", type=float, default=0.02, help="Simulated session create/resume seconds")
+    parser.add_argument("--think-time", type=float, default=0.1, help="Simulated model latency before output")
+    parser.add_argument("--slow-fraction", type=float, default=0.0, help="Fraction of turns that use --slow-think-time")
+    parser.add_argument("--slow-think-time", type=float, default=1.0, help="Model latency of slow (tail) turns")
+    parser.add_argument("--hedge", action="store_true", help="Send hedge=true on /agent/chat")
+    parser.add_argument("--deltas", type=int, default=40, help="Message delta events per turn")
+    parser.add_argument("--delta-interval", type=float, default=0.005, help="Seconds between deltas")
+    parser.add_argument("--tools", type=int, default=1, help="Top-level tool calls per turn")
+    parser.add_argument("--nested-tools", type=int, default=0, help="Nested tool calls under the first tool")
+    parser.add_argument("--tool-time", type=float, default=0.05, help="Seconds per tool call")
+    parser.add_argument("--tool-result-bytes", type=int, default=256, help="Size of each top-level tool result")
+    parser.add_argument(
+        "--endpoints",
+        help="Stand-in BYOK endpoints as name=think_time:error_rate,... (enables the provider pool)",
+    )
+    parser.add_argument("--output", help="Optional path to write the JSON results")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    output = os.path.abspath(args.output) if args.output else None
+    results = asyncio.run(main_async(args))
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
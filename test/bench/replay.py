@@ -0,0 +1,201 @@
+"""
+Replay recorded session event traces through the runner.
+
+Traces are recorded in production by setting COPILOT_EVENT_RECORD_PATH (see
+copilot_shim/recording.py). Each JSON line holds the shape of one real turn.
+This script feeds those traces back through run_copilot_agent and
+run_copilot_agent_stream, at the original speed or faster, using a fake client.
+That gives benchmarks the same bursty deltas, long reasoning and nested tools
+as real traffic.
+
+Usage (from the repo root):
+
+    python test/bench/replay.py traces.jsonl --mode chat,stream --speed 1 --concurrency 8
+    python test/bench/replay.py traces.jsonl --speed 20 --requests 500
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_copilot import EventScript, FakeCopilotClient, FakeEvent, FakeEventType, FakeSession, install_fake_client  # noqa: E402
+from load_test import AGENT_DIR, ASSETS_DIR, RunReport, Sample, current_rss_mb  # noqa: E402
+
+_KNOWN_TYPES = {member.value: member for member in FakeEventType}
+
+
+def load_traces(path: str) -> List[Dict[str, Any]]:
+    traces: List[Dict[str, Any]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("events"):
+                traces.append(record)
+    return traces
+
+
+def _event_type(name: str) -> Any:
+    return _KNOWN_TYPES.get(name) or SimpleNamespace(value=name)
+
+
+def _event_data(event_type: str, size: int, tool_call_id: Optional[str], parent_id: Optional[str], tool_name: Optional[str]):
+    filler = "x" * size
+    data = SimpleNamespace(tool_call_id=tool_call_id, parent_tool_call_id=parent_id, tool_name=tool_name)
+    if event_type in ("assistant.message_delta", "assistant.reasoning_delta"):
+        data.delta_content = filler
+    elif event_type == "assistant.message":
+        data.content = filler
+    elif event_type == "tool.execution_start":
+        data.arguments = {"input": filler}
+    elif event_type == "tool.execution_end":
+        data.result = {"content": filler}
+        data.success = True
+    return data
+
+
+class ReplaySession(FakeSession):
+    def __init__(self, session_id: str, trace: Dict[str, Any], speed: float, model: str, streaming: bool):
+        super().__init__(session_id, EventScript(), model, streaming)
+        self.trace = trace
+        self.speed = speed
+
+    async def _play(self, prompt: str) -> None:
+        start = time.perf_counter()
+        saw_idle = False
+        for offset, event_type, size, tool_call_id, parent_id, tool_name in self.trace["events"]:
+            delay = start + offset / self.speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if event_type == "assistant.message_delta" and not self.streaming:
+                continue
+            self._emit(
+                FakeEvent(
+                    type=_event_type(event_type),
+                    data=_event_data(event_type, size, tool_call_id, parent_id, tool_name),
+                )
+            )
+            saw_idle = saw_idle or event_type == "session.idle"
+        if not saw_idle:
+            # Traces that ended in a timeout or error still need to release the runner
+            self._emit(FakeEvent(type=FakeEventType.SESSION_IDLE, data=SimpleNamespace()))
+        self._idle.set()
+
+
+class ReplayCopilotClient(FakeCopilotClient):
+    traces: Iterator[Dict[str, Any]] = iter(())
+    speed: float = 1.0
+
+    async def _next_session(self, session_id: str, config: Dict[str, Any]) -> ReplaySession:
+        trace = next(self.traces)
+        await asyncio.sleep((trace.get("session_setup") or 0.0) / self.speed)
+        session = ReplaySession(session_id, trace, self.speed, config.get("model", "replay"), bool(config.get("streaming")))
+        self.sessions[session_id] = session
+        return session
+
+    async def create_session(self, config: Optional[Dict[str, Any]] = None) -> ReplaySession:
+        config = config or {}
+        return await self._next_session(config.get("session_id") or os.urandom(8).hex(), config)
+
+    async def resume_session(self, session_id: str, config: Optional[Dict[str, Any]] = None) -> ReplaySession:
+        return await self._next_session(session_id, config or {})
+
+
+async def _drive_chat(prompt: str) -> Sample:
+    from copilot_shim import run_copilot_agent
+
+    start = time.perf_counter()
+    await run_copilot_agent(prompt, route="replay")
+    latency = time.perf_counter() - start
+    return Sample(latency=latency, first_byte=latency, ok=True)
+
+
+async def _drive_stream(prompt: str) -> Sample:
+    from copilot_shim import run_copilot_agent_stream
+
+    start = time.perf_counter()
+    first_byte: Optional[float] = None
+    ok = False
+    async for frame in run_copilot_agent_stream(prompt, route="replay"):
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        text = frame.decode("utf-8") if isinstance(frame, bytes) else frame
+        ok = ok or '"done"' in text
+    return Sample(latency=time.perf_counter() - start, first_byte=first_byte, ok=ok)
+
+
+_DRIVERS = {"chat": _drive_chat, "stream": _drive_stream}
+
+
+async def main_async(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    traces = load_traces(args.traces)
+    if not traces:
+        raise SystemExit(f"No traces with events found in {args.traces}")
+
+    os.chdir(AGENT_DIR if os.path.isdir(AGENT_DIR) else ASSETS_DIR)
+    ReplayCopilotClient.traces = itertools.cycle(traces)
+    ReplayCopilotClient.speed = args.speed
+    install_fake_client(EventScript())
+    from copilot_shim import client_manager
+
+    client_manager.CopilotClient = ReplayCopilotClient  # type: ignore
+
+    results: List[Dict[str, Any]] = []
+    for mode in args.mode.split(","):
+        driver = _DRIVERS[mode]
+        semaphore = asyncio.Semaphore(args.concurrency)
+        samples: List[Sample] = []
+
+        async def one() -> None:
+            async with semaphore:
+                try:
+                    samples.append(await driver(args.prompt))
+                except Exception:
+                    samples.append(Sample(latency=0.0, first_byte=None, ok=False))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(args.requests)))
+        report = RunReport(
+            route=f"replay:{mode}",
+            concurrency=args.concurrency,
+            requests=args.requests,
+            wall_seconds=time.perf_counter() - start,
+            samples=samples,
+            rss_mb=current_rss_mb(),
+        )
+        summary = report.summary()
+        summary.update({"traces": len(traces), "speed": args.speed})
+        results.append(summary)
+        print(json.dumps(summary))
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("traces", help="JSONL file written by COPILOT_EVENT_RECORD_PATH")
+    parser.add_argument("--mode", default="chat,stream", help="Comma-separated: chat, stream")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier (1 = original timing)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--prompt", default="replayed prompt")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    args.traces = os.path.abspath(args.traces)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
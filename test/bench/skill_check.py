@@ -0,0 +1,92 @@
+"""
+Check that skill selection reaches the session config.
+
+Builds a throwaway skill library and runs sessionless turns through
+run_copilot_agent with FakeCopilotClient and the default session pool. Every
+turn whose prompt matches a skill must get a session with only that skill
+loaded, even once the pool has been filled; a prompt that matches no skill
+must get every skill. Exits non-zero on failure.
+
+Usage (from the repo root):
+
+    python test/bench/skill_check.py
+"""
+
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_copilot import EventScript, install_fake_client  # noqa: E402
+from load_test import ASSETS_DIR  # noqa: E402
+
+_SKILLS = {
+    "vm-pricing": "Look up Azure virtual machine prices by SKU and region.",
+    "kubernetes-debugging": "Diagnose failing pods, crash loops and image pull errors in a cluster.",
+    "sql-tuning": "Read query plans and suggest indexes for slow SQL queries.",
+    "release-notes": "Draft release notes from merged pull requests.",
+}
+_PROMPT = "What is the price of a Standard_D4s_v5 virtual machine in East US?"
+_UNMATCHED_PROMPT = "Tell me a joke."
+_TURNS = 3
+
+
+def write_skills(root: str) -> None:
+    for name, description in _SKILLS.items():
+        skill_dir = os.path.join(root, ".github", "skills", name)
+        os.makedirs(skill_dir)
+        with open(os.path.join(skill_dir, "SKILL.md"), "w", encoding="utf-8") as f:
+            f.write(f"---\nname: {name}\ndescription: {description}\n---\n\n{description}\n")
+
+
+async def check() -> int:
+    from copilot_shim import client_manager, run_copilot_agent
+
+    failures = 0
+    for turn in range(_TURNS):
+        result = await run_copilot_agent(_PROMPT)
+        client = await client_manager.CopilotClientManager.get_client()
+        skills = client.sessions[result.session_id].skills
+        print(f"Turn {turn + 1}: session {result.session_id} loaded skills: {skills}")
+        if skills != ["vm-pricing"]:
+            print(f"FAIL: expected only vm-pricing, got {skills}")
+            failures += 1
+        # Let the pool refill so the next turn could claim a pre-created session
+        await asyncio.sleep(0.2)
+
+    result = await run_copilot_agent(_UNMATCHED_PROMPT)
+    client = await client_manager.CopilotClientManager.get_client()
+    skills = client.sessions[result.session_id].skills
+    print(f"Unmatched prompt: session {result.session_id} loaded skills: {skills}")
+    if skills != sorted(_SKILLS):
+        print(f"FAIL: expected every skill, got {skills}")
+        failures += 1
+
+    if failures:
+        return 1
+    print("OK: selected skills are honoured and unmatched prompts load every skill")
+    return 0
+
+
+def main() -> None:
+    root = tempfile.mkdtemp(prefix="skill-check-")
+    cwd = os.getcwd()
+    try:
+        write_skills(root)
+        # Skills are indexed from cwd when copilot_shim is imported
+        os.chdir(root)
+        os.environ["COPILOT_SKILLS_TOP_K"] = "1"
+        sys.path.insert(0, ASSETS_DIR)
+        install_fake_client(EventScript(think_time=0.01, deltas=2))
+        status = asyncio.run(check())
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root, ignore_errors=True)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()